@@ -0,0 +1,194 @@
+"""Подготовка вложений к загрузке: проверка размера, потоковая отправка, сжатие/разбиение больших файлов."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import lzma
+import mimetypes
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from typing import NamedTuple
+from urllib.parse import quote
+
+from telegram import InputFile
+
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API на загрузку документа
+DEFAULT_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+STRATEGIES = ("zip", "xz", "split", "link")
+
+COPY_CHUNK = 1024 * 1024
+
+# Фиксированная дата в zip: одинаковый файл даёт одинаковый архив (и попадание в кэш file_id)
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class UploadItem(NamedTuple):
+    path: str
+    filename: str
+    size: int
+    # Временный файл (архив или часть), удаляется после отправки
+    temporary: bool = False
+
+
+class StreamingInputFile(InputFile):
+    """InputFile, который не читает файл в память: httpx отправляет его кусками по 64 КБ."""
+
+    def __init__(self, path: str, filename: str | None = None, attach: bool = False):
+        # InputFile.__init__ не вызываем — он прочитал бы файл целиком
+        self.filename = filename or os.path.basename(path)
+        self.input_file_content = open(path, "rb")
+        self.attach_name = ("attached" + os.urandom(16).hex()) if attach else None
+        self.mimetype = mimetypes.guess_type(self.filename, strict=False)[0] or "application/octet-stream"
+
+    def close(self):
+        self.input_file_content.close()
+
+
+def human_size(size: int) -> str:
+    return f"{size / (1024 * 1024):.1f} МБ"
+
+
+# Функции ниже выполняются в отдельном процессе (ProcessPoolExecutor)
+
+def compress_zip(src: str, dst: str) -> int:
+    info = zipfile.ZipInfo(os.path.basename(src), date_time=_ZIP_DATE_TIME)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(dst, "w") as archive, open(src, "rb") as source:
+        with archive.open(info, "w", force_zip64=True) as target:
+            shutil.copyfileobj(source, target, COPY_CHUNK)
+    return os.path.getsize(dst)
+
+
+def compress_xz(src: str, dst: str) -> int:
+    with open(src, "rb") as source, lzma.open(dst, "wb", preset=6) as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK)
+    return os.path.getsize(dst)
+
+
+def split_file(src: str, dst_prefix: str, part_size: int) -> list[str]:
+    parts = []
+    with open(src, "rb") as source:
+        index = 1
+        while True:
+            part_path = f"{dst_prefix}.{index:03d}"
+            written = 0
+            with open(part_path, "wb") as target:
+                while written < part_size:
+                    chunk = source.read(min(COPY_CHUNK, part_size - written))
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    written += len(chunk)
+            if not written:
+                os.remove(part_path)
+                break
+            parts.append(part_path)
+            index += 1
+    return parts
+
+
+class AttachmentPipeline:
+    """Решает, как отправить файл: как есть, архивом, частями или только ссылкой.
+
+    Файлы не больше ``upload_limit`` уходят как есть (потоково, без чтения в
+    память). Для больших по очереди пробуются стратегии из ``strategies``:
+    ``zip``/``xz`` — сжатие, ``split`` — части по ``upload_limit``, ``link`` —
+    только уведомление со ссылкой. Сжатие и разбиение выполняются в пуле
+    процессов, чтобы не блокировать event loop.
+    """
+
+    def __init__(self, upload_limit: int = DEFAULT_UPLOAD_LIMIT, strategies=("zip", "split"),
+                 media_url: str | None = None, media_root: str | None = None, max_workers: int = 1):
+        unknown = [s for s in strategies if s not in STRATEGIES]
+        if unknown:
+            raise ValueError(f"Неизвестные стратегии для больших файлов: {unknown} (допустимо: {', '.join(STRATEGIES)})")
+        self.upload_limit = upload_limit
+        self.strategies = tuple(strategies)
+        self.media_url = media_url.rstrip("/") if media_url else None
+        self.media_root = media_root
+        self.max_workers = max_workers
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _run(self, func, *args):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def prepare(self, paths) -> tuple[list[UploadItem], list[str]]:
+        """Вернуть (что загружать, текстовые уведомления о файлах, которые не будут загружены)."""
+        items: list[UploadItem] = []
+        notices: list[str] = []
+        for path in paths:
+            size = (await asyncio.to_thread(os.stat, path)).st_size
+            if size <= self.upload_limit:
+                items.append(UploadItem(path, os.path.basename(path), size))
+                continue
+            logger.info(f"Файл {path} ({human_size(size)}) больше лимита {human_size(self.upload_limit)}")
+            prepared = await self._prepare_large(path, size)
+            if prepared:
+                items.extend(prepared)
+            else:
+                notices.append(self.link_notice(path, size))
+        return items, notices
+
+    async def _prepare_large(self, path: str, size: int) -> list[UploadItem] | None:
+        name = os.path.basename(path)
+        work_dir = tempfile.mkdtemp(prefix="modelix-upload-")
+        source, source_name = path, name
+        try:
+            for strategy in self.strategies:
+                if strategy in ("zip", "xz"):
+                    suffix = ".zip" if strategy == "zip" else ".xz"
+                    target = os.path.join(work_dir, name + suffix)
+                    func = compress_zip if strategy == "zip" else compress_xz
+                    compressed = await self._run(func, path, target)
+                    logger.info(f"{name}: {strategy} {human_size(size)} -> {human_size(compressed)}")
+                    if compressed <= self.upload_limit:
+                        return [UploadItem(target, name + suffix, compressed, temporary=True)]
+                    # Архив всё ещё велик — его и будем делить, если дальше есть split
+                    source, source_name = target, name + suffix
+                elif strategy == "split":
+                    parts = await self._run(split_file, source, os.path.join(work_dir, source_name), self.upload_limit)
+                    logger.info(f"{source_name}: разбит на {len(parts)} частей")
+                    return [
+                        UploadItem(part, os.path.basename(part), os.path.getsize(part), temporary=True)
+                        for part in parts
+                    ]
+                elif strategy == "link":
+                    break
+        except Exception as e:
+            logger.error(f"Ошибка подготовки большого файла {path}: {e}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return None
+
+    def link_notice(self, path: str, size: int) -> str:
+        """Строка для текста заявки о файле, который не загружается в Telegram."""
+        name = escape(os.path.basename(path))
+        if self.media_url and self.media_root:
+            relative = os.path.relpath(path, self.media_root).replace(os.sep, "/")
+            if not relative.startswith(".."):
+                url = escape(f"{self.media_url}/{quote(relative)}")
+                return f'📎 <a href="{url}">{name}</a> ({human_size(size)}, слишком большой для Telegram)'
+        return f"📎 {name} ({human_size(size)}, слишком большой для Telegram): <code>{escape(path)}</code>"
+
+    @staticmethod
+    def cleanup(items):
+        """Удалить временные файлы (архивы, части) после отправки."""
+        directories = set()
+        for item in items:
+            if item.temporary:
+                directories.add(os.path.dirname(item.path))
+        for directory in directories:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1 @@
+"""Бенчмарки бота: сквозной прогон с заглушкой Bot API (e2e) и микробенчмарки (micro)."""
@@ -0,0 +1,254 @@
+"""Сквозной бенчмарк: синтетическая БД Django → бот → заглушка Bot API.
+
+Пример (из корня репозитория)::
+
+    python -m benchmarks.e2e --calls 200 --orders 200 --file-size-kb 256,4096 \\
+        --latency 0.05 --error-rate 0.01 --bandwidth-mbit 50 --json e2e.json
+
+Режимы:
+
+- накопившиеся заявки (``--rate 0``, по умолчанию): все заявки записаны до
+  запуска бота, измеряется скорость разбора очереди;
+- поток (``--rate N``): N заявок в секунду пишутся во время работы бота,
+  измеряется задержка от created_at до подтверждения Telegram.
+
+Лимиты отправки по умолчанию не ограничивают прогон (``--chat-rate``,
+``--global-rate``): с настоящими 20 сообщениями в минуту на канал прогон
+измерял бы ограничитель частоты, а не конвейер.
+
+Результат: число заявок, время и скорость разбора (заявок/с), перцентили
+сквозной задержки, счётчики заглушки (запросы, 429, байты) и пиковый RSS.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import httpx
+
+from benchmarks import fake_bot_api
+from benchmarks.synthetic_db import SyntheticSite
+from trace_journal import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Переменные окружения, которые направили бы бота в настоящий Telegram или через прокси
+_ENV_OVERRIDES = ("TELEGRAM_PROXY_URL", "TELEGRAM_PROXY", "TELEGRAM_PROXY_URLS", "TELEGRAM_BOT_SOCKET", "METRICS_PORT")
+
+# Лимиты отправки, которые в прогоне не достигаются: бенчмарк меряет конвейер, а не ограничитель частоты
+UNTHROTTLED_CHAT_RATE = 600000.0
+UNTHROTTLED_GLOBAL_RATE = 10000.0
+
+
+def peak_rss_mb() -> float | None:
+    """Пиковый RSS процесса в МБ (нет модуля resource на Windows — None)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — КБ, macOS — байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def start_fake_api(args) -> tuple[subprocess.Popen, str]:
+    """Заглушка в отдельном процессе, чтобы она не делила с ботом event loop и память."""
+    command = [
+        sys.executable, "-m", "benchmarks.fake_bot_api", "--port", "0",
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate), "--retry-after", str(args.retry_after),
+        "--bandwidth-mbit", str(args.bandwidth_mbit),
+    ]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("READY "):
+        process.kill()
+        raise RuntimeError("Заглушка Bot API не запустилась")
+    return process, f"http://127.0.0.1:{int(line.split()[1])}"
+
+
+def install_config(site: SyntheticSite, state_path: str, api_url: str, overrides: dict):
+    """Модуль config для бота: значения из config.example.py, БД и Bot API — бенчмарка."""
+    for name in _ENV_OVERRIDES:
+        os.environ.pop(name, None)
+    os.environ["TELEGRAM_API_URL"] = api_url
+    os.environ["TELEGRAM_KEEPALIVE_PING"] = "0"
+    settings = runpy.run_path(os.path.join(REPO_ROOT, "config.example.py"))
+    config = types.ModuleType("config")
+    config.__dict__.update({name: value for name, value in settings.items() if name.isupper()})
+    config.BOT_TOKEN = "123456:BENCHMARK"
+    config.CHANNEL_ID = "-1001000000000"
+    config.DJANGO_DB_PATH = site.db_path
+    config.STATE_DB_PATH = state_path
+    config.TELEGRAM_API_URL = api_url
+    # Команды /find и /lead измеряются не здесь: get_updates только занимал бы соединение
+    config.BOT_COMMANDS = False
+    config.__dict__.update(overrides)
+    sys.modules["config"] = config
+
+
+def delivered(state) -> list[tuple[float, float | None]]:
+    """(время доставки, created_at заявки) доставленных записей outbox."""
+    rows = state.query("SELECT payload, delivered_at FROM outbox WHERE status = 'delivered'")
+    return [(delivered_at, json.loads(payload).get("created_at")) for payload, delivered_at in rows]
+
+
+def feed(site: SyntheticSite, calls: int, orders: int, rate: float, stop: threading.Event):
+    """Писать заявки в БД с заданной частотой (в потоке, как отдельный процесс Django)."""
+    schedule = [
+        (add, number)
+        for number in range(max(calls, orders))
+        for add, total in ((site.add_print_order, orders), (site.add_call_request, calls))
+        if number < total
+    ]
+    started = time.monotonic()
+    for index, (add, number) in enumerate(schedule):
+        delay = started + index / rate - time.monotonic()
+        if delay > 0 and stop.wait(delay):
+            return
+        add(number)
+
+
+async def run_benchmark(args) -> dict:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="modelix-bench-")
+    sizes = [int(size) * 1024 for size in args.file_size_kb.split(",")]
+    site = SyntheticSite(os.path.join(workdir, "site"), file_sizes=sizes, files_per_order=args.files_per_order)
+    api, api_url = start_fake_api(args)
+    feeder = None
+    stop = threading.Event()
+    try:
+        state_path = os.path.join(workdir, "bot_state.sqlite3")
+        overrides = {}
+        overrides["TELEGRAM_CHAT_RATE_PER_MINUTE"] = args.chat_rate
+        overrides["TELEGRAM_GLOBAL_RATE"] = args.global_rate
+        if args.concurrency is not None:
+            overrides["SEND_CONCURRENCY"] = args.concurrency
+        install_config(site, state_path, api_url, overrides)
+        from bot import ModelixNotificationBot
+        from state_store import StateStore
+
+        # Курсоры с нуля: иначе бот при первом запуске пропустил бы уже записанные заявки
+        store = StateStore(state_path)
+        store.set_cursors({"last_call_request_id": 0, "last_print_order_id": 0})
+        store.close()
+        if args.rate <= 0:
+            site.add_leads(args.calls, args.orders)
+
+        logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+        bot = ModelixNotificationBot()
+        expected = args.calls + args.orders
+        started = time.time()
+        task = asyncio.create_task(bot.run(interval=getattr(sys.modules["config"], "CHECK_INTERVAL", 30)))
+        if args.rate > 0:
+            feeder = threading.Thread(target=feed, args=(site, args.calls, args.orders, args.rate, stop), daemon=True)
+            feeder.start()
+
+        deadline = time.monotonic() + args.timeout
+        rows = []
+        while time.monotonic() < deadline and not task.done():
+            rows = await asyncio.to_thread(delivered, bot.state)
+            if len(rows) >= expected:
+                break
+            await asyncio.sleep(0.1)
+        if task.done():
+            task.result()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        async with httpx.AsyncClient() as client:
+            api_stats = (await client.get(f"{api_url}/stats")).json()
+    finally:
+        stop.set()
+        if feeder is not None:
+            feeder.join()
+        api.terminate()
+        api.wait()
+        site.close()
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = sorted(at - created for at, created in rows if created is not None)
+    rss = peak_rss_mb()
+    finished = max((at for at, _ in rows), default=started)
+    drain = finished - started
+    return {
+        "leads": expected,
+        "delivered": len(rows),
+        "timed_out": len(rows) < expected,
+        "drain_seconds": round(drain, 3),
+        "leads_per_second": round(len(rows) / drain, 2) if drain > 0 else None,
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        "latency_max": round(max(latencies, default=0.0), 3),
+        "api_requests": api_stats["requests"],
+        "api_429": api_stats["too_many_requests"],
+        "api_bytes_received": api_stats["bytes_received"],
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+        "params": {
+            "calls": args.calls, "orders": args.orders, "files_per_order": args.files_per_order,
+            "file_size_kb": args.file_size_kb, "rate": args.rate, "latency": args.latency,
+            "jitter": args.jitter, "error_rate": args.error_rate, "bandwidth_mbit": args.bandwidth_mbit,
+            "chat_rate": args.chat_rate, "global_rate": args.global_rate,
+        },
+    }
+
+
+def format_result(result: dict) -> str:
+    lines = [
+        f"Заявок: {result['delivered']} из {result['leads']}" + (" (таймаут!)" if result["timed_out"] else ""),
+        f"Разбор: {result['drain_seconds']} с, {result['leads_per_second']} заявок/с",
+        f"Задержка created_at → Telegram: p50 {result['latency_p50']} с, p95 {result['latency_p95']} с, "
+        f"p99 {result['latency_p99']} с, max {result['latency_max']} с",
+        f"Bot API: {json.dumps(result['api_requests'], ensure_ascii=False)}, 429: {result['api_429']}, "
+        f"получено {result['api_bytes_received'] / (1024 * 1024):.1f} МБ",
+        f"Пиковый RSS: {result['peak_rss_mb']} МБ",
+    ]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк бота уведомлений")
+    parser.add_argument("--calls", type=int, default=100, help="заявок на звонок")
+    parser.add_argument("--orders", type=int, default=100, help="заявок на печать")
+    parser.add_argument("--files-per-order", type=int, default=2)
+    parser.add_argument("--file-size-kb", default="256", help="размеры файлов через запятую, КБ (по кругу)")
+    parser.add_argument("--rate", type=float, default=0.0, help="заявок в секунду во время работы (0 — всё заранее)")
+    parser.add_argument("--chat-rate", type=float, default=UNTHROTTLED_CHAT_RATE,
+                        help="TELEGRAM_CHAT_RATE_PER_MINUTE (по умолчанию без ограничения — измеряется конвейер; "
+                             "20 — лимит канала Telegram и config.example.py, тогда прогон упирается в лимит: "
+                             "альбом стоит столько токенов, сколько в нём файлов)")
+    parser.add_argument("--global-rate", type=float, default=UNTHROTTLED_GLOBAL_RATE,
+                        help="TELEGRAM_GLOBAL_RATE (по умолчанию без ограничения; лимит Telegram — 30 в секунду)")
+    parser.add_argument("--concurrency", type=int, help="SEND_CONCURRENCY")
+    parser.add_argument("--timeout", type=float, default=600, help="предельное время прогона, с")
+    parser.add_argument("--workdir", help="каталог для БД и файлов (по умолчанию временный)")
+    parser.add_argument("--keep", action="store_true", help="не удалять временный каталог")
+    parser.add_argument("--json", help="записать результат в JSON-файл")
+    parser.add_argument("--verbose", action="store_true", help="логи бота")
+    fake_bot_api.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_benchmark(args))
+    print(format_result(result))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 1 if result["timed_out"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Заглушка Bot API для бенчмарков: задержка ответа, ответы 429 и ограничение скорости загрузки.
+
+Запуск: ``python -m benchmarks.fake_bot_api --port 8081 --latency 0.05 --error-rate 0.02``.
+Бот направляется на неё через TELEGRAM_API_URL=http://127.0.0.1:8081.
+GET /stats отдаёт счётчики в JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 64 * 1024
+
+# Методы, которые отправляют сообщения в чат (только на них приходят 429)
+SEND_METHODS = {"sendMessage", "sendDocument", "sendMediaGroup"}
+
+
+class _Link:
+    """Общий канал загрузки заданной пропускной способности (байт/с) для всех соединений."""
+
+    def __init__(self, bandwidth: float):
+        self.bandwidth = bandwidth
+        self._free_at = 0.0
+
+    async def transfer(self, size: int):
+        if self.bandwidth <= 0:
+            return
+        now = time.monotonic()
+        self._free_at = max(now, self._free_at) + size / self.bandwidth
+        await asyncio.sleep(self._free_at - now)
+
+
+def _parse_multipart(body: bytes, boundary: bytes) -> dict:
+    """Текстовые поля multipart/form-data (содержимое файлов не нужно)."""
+    fields = {}
+    for part in body.split(b"--" + boundary):
+        head, sep, value = part.partition(b"\r\n\r\n")
+        if not sep or b"filename=" in head:
+            continue
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-disposition") and b'name="' in line:
+                name = line.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+                if value.endswith(b"\r\n"):
+                    value = value[:-2]
+                fields[name] = value.decode("utf-8", errors="replace")
+    return fields
+
+
+class FakeBotApi:
+    """HTTP/1.1 сервер с keep-alive, отвечающий как Bot API."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency: float = 0.05, jitter: float = 0.0,
+                 error_rate: float = 0.0, retry_after: int = 1, bandwidth: float = 0.0, seed: int | None = None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.link = _Link(bandwidth)
+        self.random = random.Random(seed)
+        self.stats = {"requests": {}, "too_many_requests": 0, "bytes_received": 0, "messages": 0,
+                      "first_message_at": None, "last_message_at": None}
+        self._message_id = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Заглушка Bot API: http://{self.host}:{self.port}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: dict) -> bytes:
+        chunks = []
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunk = await reader.readexactly(size)
+                await reader.readexactly(2)
+                await self.link.transfer(len(chunk))
+                chunks.append(chunk)
+        else:
+            remaining = int(headers.get("content-length", 0))
+            while remaining > 0:
+                chunk = await reader.read(min(READ_CHUNK, remaining))
+                if not chunk:
+                    raise ConnectionError("соединение закрыто посреди тела запроса")
+                remaining -= len(chunk)
+                await self.link.transfer(len(chunk))
+                chunks.append(chunk)
+        body = b"".join(chunks)
+        self.stats["bytes_received"] += len(body)
+        return body
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                method, path = request_line.decode("latin-1").split()[:2]
+                body = await self._read_body(reader, headers)
+                status, payload = await self._dispatch(method, path, headers, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, http_method: str, path: str, headers: dict, body: bytes):
+        if http_method == "GET" and path == "/stats":
+            return "200 OK", self.stats
+        # /bot<token>/<method>
+        api_method = path.rstrip("/").rsplit("/", 1)[-1]
+        self.stats["requests"][api_method] = self.stats["requests"].get(api_method, 0) + 1
+        if api_method == "getUpdates":
+            # Длинный опрос без обновлений: ответ по истечении timeout
+            await asyncio.sleep(float(self._params(headers, body).get("timeout") or 0))
+            return "200 OK", {"ok": True, "result": []}
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        if api_method in SEND_METHODS and self.random.random() < self.error_rate:
+            self.stats["too_many_requests"] += 1
+            return "429 Too Many Requests", {
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        params = self._params(headers, body)
+        return "200 OK", {"ok": True, "result": self._result(api_method, params)}
+
+    @staticmethod
+    def _params(headers: dict, body: bytes) -> dict:
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            boundary = content_type.split("boundary=", 1)[1].strip('"').encode()
+            return _parse_multipart(body, boundary)
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        return dict(parse_qsl(body.decode("utf-8", errors="replace")))
+
+    def _message(self, chat_id, **fields) -> dict:
+        self._message_id += 1
+        now = time.time()
+        self.stats["messages"] += 1
+        self.stats["first_message_at"] = self.stats["first_message_at"] or now
+        self.stats["last_message_at"] = now
+        try:
+            chat = int(chat_id)
+        except (TypeError, ValueError):
+            chat = -1001
+        return {"message_id": self._message_id, "date": int(now), "chat": {"id": chat, "type": "channel"}, **fields}
+
+    def _document(self) -> dict:
+        return {"file_id": f"BENCH{self._message_id}", "file_unique_id": f"u{self._message_id}"}
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if api_method == "sendMessage":
+            return self._message(params.get("chat_id"), text=params.get("text", ""))
+        if api_method == "sendDocument":
+            message = self._message(params.get("chat_id"))
+            return {**message, "document": self._document()}
+        if api_method == "sendMediaGroup":
+            media = json.loads(params.get("media") or "[]")
+            results = []
+            for _ in media:
+                message = self._message(params.get("chat_id"))
+                results.append({**message, "document": self._document()})
+            return results
+        return True
+
+
+async def _serve(args):
+    server = FakeBotApi(
+        host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, retry_after=args.retry_after,
+        bandwidth=args.bandwidth_mbit * 1_000_000 / 8, seed=args.seed,
+    )
+    await server.start()
+    # Для запускающего процесса: порт известен только после bind (--port 0)
+    print(f"READY {server.port}", flush=True)
+    await asyncio.Event().wait()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.02, help="случайная добавка к задержке, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 429 на отправки (0..1)")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответе 429, с")
+    parser.add_argument("--bandwidth-mbit", type=float, default=0.0, help="скорость загрузки, Мбит/с (0 — без ограничения)")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_arguments(parser)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,194 @@
+"""Микробенчмарки функций, которые выполняются для каждой заявки, с базовыми значениями в JSON.
+
+Пример (из корня репозитория, без сети)::
+
+    python -m benchmarks.micro --save baseline.json          # записать базовые значения
+    python -m benchmarks.micro --compare baseline.json       # сравнить; код 1 при регрессии
+
+Для каждой функции: операций в секунду (медиана ``--repeat`` замеров по
+``timeit.Timer.autorange``) и выделения памяти по tracemalloc — пик за
+один вызов и сколько остаётся занятым после вызова. Логирование на время
+замеров отключено: измеряется сама функция.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+from benchmarks.e2e import install_config
+from benchmarks.synthetic_db import SyntheticSite
+
+# Рост памяти меньше этого порога (байт) не считается регрессией — шум tracemalloc
+ALLOC_NOISE = 256
+
+# Сколько вызовов под tracemalloc для оценки выделений
+ALLOC_CALLS = 200
+
+
+def build_cases(workdir: str) -> dict:
+    """{имя: функция без аргументов}; Django-варианты — только если установлен Django."""
+    site = SyntheticSite(os.path.join(workdir, "site"), file_sizes=(1024,), files_per_order=1)
+    site.add_print_order(1)
+    attachment = site._conn.execute("SELECT file FROM main_printorderfile").fetchone()[0]
+    site.close()
+    # Адрес Bot API не используется: бот создаётся, но ничего не отправляет
+    install_config(site, os.path.join(workdir, "bot_state.sqlite3"), "http://127.0.0.1:9", {})
+    from bot import ModelixNotificationBot
+    from db_rows import CallRequestRow, PrintOrderRow
+
+    bot = ModelixNotificationBot()
+    bot.last_call_request_id, bot.last_print_order_id = 1000, 2000
+    call = CallRequestRow(1, "Иван <Петров>", "+7 (900) 123-45-67", "2024-05-01 10:00:00.123456", False)
+    order = PrintOrderRow(
+        1, "Анна & Co", "+7 911 000-00-00", "anna@example.com", "3d_printing",
+        "Нужно напечатать корпус <IP65> из PETG, 2 шт., срок — неделя. " * 6, "", "2024-05-01 10:00:00", False,
+    )
+    # Тысяча разных клиентов по кругу: первый проход — новые заявки, дальше — дубли
+    clients = itertools.cycle([(f"Клиент {i}", f"8900{i:07d}") for i in range(1000)])
+
+    def is_duplicate_call():
+        return bot.is_duplicate_call(*next(clients))
+
+    cases = {
+        "bot.format_call_request": lambda: bot.format_call_request(call),
+        "bot.format_print_order": lambda: bot.format_print_order(order),
+        "bot.is_duplicate_call": is_duplicate_call,
+        "bot.save_state": bot.save_state,
+        "bot.resolve_attachment_path[found]": lambda: bot.resolve_attachment_path(attachment),
+        "bot.resolve_attachment_path[missing]": lambda: bot.resolve_attachment_path("print_orders/missing.stl"),
+    }
+
+    try:
+        from django_integration import format_call_request_message, format_print_order_message
+    except ImportError as e:
+        print(f"Пропущены format_*_message из django_integration: {e}", file=sys.stderr)
+    else:
+        created_at = time.localtime()
+        instance = SimpleNamespace(
+            id=1, name=call.name, phone=call.phone, email=order.email, service_type=order.service_type,
+            message=order.message, file="print_orders/a.stl", is_processed=False,
+            created_at=SimpleNamespace(strftime=lambda fmt: time.strftime(fmt, created_at)),
+        )
+        cases["django.format_call_request_message"] = lambda: format_call_request_message(instance)
+        cases["django.format_print_order_message"] = lambda: format_print_order_message(instance)
+    return cases
+
+
+def measure(func, repeat: int = 5) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    per_call = [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+
+    func()
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(ALLOC_CALLS):
+            func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(per_call)
+    return {
+        "ops_per_sec": round(1 / median, 1),
+        "best_ops_per_sec": round(1 / min(per_call), 1),
+        "stdev_pct": round(100 * statistics.pstdev(per_call) / median, 2),
+        "loops": number,
+        "peak_alloc_bytes": peak - base,
+        "retained_bytes_per_call": round((current - base) / ALLOC_CALLS, 1),
+    }
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list[str]:
+    """Регрессии: скорость упала или пик выделений вырос больше чем на threshold."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            continue
+        slowdown = 1 - result["ops_per_sec"] / old["ops_per_sec"]
+        if slowdown > threshold:
+            regressions.append(f"{name}: {old['ops_per_sec']:.0f} → {result['ops_per_sec']:.0f} оп/с (-{slowdown:.0%})")
+        growth = result["peak_alloc_bytes"] - old["peak_alloc_bytes"]
+        if growth > ALLOC_NOISE and growth > threshold * old["peak_alloc_bytes"]:
+            regressions.append(
+                f"{name}: пик выделений {old['peak_alloc_bytes']} → {result['peak_alloc_bytes']} байт"
+            )
+    return regressions
+
+
+def format_results(results: dict, baseline: dict | None = None) -> str:
+    lines = [f"{'функция':<40} {'оп/с':>12} {'±%':>6} {'пик, Б':>8} {'остаётся, Б':>12}" +
+             (f" {'было оп/с':>12}" if baseline else "")]
+    for name, result in results.items():
+        line = (f"{name:<40} {result['ops_per_sec']:>12.0f} {result['stdev_pct']:>6.1f} "
+                f"{result['peak_alloc_bytes']:>8} {result['retained_bytes_per_call']:>12.1f}")
+        if baseline:
+            old = baseline.get("results", {}).get(name)
+            line += f" {old['ops_per_sec']:>12.0f}" if old else f" {'—':>12}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки обработки одной заявки")
+    parser.add_argument("--only", help="только функции, в имени которых есть эти подстроки (через запятую)")
+    parser.add_argument("--repeat", type=int, default=5, help="замеров на функцию")
+    parser.add_argument("--save", help="записать результаты как базовые значения (JSON)")
+    parser.add_argument("--compare", help="сравнить с базовыми значениями (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение (0.2 — 20%%)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="modelix-micro-")
+    try:
+        cases = build_cases(workdir)
+        logging.disable(logging.CRITICAL)
+        if args.only:
+            patterns = [p.strip() for p in args.only.split(",") if p.strip()]
+            cases = {name: func for name, func in cases.items() if any(p in name for p in patterns)}
+        results = {name: measure(func, args.repeat) for name, func in cases.items()}
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_results(results, baseline))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print("\nРегрессии (порог {:.0%}):".format(args.threshold))
+            print("\n".join(regressions))
+            return 1
+        print("\nРегрессий нет (порог {:.0%})".format(args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Синтетическая БД в формате Django (main_callrequest, main_printorder, main_printorderfile) и файлы заявок."""
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS main_callrequest (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    phone VARCHAR(20) NOT NULL,
+    created_at DATETIME NOT NULL,
+    is_processed BOOL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS main_printorder (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    phone VARCHAR(20) NOT NULL,
+    email VARCHAR(254) NOT NULL,
+    service_type VARCHAR(50) NOT NULL,
+    message TEXT NOT NULL,
+    file VARCHAR(100) NOT NULL,
+    created_at DATETIME NOT NULL,
+    is_processed BOOL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS main_printorderfile (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    print_order_id BIGINT NOT NULL REFERENCES main_printorder (id),
+    file VARCHAR(100) NOT NULL,
+    uploaded_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS main_printorderfile_print_order_id ON main_printorderfile (print_order_id);
+"""
+
+SERVICE_TYPES = ("3d_printing", "3d_modeling", "3d_scanning", "reverse_engineering", "post_processing", "other")
+
+WRITE_CHUNK = 1024 * 1024
+
+
+def django_now() -> str:
+    """created_at так, как его пишет Django с USE_TZ = True (UTC без пояса)."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class SyntheticSite:
+    """БД Django и каталог media/ в ``root``; заявки добавляются по одной транзакцией, как в Django."""
+
+    def __init__(self, root: str, file_sizes=(256 * 1024,), files_per_order: int = 2):
+        self.root = root
+        self.db_path = os.path.join(root, "db.sqlite3")
+        self.media_root = os.path.join(root, "media")
+        self.file_sizes = tuple(file_sizes)
+        self.files_per_order = files_per_order
+        os.makedirs(os.path.join(self.media_root, "print_orders"), exist_ok=True)
+        # Заявки в режиме потока пишет отдельный поток бенчмарка
+        self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+
+    def _media_file(self, number: int, index: int) -> str:
+        """Относительный путь к новому файлу заявки.
+
+        Содержимое у каждого файла своё (случайное), иначе бот отправил бы
+        повторы по file_id из кэша и загрузка не измерялась бы.
+        """
+        size = self.file_sizes[(number + index) % len(self.file_sizes)]
+        name = f"print_orders/order_{number}_{index}.stl"
+        with open(os.path.join(self.media_root, name), "wb") as f:
+            remaining = size
+            while remaining > 0:
+                chunk = min(WRITE_CHUNK, remaining)
+                f.write(os.urandom(chunk))
+                remaining -= chunk
+        return name
+
+    def add_call_request(self, number: int) -> int:
+        cursor = self._conn.execute(
+            "INSERT INTO main_callrequest (name, phone, created_at, is_processed) VALUES (?, ?, ?, 0)",
+            (f"Клиент {number}", f"+7900{number:07d}", django_now()),
+        )
+        return cursor.lastrowid
+
+    def add_print_order(self, number: int) -> int:
+        # Файлы загружаются до сохранения заявки, как в форме Django
+        files = [self._media_file(number, index) for index in range(self.files_per_order)]
+        self._conn.execute("BEGIN")
+        try:
+            cursor = self._conn.execute(
+                "INSERT INTO main_printorder (name, phone, email, service_type, message, file, created_at, is_processed) "
+                "VALUES (?, ?, ?, ?, ?, '', ?, 0)",
+                (
+                    f"Заказчик {number}", f"+7911{number:07d}", f"client{number}@example.com",
+                    SERVICE_TYPES[number % len(SERVICE_TYPES)],
+                    f"Напечатать деталь №{number}, PETG, 2 шт. " * 3,
+                    django_now(),
+                ),
+            )
+            order_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO main_printorderfile (print_order_id, file, uploaded_at) VALUES (?, ?, ?)",
+                [(order_id, name, django_now()) for name in files],
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return order_id
+
+    def add_leads(self, calls: int, orders: int, start: int = 0):
+        """Добавить заявки, чередуя звонки и печать."""
+        for number in range(start, start + max(calls, orders)):
+            if number - start < orders:
+                self.add_print_order(number)
+            if number - start < calls:
+                self.add_call_request(number)
+
+    def close(self):
+        self._conn.close()
@@ -1,17 +1,40 @@
 """
 Телеграм-бот для отправки уведомлений о заказах Modelix
 """
+import argparse
 import asyncio
-import sqlite3
-import json
 import os
 import time
-from datetime import datetime
-from telegram.error import TelegramError
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from html import escape
+from telegram import InputMediaDocument
+from telegram.error import BadRequest, RetryAfter, TelegramError
 import logging
 
-from config import BOT_TOKEN, CHANNEL_ID, DJANGO_DB_PATH
-from telegram_client import create_telegram_bot, resolve_proxy_url
+import config
+from attachments import DEFAULT_UPLOAD_LIMIT, AttachmentPipeline, StreamingInputFile
+from change_log import StatusSync, install as install_change_log
+from config import BOT_TOKEN
+from db_connection import DjangoDatabase
+from db_rows import DEFAULT_PAGE_SIZE, SERVICE_TYPES, fetch_call_requests, fetch_print_orders
+from db_schema import AttachmentSchema
+from db_watcher import DatabaseWatcher
+from dedup_index import DedupIndex
+from digest import render_digest
+from file_cache import FileIdCache
+from ingest_socket import IngestServer
+from lead_commands import LeadCommands
+from lead_index import LeadIndex
+from lead_stats import LeadStats
+from metrics import BotMetrics, MetricsServer
+from pipeline import NotificationPipeline, RowBatch
+from routing import Router
+from send_queue import TelegramSendQueue, is_permanent_error
+from sites import SiteLogFilter, current_site, load_sites, single_site
+from state_store import StateStore
+from telegram_client import create_telegram_bot, keep_alive, resolve_proxy_url, warm_up
+from trace_journal import TraceJournal, format_report
 
 # Настройка логирования
 logging.basicConfig(
@@ -20,64 +43,427 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Лимиты Bot API: документов в одном альбоме и символов в подписи
+MEDIA_GROUP_LIMIT = 10
+CAPTION_LIMIT = 1024
+
+# Сколько хранить доставленные записи outbox (в секундах)
+OUTBOX_RETENTION = 7 * 24 * 3600
+
+
+def create_send_queue(telegram, on_request=None):
+    """Очередь отправки с лимитами Telegram и повторами (одна на все сайты процесса)"""
+    return TelegramSendQueue(
+        telegram,
+        global_rate=getattr(config, 'TELEGRAM_GLOBAL_RATE', 30),
+        chat_rate_per_minute=getattr(config, 'TELEGRAM_CHAT_RATE_PER_MINUTE', 20),
+        max_retries=getattr(config, 'SEND_MAX_RETRIES', 5),
+        on_request=on_request,
+    )
+
+
+def created_timestamp(created_at):
+    """Unix-время создания заявки или None
+    
+    Django с USE_TZ = True хранит created_at в UTC без указания пояса.
+    """
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(str(created_at), fmt).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            continue
+    return None
+
 
 class ModelixNotificationBot:
-    """Бот для отправки уведомлений о заявках"""
+    """Бот для отправки уведомлений о заявках одного сайта
+    
+    site — база Django, media, канал и база состояния сайта (по умолчанию из
+    DJANGO_DB_PATH, CHANNEL_ID и т.д.). telegram, sender и metrics передаёт
+    run_sites(), когда в процессе несколько сайтов: Bot (пул HTTP-соединений),
+    очередь отправки и метрики тогда общие, а закрывает их run_sites().
+    """
     
-    def __init__(self):
-        if resolve_proxy_url():
+    def __init__(self, site=None, telegram=None, sender=None, metrics=None):
+        self.site = site or single_site(config)
+        # Общие ресурсы процесса создаёт и закрывает их владелец
+        self.owns_telegram = telegram is None
+        if self.owns_telegram and resolve_proxy_url():
             logger.info("Telegram API через прокси (TELEGRAM_PROXY_URL / TELEGRAM_PROXY)")
-        self.bot = create_telegram_bot(BOT_TOKEN)
-        self.channel_id = CHANNEL_ID
-        self.db_path = DJANGO_DB_PATH
-        # Абсолютный путь к файлу состояния
+        self.bot = telegram or create_telegram_bot(BOT_TOKEN)
+        # Метрики Prometheus (сервер /metrics — при METRICS_PORT > 0)
+        self.metrics = metrics or BotMetrics()
+        metrics_port = getattr(config, 'METRICS_PORT', 0) if metrics is None else 0
+        self.metrics_server = MetricsServer(
+            self.metrics, host=getattr(config, 'METRICS_HOST', '127.0.0.1'), port=metrics_port
+        ) if metrics_port else None
+        # Все отправки — через очередь с лимитами Telegram и повторами
+        self.sender = sender or create_send_queue(self.bot, on_request=self.observe_request)
+        self.channel_id = self.site.channel_id
+        # Чаты заявки по виду и услуге (ROUTES); без правил — только канал сайта
+        self.router = Router(self.site.routes, self.channel_id)
+        # Сколько ждать остальные чаты заявки, прежде чем освободить обработчик (повтор догонит)
+        self.route_wait = getattr(config, 'ROUTE_WAIT', 20)
+        # Отправки заявки в отдельные чаты: (вид, id, чат) -> задача; идущая отправка не повторяется
+        self.deliveries = {}
+        # Файлы, загружаемые сейчас для одного из чатов: sha256 -> Future (file_id берут остальные)
+        self.uploads = {}
+        self.db_path = self.site.db_path
+        self.media_root = self.site.media_root
+        self.db = DjangoDatabase(self.db_path)
+        # Новые заявки читаются страницами по DB_PAGE_SIZE строк
+        self.page_size = getattr(config, 'DB_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        # Таблица вложений определяется по схеме один раз (и после миграций)
+        self.attachment_schema = AttachmentSchema()
+        # Принудительная проверка на следующем шаге, даже если data_version не изменился
+        self.recheck_pending = True
+        # Старый файл состояния (переносится в базу состояния при первом запуске)
         self.state_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot_state.json')
+        # Курсоры, outbox и индекс дублей — в локальной SQLite рядом с ботом, у каждого сайта своя
+        self.state_db_path = self.site.state_db_path
+        self.state = StateStore(self.state_db_path)
+        # file_id уже загруженных файлов — повторная отправка без загрузки
+        self.file_cache = FileIdCache(
+            self.state,
+            max_age=getattr(config, 'FILE_ID_CACHE_MAX_AGE_DAYS', 30) * 24 * 3600,
+            max_entries=getattr(config, 'FILE_ID_CACHE_MAX_ENTRIES', 5000),
+        )
+        # Файлы больше лимита Bot API: сжатие / разбиение / ссылка (см. LARGE_FILE_STRATEGY)
+        self.attachments = AttachmentPipeline(
+            upload_limit=getattr(config, 'TELEGRAM_UPLOAD_LIMIT_MB', DEFAULT_UPLOAD_LIMIT // (1024 * 1024)) * 1024 * 1024,
+            strategies=[
+                strategy.strip()
+                for strategy in getattr(config, 'LARGE_FILE_STRATEGY', 'zip,split').split(',')
+                if strategy.strip()
+            ],
+            media_url=self.site.media_url,
+            media_root=self.media_root,
+        )
         self.last_call_request_id = 0
         self.last_print_order_id = 0
-        # Кэш для предотвращения дублирования
-        self.recent_calls = []  # [(name, phone, timestamp), ...]
+        # Этапы доставки каждой заявки для отчёта по задержкам (python bot.py trace-report)
+        self.trace = TraceJournal(
+            self.state,
+            retention=getattr(config, 'TRACE_RETENTION_DAYS', 7) * 24 * 3600,
+            max_rows=getattr(config, 'TRACE_MAX_ROWS', 200000),
+        )
+        # Недавние заявки (имя, телефон): звонок, созданный вместе с заявкой на печать, — дубль
+        self.dedup = DedupIndex(self.state, ttl=getattr(config, 'DEDUP_TTL', 120))
+        # Полнотекстовый индекс прочитанных заявок для команд /find и /lead
+        self.lead_index = LeadIndex(self.state)
+        # Счётчики заявок по часам, дням и услугам для /stats и ежедневной сводки
+        self.stats = LeadStats(self.state)
+        # Команды опрашивают get_updates одного токена: при нескольких сайтах их запускает run_sites()
+        self.commands = LeadCommands(
+            self,
+            self.lead_index,
+            stats=self.stats,
+            chats=self.site.command_chats,
+            retry_delay=getattr(config, 'CHECK_INTERVAL', 30),
+        ) if getattr(config, 'BOT_COMMANDS', False) and self.owns_telegram else None
+        # Сколько заявок с файлами загружается одновременно
+        self.upload_semaphore = asyncio.Semaphore(getattr(config, 'ATTACHMENT_CONCURRENCY', 3))
+        # Пробуждение цикла по изменению БД (таймер остаётся страховкой)
+        self.watcher = DatabaseWatcher(
+            self.db_path,
+            mode=getattr(config, 'DB_WATCH_MODE', 'auto'),
+            poll_interval=getattr(config, 'DB_WATCH_POLL_INTERVAL', 0.5),
+            database=self.db,
+        )
+        # События о новых заявках от Django (django_integration.py) по Unix-сокету
+        socket_path = self.site.socket
+        self.ingest = IngestServer(socket_path, self.on_ingest_event) if socket_path else None
+        # Чтение БД, форматирование и отправка — отдельные стадии (см. NotificationPipeline)
+        self.pipeline = NotificationPipeline(
+            self,
+            concurrency=getattr(config, 'SEND_CONCURRENCY', 4),
+            retry_delay=getattr(config, 'CHECK_INTERVAL', 30),
+            digest_threshold=getattr(config, 'DIGEST_THRESHOLD', 0),
+            digest_window=getattr(config, 'DIGEST_WINDOW', 10),
+            metrics=self.metrics,
+            trace=self.trace,
+        )
+        if metrics is None:
+            self.metrics.queue_depth.collect = lambda: {
+                ('pipeline',): self.pipeline.depth,
+                ('telegram',): self.sender.depth,
+            }
+            self.metrics.cursor_lag.collect = self.cursor_lag
+        # Правка отправленных сообщений по журналу изменений Django (python bot.py install-changelog)
+        self.status_sync = StatusSync(
+            self,
+            page_size=self.page_size,
+            retention=getattr(config, 'SENT_MESSAGES_RETENTION_DAYS', 30) * 24 * 3600,
+            retry_delay=getattr(config, 'CHECK_INTERVAL', 30),
+        )
         
     def get_db_connection(self):
-        """Получить соединение с БД Django"""
-        return sqlite3.connect(self.db_path)
+        """Получить долгоживущее read-only соединение с БД Django (не закрывать!)"""
+        return self.db.connection()
     
-    async def send_notification(self, message: str, file_path=None):
-        """Отправить уведомление в канал, с опциональным файлом"""
+    async def send_notification(self, message: str, file_path=None, lead=None, chat_id=None):
+        """Отправить уведомление в канал (или в чат chat_id), с опциональным файлом
+        
+        lead — (вид, id, текст заявки): сообщение запоминается для правки при изменении заявки.
+        Возвращает False, если отправка не удалась и заявку нужно повторить позже.
+        """
+        chat_id = chat_id or self.channel_id
         try:
             if file_path and os.path.exists(file_path):
                 # Отправляем файл БЕЗ СЖАТИЯ через send_document
                 try:
                     with open(file_path, 'rb') as file:
-                        await self.bot.send_document(
-                            chat_id=self.channel_id,
+                        sent = await self.sender.send_document(
+                            chat_id,
                             document=file,
                             caption=message,
                             parse_mode='HTML'
                         )
-                    logger.info(f"Уведомление с файлом отправлено в канал {self.channel_id}: {file_path}")
+                    logger.info(f"Уведомление с файлом отправлено в канал {chat_id}: {file_path}")
+                    await self.remember_message(lead, sent, message, is_caption=True)
+                    return True
                 except Exception as file_error:
                     logger.error(f"Ошибка отправки файла {file_path}: {file_error}")
-                    # Отправляем только текст если файл не отправился
-                    await self.bot.send_message(
-                        chat_id=self.channel_id,
-                        text=message,
-                        parse_mode='HTML',
-                        disable_web_page_preview=True
-                    )
-                    logger.info(f"Уведомление отправлено без файла в канал {self.channel_id}")
-            else:
-                # Отправляем только текст
-                await self.bot.send_message(
-                    chat_id=self.channel_id,
-                    text=message,
-                    parse_mode='HTML',
-                    disable_web_page_preview=True
-                )
-                logger.info(f"Уведомление отправлено в канал {self.channel_id}")
+            # Отправляем только текст (в том числе если файл не отправился)
+            sent = await self.sender.send_message(
+                chat_id,
+                text=message,
+                parse_mode='HTML',
+                disable_web_page_preview=True
+            )
+            logger.info(f"Уведомление отправлено в канал {chat_id}")
+            await self.remember_message(lead, sent, message)
+            return True
         except TelegramError as e:
             logger.error(f"Ошибка отправки уведомления: {e}")
+            # Неверный запрос повторять бессмысленно — не задерживаем из-за него очередь заявок
+            return is_permanent_error(e)
         except Exception as e:
             logger.error(f"Неожиданная ошибка отправки уведомления: {e}")
+            return False
+    
+    async def remember_message(self, lead, sent, text, is_caption=False):
+        """Запомнить message_id сообщения с текстом заявки (ошибка не мешает доставке)"""
+        if lead is None or sent is None:
+            return
+        kind, source_id, base = lead
+        try:
+            await asyncio.to_thread(
+                self.status_sync.remember, kind, source_id, sent.chat_id, sent.message_id, base, text, is_caption
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось запомнить сообщение заявки {kind} ID={source_id}: {e}")
+    
+    def resolve_attachment_path(self, file_path_str):
+        """Найти файл вложения на диске (media/ сайта, корень проекта Django, как есть)"""
+        django_project_path = os.path.dirname(self.db_path)  # /var/www/modelix
+        
+        # Пробуем несколько вариантов путей
+        possible_paths = [
+            os.path.join(self.media_root, file_path_str),
+            os.path.join(django_project_path, file_path_str),
+            file_path_str
+        ]
+        
+        for path in possible_paths:
+            if os.path.exists(path):
+                return path
+        return None
+    
+    def resolve_attachment_paths(self, all_files):
+        """Пути всех найденных на диске вложений заявки (вызывается в потоке)"""
+        paths = []
+        for file_path_str in all_files:
+            full_file_path = self.resolve_attachment_path(file_path_str)
+            if full_file_path:
+                paths.append(full_file_path)
+            else:
+                logger.warning(f"Файл не найден: {file_path_str}")
+        return paths
+    
+    async def send_album(self, items, caption=None, chat_id=None):
+        """Отправить до 10 файлов (UploadItem) одним альбомом (один файл — обычным документом)
+        
+        Файлы, которые уже загружались раньше, отправляются по file_id без повторной загрузки.
+        Если файл прямо сейчас загружается для другого чата, ждём его file_id (не дольше ROUTE_WAIT).
+        """
+        chat_id = chat_id or self.channel_id
+        digests = [
+            await self.file_cache.digest(item.path, remember_path=not item.temporary)
+            for item in items
+        ]
+        file_ids = [await asyncio.to_thread(self.file_cache.lookup, digest) for digest in digests]
+        in_flight = [self.uploads[digest] for digest, file_id in zip(digests, file_ids)
+                     if not file_id and digest in self.uploads]
+        if in_flight:
+            await asyncio.wait(in_flight, timeout=self.route_wait)
+            file_ids = [await asyncio.to_thread(self.file_cache.lookup, digest) for digest in digests]
+        # Загрузки этого альбома: другие чаты дождутся их file_id
+        mine = {}
+        for digest, file_id in zip(digests, file_ids):
+            if not file_id and digest not in self.uploads and digest not in mine:
+                mine[digest] = self.uploads[digest] = asyncio.get_running_loop().create_future()
+        started = time.time()
+        try:
+            try:
+                messages = await self._send_album_files(items, file_ids, caption, chat_id)
+            except BadRequest:
+                if not any(file_ids):
+                    raise
+                # Telegram не принял сохранённый file_id — забываем его и загружаем файлы заново
+                logger.warning(f"Сохранённый file_id отклонён, загружаем файлы заново: {[item.path for item in items]}")
+                for digest, file_id in zip(digests, file_ids):
+                    if file_id:
+                        await asyncio.to_thread(self.file_cache.forget, digest)
+                file_ids = [None] * len(items)
+                messages = await self._send_album_files(items, file_ids, caption, chat_id)
+            
+            uploaded = sum(item.size for item, file_id in zip(items, file_ids) if not file_id)
+            self.metrics.uploaded_bytes.inc(uploaded)
+            self.trace.record_current('upload', started, time.time(), uploaded)
+            for item, digest, file_id, sent in zip(items, digests, file_ids, messages):
+                if file_id:
+                    logger.info(f"Файл отправлен по file_id без загрузки: {item.path}")
+                elif sent.document:
+                    await asyncio.to_thread(self.file_cache.remember, digest, sent.document.file_id, item.size)
+            return messages
+        finally:
+            for digest, future in mine.items():
+                if self.uploads.get(digest) is future:
+                    del self.uploads[digest]
+                future.set_result(None)
+    
+    async def _send_album_files(self, items, file_ids, caption, chat_id):
+        """Отправка альбома: file_id, если он известен, иначе потоковая загрузка файла"""
+        with ExitStack() as stack:
+            files = []
+            for item, file_id in zip(items, file_ids):
+                if file_id:
+                    files.append(file_id)
+                    continue
+                stream = StreamingInputFile(item.path, filename=item.filename, attach=len(items) > 1)
+                stack.callback(stream.close)
+                files.append(stream)
+            if len(files) == 1:
+                sent = await self.sender.send_document(
+                    chat_id,
+                    document=files[0],
+                    caption=caption,
+                    parse_mode='HTML'
+                )
+                return [sent]
+            media = [
+                InputMediaDocument(
+                    media=file,
+                    caption=caption if index == 0 else None,
+                    parse_mode='HTML'
+                )
+                for index, file in enumerate(files)
+            ]
+            return await self.sender.send_media_group(chat_id, media=media)
+    
+    async def fan_out(self, kind, source_id, chats, send, cleanup=None):
+        """send(chat_id) -> bool во все чаты заявки параллельно; True — доставлено во все
+        
+        У каждого чата своя очередь и лимиты (TelegramSendQueue), поэтому медленный
+        чат не задерживает остальные. Если через ROUTE_WAIT секунд не все чаты
+        ответили, возвращается False: отправка продолжается в фоне, а повтор заявки
+        дождётся её, не отправляя заново в чаты, где всё уже получилось.
+        cleanup() вызывается, когда закончатся все отправки этого вызова.
+        """
+        if len(chats) == 1:
+            try:
+                return await send(chats[0])
+            finally:
+                if cleanup is not None:
+                    cleanup()
+        tasks = []
+        for chat_id in chats:
+            key = (kind, source_id, str(chat_id))
+            task = self.deliveries.get(key)
+            if task is None or (task.done() and not self._delivered(task)):
+                task = self.deliveries[key] = asyncio.create_task(send(chat_id))
+            tasks.append(task)
+        _done, pending = await asyncio.wait(tasks, timeout=self.route_wait)
+        if cleanup is not None:
+            if pending:
+                asyncio.gather(*pending, return_exceptions=True).add_done_callback(lambda _: cleanup())
+            else:
+                cleanup()
+        failed = [chat_id for chat_id, task in zip(chats, tasks) if not (task.done() and self._delivered(task))]
+        if failed:
+            logger.warning(f"Заявка {kind} ID={source_id} ещё не доставлена в чаты {failed}, повторим позже")
+            return False
+        for chat_id in chats:
+            self.deliveries.pop((kind, source_id, str(chat_id)), None)
+        return True
+    
+    @staticmethod
+    def _delivered(task):
+        # Ошибки отправки уже записаны в лог внутри send(); исключение здесь только забираем
+        if task.cancelled() or task.exception() is not None:
+            return False
+        return bool(task.result())
+    
+    async def deliver_print_order(self, order_id, message, all_files, text_in_digest=False, chats=None):
+        """Отправить заявку на печать: файлы альбомами с текстом заявки в подписи первого
+        
+        text_in_digest — текст заявки уйдёт в сводке, message лишь подпись к файлам
+        (если отправлять нечего, ничего и не отправляется).
+        chats — чаты заявки (по умолчанию канал); файлы готовятся один раз на все чаты.
+        Возвращает False, если заявку нужно отправить повторно.
+        """
+        chats = chats or [self.channel_id]
+        # Сообщение с текстом заявки запоминается для правки (подпись к файлам из сводки — нет)
+        lead = None if text_in_digest else ('print_order', order_id, message)
+        # Проверка файлов на диске — в потоке, чтобы не останавливать event loop
+        paths = await asyncio.to_thread(self.resolve_attachment_paths, all_files)
+        
+        async with self.upload_semaphore:
+            # Размер проверяем до загрузки: большие файлы сжимаются, делятся или заменяются ссылкой
+            items, notices = await self.attachments.prepare(paths)
+            if text_in_digest and not items and not notices:
+                self.attachments.cleanup(items)
+                return True
+            if notices:
+                message = message + "\n\n" + "\n".join(notices)
+            return await self.fan_out(
+                'print_order', order_id, chats,
+                lambda chat_id: self._deliver_order_files(order_id, message, items, all_files, lead, chat_id),
+                cleanup=lambda: self.attachments.cleanup(items),
+            )
+    
+    async def _deliver_order_files(self, order_id, message, items, all_files, lead=None, chat_id=None):
+        # Без файлов или с длинным текстом (лимит подписи 1024) текст уходит отдельным сообщением
+        caption = message
+        if not items or len(message) > CAPTION_LIMIT:
+            if not await self.send_notification(message, lead=lead, chat_id=chat_id):
+                return False
+            caption = None
+        
+        files_sent = 0
+        for start in range(0, len(items), MEDIA_GROUP_LIMIT):
+            album = items[start:start + MEDIA_GROUP_LIMIT]
+            try:
+                messages = await self.send_album(album, caption=caption, chat_id=chat_id)
+                if caption:
+                    await self.remember_message(lead, messages[0], caption, is_caption=True)
+                logger.info(f"Заявка ID={order_id}: отправлено файлов одним сообщением: {len(album)}")
+                files_sent += len(album)
+            except Exception as file_error:
+                logger.error(f"Ошибка отправки файлов {[item.path for item in album]}: {file_error}")
+                if not is_permanent_error(file_error):
+                    return False
+                if caption and not await self.send_notification(message, lead=lead, chat_id=chat_id):
+                    # Текст заявки не должен потеряться вместе с альбомом
+                    return False
+            caption = None
+        
+        if files_sent > 0:
+            logger.info(f"Отправлено файлов: {files_sent} из {len(all_files)}")
+        elif all_files:
+            logger.warning(f"Файлы найдены в БД но не отправлены: {all_files}")
+        return True
     
     def format_call_request(self, request_data):
         """Форматировать сообщение о заявке на звонок"""
@@ -114,6 +500,8 @@ class ModelixNotificationBot:
         order_id, name, phone, email, service_type, message_text, file_path, created_at, is_processed = order_data
         
         status = "✅ Обработано" if is_processed else "🔔 Новая заявка"
+        # Обработанная заявка (сообщение правится по журналу изменений, см. change_log.py)
+        title = "✅ Заявка обработана" if is_processed else "🔔 Заявка c данными"
         
         # Парсим дату
         try:
@@ -127,19 +515,7 @@ class ModelixNotificationBot:
         
         date_str = dt.strftime('%d.%m.%Y %H:%M')
         
-        # Маппинг типов услуг
-        service_types = {
-            'other': 'Другое',
-            'complex': 'Комплекс услуг',
-            '3d_modeling': '3D моделирование',
-            '3d_printing': '3D печать',
-            '3d_scanning': '3D сканирование',
-            'reverse_engineering': 'Реверс-инжиниринг',
-            'engineering': 'Инжиниринг',
-            'post_processing': 'Постобработка',
-        }
-        
-        service_name = service_types.get(service_type, service_type)
+        service_name = SERVICE_TYPES.get(service_type, service_type)
         
         # Обработка пустого сообщения
         if not message_text or str(message_text).strip() == '':
@@ -156,7 +532,7 @@ class ModelixNotificationBot:
         ellipsis = '...' if len(message_text) > 200 else ''
         
         message = f"""
-<b>🔔 Заявка c данными</b>
+<b>{title}</b>
 
 👤 <b>Имя:</b> {name}
 📱 <b>Телефон:</b> <code>{phone}</code>
@@ -168,249 +544,253 @@ class ModelixNotificationBot:
     
     def is_duplicate_call(self, name, phone):
         """Проверить, не дублируется ли заявка на звонок (создана вместе с печатью)"""
-        current_time = time.time()
-        # Очищаем старые записи (старше 2 минут)
-        self.recent_calls = [(n, p, t) for n, p, t in self.recent_calls if current_time - t < 120]
-        
-        # Проверяем есть ли такая же заявка в последние 2 минуты
-        for cached_name, cached_phone, timestamp in self.recent_calls:
-            if cached_name == name and cached_phone == phone:
-                logger.info(f"Найден дубль заявки на звонок: {name} {phone} (создана {current_time - timestamp:.1f} сек назад)")
-                return True
-        
-        # Добавляем в кэш
-        self.recent_calls.append((name, phone, current_time))
+        # Такая же заявка за последние DEDUP_TTL секунд — дубль, иначе запоминаем её
+        if self.dedup.check_and_add(name, phone):
+            self.metrics.duplicates.inc()
+            logger.info(f"Найден дубль заявки на звонок: {name} {phone}")
+            return True
         return False
     
+    def read_new_call_requests(self):
+        """Следующая страница main_callrequest после курсора (вызывается в потоке)"""
+        started = time.perf_counter()
+        rows = fetch_call_requests(self.db, self.last_call_request_id, self.page_size)
+        self.metrics.db_query.observe(time.perf_counter() - started, table='main_callrequest')
+        return rows
+    
+    def read_new_print_orders(self):
+        """Следующая страница main_printorder и вложения её заявок (вызывается в потоке)"""
+        started = time.perf_counter()
+        new_orders = fetch_print_orders(self.db, self.last_print_order_id, self.page_size)
+        self.metrics.db_query.observe(time.perf_counter() - started, table='main_printorder')
+        # Вложения всех заявок страницы — одним запросом
+        files_by_order = self.attachment_schema.fetch_files(self.db, [order.id for order in new_orders])
+        return new_orders, files_by_order
+    
     async def check_new_call_requests(self):
-        """Проверить новые заявки на звонок"""
-        try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Получаем новые заявки
-            cursor.execute(
-                """
-                SELECT id, name, phone, created_at, is_processed
-                FROM main_callrequest
-                WHERE id > ?
-                ORDER BY id ASC
-                """,
-                (self.last_call_request_id,)
-            )
-            
-            new_requests = cursor.fetchall()
-            
-            for request in new_requests:
-                request_id = request[0]
-                name = str(request[1])
-                phone = str(request[2])
-                
-                logger.info(f"Обрабатываем новую заявку на звонок ID={request_id}")
-                
-                # Проверяем на дубль (создана вместе с заявкой на печать)
-                if self.is_duplicate_call(name, phone):
-                    logger.info(f"Пропускаем дубль заявки на звонок ID={request_id}")
-                else:
-                    message = self.format_call_request(request)
-                    await self.send_notification(message)
-                
-                self.last_call_request_id = request_id
-                self.save_state()  # Сохраняем состояние после каждой заявки
-                logger.info(f"Обновлен last_call_request_id до {self.last_call_request_id}")
+        """Прочитать новые заявки на звонок страницами (стадия чтения)"""
+        while True:
+            new_requests = await asyncio.to_thread(self.read_new_call_requests)
+            if not new_requests:
+                return
+            # Следующая страница начнётся после этой; в базе состояния курсор
+            # сдвинется вместе с записью страницы в outbox
+            self.last_call_request_id = new_requests[-1].id
+            yield RowBatch('call_request', new_requests, {}, time.time())
+            if len(new_requests) < self.page_size:
+                return
+    
+    async def check_new_print_orders(self):
+        """Прочитать новые заявки на печать с вложениями страницами (стадия чтения)"""
+        while True:
+            new_orders, files_by_order = await asyncio.to_thread(self.read_new_print_orders)
+            if not new_orders:
+                return
+            self.last_print_order_id = new_orders[-1].id
+            yield RowBatch('print_order', new_orders, files_by_order, time.time())
+            if len(new_orders) < self.page_size:
+                return
+    
+    def format_call_requests(self, new_requests):
+        """Записи outbox для заявок на звонок [(id, payload), ...] без дублей"""
+        items = []
+        for request in new_requests:
+            request_id = request.id
+            name = str(request.name)
+            phone = str(request.phone)
             
-            conn.close()
+            logger.info(f"Обрабатываем новую заявку на звонок ID={request_id}")
             
-            if new_requests:
-                logger.info(f"Обработано {len(new_requests)} новых заявок на звонок")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при проверке заявок на звонок: {e}")
+            # Проверяем на дубль (создана вместе с заявкой на печать)
+            if self.is_duplicate_call(name, phone):
+                logger.info(f"Пропускаем дубль заявки на звонок ID={request_id}")
+            else:
+                items.append((request_id, self.route({
+                    'text': self.format_call_request(request),
+                    'created_at': created_timestamp(request.created_at),
+                }, 'call_request')))
+        return items
     
-    async def check_new_print_orders(self):
-        """Проверить новые заявки на печать"""
-        try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
+    def format_print_orders(self, new_orders, files_by_order):
+        """Записи outbox для заявок на печать [(id, payload), ...]"""
+        items = []
+        for order in new_orders:
+            order_id = order.id
+            name = str(order.name)
+            phone = str(order.phone)
+            file_path = order.file  # Путь к файлу из БД
             
-            # Получаем новые заявки
-            cursor.execute(
-                """
-                SELECT id, name, phone, email, service_type, message, file, created_at, is_processed
-                FROM main_printorder
-                WHERE id > ?
-                ORDER BY id ASC
-                """,
-                (self.last_print_order_id,)
-            )
+            logger.info(f"Обрабатываем новую заявку на печать ID={order_id}, file_path из БД: {file_path}")
             
-            new_orders = cursor.fetchall()
+            # Добавляем в индекс чтобы избежать дублей звонков
+            self.dedup.add(name, phone)
+            logger.info(f"Добавлен в кэш: {name} {phone}")
             
-            for order in new_orders:
-                order_id = order[0]
-                name = str(order[1])
-                phone = str(order[2])
-                file_path = order[6]  # Путь к файлу из БД
-                
-                logger.info(f"Обрабатываем новую заявку на печать ID={order_id}, file_path из БД: {file_path}")
-                
-                # Добавляем в кэш чтобы избежать дублей звонков
-                current_time = time.time()
-                self.recent_calls.append((name, phone, current_time))
-                logger.info(f"Добавлен в кэш: {name} {phone}")
-                
-                message = self.format_print_order(order)
-                
-                # Отправляем уведомление с текстом
-                await self.send_notification(message, file_path=None)
-                
-                # Получаем ВСЕ файлы для этой заявки из разных возможных таблиц
-                all_files = []
-                
-                # Пробуем разные варианты названий таблиц
-                possible_table_names = [
-                    'main_printorderfile',
-                    'main_printorder_file', 
-                    'main_orderfile',
-                    'main_file',
-                    'main_printorderfiles'
-                ]
-                
-                for table_name in possible_table_names:
-                    try:
-                        # Пробуем разные варианты названий полей
-                        possible_queries = [
-                            f"SELECT file FROM {table_name} WHERE print_order_id = ?",
-                            f"SELECT file FROM {table_name} WHERE order_id = ?",
-                            f"SELECT file_path FROM {table_name} WHERE print_order_id = ?",
-                            f"SELECT file_path FROM {table_name} WHERE order_id = ?",
-                            f"SELECT file FROM {table_name} WHERE printorder_id = ?",
-                        ]
-                        
-                        for query in possible_queries:
-                            try:
-                                cursor.execute(query, (order_id,))
-                                file_records = cursor.fetchall()
-                                if file_records:
-                                    logger.info(f"Найдена таблица {table_name} с запросом {query}, файлов: {len(file_records)}")
-                                    for file_record in file_records:
-                                        if file_record[0]:
-                                            all_files.append(str(file_record[0]).strip())
-                                    break
-                            except:
-                                continue
-                        
-                        if all_files:
-                            break
-                    except:
-                        continue
-                
-                # Если не нашли в связанных таблицах, пробуем поле file из main_printorder
-                if not all_files and file_path and str(file_path).strip():
-                    all_files.append(str(file_path).strip())
-                    logger.info(f"Используем файл из поля file: {file_path}")
-                
-                # Отправляем ВСЕ файлы отдельными сообщениями
-                django_project_path = os.path.dirname(self.db_path)  # /var/www/modelix
-                files_sent = 0
-                
-                for file_path_str in all_files:
-                    if not file_path_str:
-                        continue
-                    
-                    # Пробуем несколько вариантов путей
-                    possible_paths = [
-                        os.path.join(django_project_path, 'media', file_path_str),
-                        os.path.join(django_project_path, file_path_str),
-                        file_path_str
-                    ]
-                    
-                    full_file_path = None
-                    for path in possible_paths:
-                        if os.path.exists(path):
-                            full_file_path = path
-                            break
-                    
-                    if full_file_path:
-                        try:
-                            with open(full_file_path, 'rb') as file:
-                                await self.bot.send_document(
-                                    chat_id=self.channel_id,
-                                    document=file,
-                                    parse_mode='HTML'
-                                )
-                            logger.info(f"Файл отправлен: {full_file_path}")
-                            files_sent += 1
-                        except Exception as file_error:
-                            logger.error(f"Ошибка отправки файла {full_file_path}: {file_error}")
-                    else:
-                        logger.warning(f"Файл не найден: {file_path_str}")
-                
-                if files_sent > 0:
-                    logger.info(f"Отправлено файлов: {files_sent} из {len(all_files)}")
-                elif all_files:
-                    logger.warning(f"Файлы найдены в БД но не отправлены: {all_files}")
-                
-                self.last_print_order_id = order_id
-                self.save_state()  # Сохраняем состояние после каждой заявки
-                logger.info(f"Обновлен last_print_order_id до {self.last_print_order_id}")
+            message = self.format_print_order(order)
             
-            conn.close()
+            # Файлы заявки из таблицы вложений (найдена по схеме, см. AttachmentSchema)
+            all_files = list(files_by_order.get(order_id, []))
             
-            if new_orders:
-                logger.info(f"Обработано {len(new_orders)} новых заявок на печать")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при проверке заявок на печать: {e}")
+            # Если не нашли в связанных таблицах, пробуем поле file из main_printorder
+            if not all_files and file_path and str(file_path).strip():
+                all_files.append(str(file_path).strip())
+                logger.info(f"Используем файл из поля file: {file_path}")
+            
+            items.append((order_id, self.route({
+                'text': message,
+                'files': all_files,
+                'name': name,
+                'created_at': created_timestamp(order.created_at),
+            }, 'print_order', order.service_type)))
+        return items
+    
+    def route(self, payload, kind, service_type=None):
+        """Записать в payload чаты заявки, если это не только канал по умолчанию
+        
+        Чаты выбираются при постановке в outbox: смена ROUTES не перенаправляет уже стоящие в очереди заявки.
+        """
+        if self.router:
+            chats = self.router.targets(kind, service_type)
+            if chats != [self.channel_id]:
+                payload['chats'] = chats
+        return payload
+    
+    async def enqueue_batch(self, batch):
+        """Сформировать уведомления пачки и записать их в outbox (стадия форматирования)
+        
+        Возвращает новые записи outbox для отправки.
+        """
+        if batch.kind == 'print_order':
+            items = self.format_print_orders(batch.rows, batch.files_by_order)
+        else:
+            items = self.format_call_requests(batch.rows)
+        
+        # Пачка в outbox, новый курсор, индекс дублей, поисковый индекс и статистика — одной транзакцией
+        last_id = batch.rows[-1].id
+        cursor_name = f'last_{batch.kind}_id'
+        changes = self.dedup.take_changes()
+        entries = self.lead_index.entries(batch.kind, batch.rows)
+        
+        def write_indexes(conn, created):
+            self.dedup.write(conn, changes)
+            self.lead_index.write(conn, entries)
+            # Считаем только заявки, впервые попавшие в outbox: перечитанные после
+            # отката курсора (и дубли звонков) статистику не увеличивают
+            ids = {item.source_id for item in created}
+            rows = [row for row in batch.rows if row.id in ids]
+            self.stats.write(conn, self.stats.entries(batch.kind, rows, created_timestamp))
+        
+        try:
+            created = await asyncio.to_thread(
+                self.state.enqueue, batch.kind, items, cursor_name, last_id, also=write_indexes,
+            )
+        except Exception:
+            self.dedup.rollback(changes)
+            raise
+        skipped = len(items) - len(created)
+        if skipped:
+            self.metrics.skipped.inc(skipped, kind=batch.kind)
+        now = time.time()
+        for item in created:
+            self.trace.record(item.kind, item.source_id, 'detect', item.payload.get('created_at'), batch.read_at)
+            self.trace.record(item.kind, item.source_id, 'format', batch.read_at, now)
+            self.trace.queued(item.kind, item.source_id, now)
+        logger.info(f"Обработано {len(batch.rows)} новых заявок ({batch.kind}), {cursor_name}={last_id}")
+        return created
+    
+    async def rewind_cursors(self):
+        """Вернуть курсоры чтения к сохранённым (пачка не попала в outbox и будет прочитана заново)"""
+        cursors = await asyncio.to_thread(self.state.get_cursors)
+        self.last_call_request_id = cursors.get('last_call_request_id', 0)
+        self.last_print_order_id = cursors.get('last_print_order_id', 0)
+    
+    async def deliver_item(self, item):
+        """Отправить одну запись outbox во все её чаты; False — оставить её в очереди
+        
+        Файлы, уже отправленные вместе с неудавшейся сводкой (files_sent), не загружаются повторно.
+        """
+        chats = item.payload.get('chats') or [self.channel_id]
+        text = item.payload['text']
+        if item.kind == 'print_order':
+            files = [] if item.payload.get('files_sent') else item.payload.get('files', [])
+            return await self.deliver_print_order(item.source_id, text, files, chats=chats)
+        lead = ('call_request', item.source_id, text)
+        return await self.fan_out(
+            'call_request', item.source_id, chats,
+            lambda chat_id: self.send_notification(text, lead=lead, chat_id=chat_id),
+        )
+    
+    async def deliver_item_files(self, item):
+        """Отправить только вложения записи outbox (её текст уйдёт в сводке)"""
+        files = item.payload.get('files') if item.kind == 'print_order' else None
+        if not files:
+            return True
+        name = item.payload.get('name')
+        caption = "📎 <b>Файлы заявки на печать</b>" + (f": {escape(name)}" if name else "")
+        return await self.deliver_print_order(item.source_id, caption, files, text_in_digest=True)
+    
+    def observe_request(self, method, seconds, error):
+        """Итог одного запроса к Bot API (вызывается очередью отправки)"""
+        if isinstance(error, RetryAfter):
+            result = 'retry_after'
+            self.metrics.retry_after.inc()
+        else:
+            result = 'ok' if error is None else 'error'
+        self.metrics.send_latency.observe(seconds, method=method, result=result)
+    
+    def cursor_lag(self):
+        """Сколько id в таблицах Django ещё не прочитано (для метрики, вызывается в потоке)"""
+        lag = {}
+        for table, last_id in (('main_callrequest', self.last_call_request_id),
+                               ('main_printorder', self.last_print_order_id)):
+            max_id = self.db.execute(f"SELECT MAX(id) FROM {table}")[0][0] or 0
+            lag[(table,)] = max(0, max_id - last_id)
+        return lag
+    
+    async def send_digest(self, texts):
+        """Отправить сводку из нескольких заявок одним сообщением"""
+        logger.info(f"Отправляем сводку из {len(texts)} заявок")
+        return await self.send_notification(render_digest(texts))
     
     def load_state(self):
-        """Загрузить состояние из файла"""
+        """Загрузить курсоры из базы состояния (при первом запуске — из bot_state.json или БД)"""
         try:
-            logger.info(f"Проверяем файл состояния: {self.state_file}")
-            if os.path.exists(self.state_file):
-                with open(self.state_file, 'r') as f:
-                    state = json.load(f)
-                    self.last_call_request_id = state.get('last_call_request_id', 0)
-                    self.last_print_order_id = state.get('last_print_order_id', 0)
-                    logger.info(f"Состояние загружено из {self.state_file}: звонки ID={self.last_call_request_id}, печать ID={self.last_print_order_id}")
+            if self.site.name == 'default' and self.state.migrate_json_state(self.state_file):
+                logger.info(f"Старый файл состояния {self.state_file} перенесён в {self.state_db_path}")
+            cursors = self.state.get_cursors()
+            if cursors:
+                self.last_call_request_id = cursors.get('last_call_request_id', 0)
+                self.last_print_order_id = cursors.get('last_print_order_id', 0)
+                logger.info(f"Состояние загружено из {self.state_db_path}: звонки ID={self.last_call_request_id}, печать ID={self.last_print_order_id}")
             else:
-                logger.info(f"Файл состояния не найден по пути {self.state_file}, начинаем с текущих максимальных ID")
+                logger.info(f"Состояние в {self.state_db_path} пустое, начинаем с текущих максимальных ID")
                 self.initialize_from_db()
         except Exception as e:
-            logger.error(f"Ошибка загрузки состояния из {self.state_file}: {e}")
+            logger.error(f"Ошибка загрузки состояния из {self.state_db_path}: {e}")
             self.initialize_from_db()
     
     def save_state(self):
-        """Сохранить состояние в файл"""
+        """Сохранить курсоры в базу состояния"""
         try:
-            state = {
+            self.state.set_cursors({
                 'last_call_request_id': self.last_call_request_id,
                 'last_print_order_id': self.last_print_order_id
-            }
-            with open(self.state_file, 'w') as f:
-                json.dump(state, f)
-            logger.info(f"Состояние сохранено в {self.state_file}: звонки={self.last_call_request_id}, печать={self.last_print_order_id}")
+            })
+            logger.info(f"Состояние сохранено в {self.state_db_path}: звонки={self.last_call_request_id}, печать={self.last_print_order_id}")
         except Exception as e:
-            logger.error(f"Ошибка сохранения состояния в {self.state_file}: {e}")
+            logger.error(f"Ошибка сохранения состояния в {self.state_db_path}: {e}")
     
     def initialize_from_db(self):
         """Инициализация из БД (только при первом запуске)"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
             # Получить последний ID заявки на звонок
-            cursor.execute("SELECT MAX(id) FROM main_callrequest")
-            result = cursor.fetchone()
+            result = self.db.execute("SELECT MAX(id) FROM main_callrequest")[0]
             self.last_call_request_id = result[0] if result[0] else 0
             
             # Получить последний ID заявки на печать
-            cursor.execute("SELECT MAX(id) FROM main_printorder")
-            result = cursor.fetchone()
+            result = self.db.execute("SELECT MAX(id) FROM main_printorder")[0]
             self.last_print_order_id = result[0] if result[0] else 0
             
-            conn.close()
-            
             # Сохранить состояние
             self.save_state()
             
@@ -423,46 +803,307 @@ class ModelixNotificationBot:
     async def initialize(self):
         """Инициализация бота"""
         try:
-            # Загружаем состояние из файла
+            # Загружаем состояние из базы состояния
             self.load_state()
+            self.dedup.load()
+            self.state.purge_delivered(OUTBOX_RETENTION)
+            self.status_sync.purge()
+            self.stats.purge()
+            self.file_cache.evict()
             
             logger.info("Бот будет отслеживать только НОВЫЕ заявки после последней обработанной")
             
+            # Соединение с Telegram (через прокси) открываем заранее (общий Bot — в run_sites())
+            if self.owns_telegram:
+                await warm_up(self.bot)
+            
             # Отправить уведомление о запуске
-            await self.send_notification("<b>Бот уведомлений Modelix запущен</b>\n\n"
+            site = '' if self.site.name == 'default' else f" ({escape(self.site.name)})"
+            await self.send_notification(f"<b>Бот уведомлений Modelix запущен</b>{site}\n\n"
                                         "Отслеживание новых заявок активировано.")
             
         except Exception as e:
             logger.error(f"Ошибка инициализации: {e}")
             raise
     
+    def on_ingest_event(self, kind, object_id):
+        """Событие от Django: заявка уже закоммичена — читаем БД сразу, не дожидаясь проверки"""
+        cursor = self.last_print_order_id if kind == 'print_order' else self.last_call_request_id
+        if object_id <= cursor:
+            return
+        logger.info(f"Событие от Django: {kind} ID={object_id}")
+        self.recheck_pending = True
+        self.pipeline.wake()
+    
+    async def check_for_updates(self):
+        """Прочитать обе таблицы, если с прошлой проверки в БД были коммиты
+        
+        Отдаёт страницы новых строк (RowBatch) для стадии форматирования по мере чтения.
+        """
+        started = time.perf_counter()
+        changed = await asyncio.to_thread(self.db.has_changed)
+        if not (changed or self.recheck_pending):
+            return
+        self.recheck_pending = False
+        # Журнал изменений читается только после коммитов в БД Django
+        self.status_sync.wake()
+        # В длительность проверки не входит ожидание стадии форматирования
+        elapsed = 0.0
+        # Сначала проверяем печать, потом звонки (чтобы избежать дублей)
+        for pages in (self.check_new_print_orders(), self.check_new_call_requests()):
+            async for batch in pages:
+                elapsed += time.perf_counter() - started
+                yield batch
+                started = time.perf_counter()
+        elapsed += time.perf_counter() - started
+        self.metrics.poll_duration.observe(elapsed)
+    
     async def run(self, interval=30):
-        """Запустить бота с указанным интервалом проверки (в секундах)"""
+        """Запустить бота; interval — страховочный период проверки (в секундах)
+
+        Между проверками цикл спит до изменения БД Django (см. DatabaseWatcher)
+        или до истечения interval, если изменений не было. События от Django
+        по сокету (TELEGRAM_BOT_SOCKET) будят стадию чтения сразу.
+        """
         logger.info(f"Запуск бота с интервалом проверки {interval} секунд")
         
         await self.initialize()
-        
-        while True:
+        await self.watcher.start()
+        await self.pipeline.start()
+        await self.status_sync.start()
+        if self.commands is not None:
+            await self.commands.start()
+        summary_at = getattr(config, 'STATS_DAILY_SUMMARY_AT', '')
+        if summary_at:
+            await self.stats.start_daily(self, summary_at)
+        if self.ingest is not None:
             try:
-                # Сначала проверяем печать, потом звонки (чтобы избежать дублей)
-                await self.check_new_print_orders()
-                await self.check_new_call_requests()
-                await asyncio.sleep(interval)
-            except KeyboardInterrupt:
-                logger.info("Остановка бота...")
-                await self.send_notification("🛑 <b>Бот уведомлений Modelix остановлен</b>")
-                break
-            except Exception as e:
-                logger.error(f"Ошибка в основном цикле: {e}")
-                await asyncio.sleep(interval)
+                await self.ingest.start()
+            except OSError as e:
+                # Без сокета заявки всё равно придут через отслеживание БД
+                logger.error(f"Не удалось открыть сокет {self.ingest.path}: {e}")
+        if self.metrics_server is not None:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"Не удалось открыть порт метрик {self.metrics_server.port}: {e}")
+        keepalive_task = asyncio.create_task(keep_alive(self.bot)) if self.owns_telegram else None
+        
+        try:
+            while True:
+                try:
+                    self.pipeline.wake()
+                    await self.watcher.wait(interval)
+                except KeyboardInterrupt:
+                    logger.info("Остановка бота...")
+                    await self.send_notification("🛑 <b>Бот уведомлений Modelix остановлен</b>")
+                    break
+                except Exception as e:
+                    logger.error(f"Ошибка в основном цикле: {e}")
+                    await asyncio.sleep(interval)
+        finally:
+            if keepalive_task is not None:
+                keepalive_task.cancel()
+            if self.ingest is not None:
+                await self.ingest.close()
+            if self.metrics_server is not None:
+                await self.metrics_server.close()
+            if self.commands is not None:
+                await self.commands.stop()
+            await self.stats.stop()
+            await self.status_sync.stop()
+            await self.pipeline.stop()
+            for task in self.deliveries.values():
+                task.cancel()
+            await asyncio.gather(*self.deliveries.values(), return_exceptions=True)
+            if self.owns_telegram:
+                await self.sender.close()
+                # Bot.shutdown() закрывает и соединение get_updates, если команды его открывали
+                await self.bot.shutdown()
+                await self.bot.request.shutdown()
+            self.watcher.close()
+            self.db.close()
+            self.state.close()
+            self.attachments.close()
 
 
 async def main():
     """Главная функция"""
-    bot = ModelixNotificationBot()
-    await bot.run(interval=30)
+    sites = load_sites(config)
+    interval = getattr(config, 'CHECK_INTERVAL', 30)
+    if len(sites) > 1:
+        await run_sites(sites, interval=interval)
+    else:
+        bot = ModelixNotificationBot(sites[0])
+        await bot.run(interval=interval)
 
 
-if __name__ == '__main__':
-    asyncio.run(main())
+async def run_sites(sites, interval=30):
+    """Несколько сайтов в одном event loop
+    
+    Bot (пул HTTP-соединений), очередь отправки с общим лимитом частоты,
+    метрики и опрос команд — общие. У каждого сайта свои БД Django, media,
+    канал, база состояния (курсоры, outbox, индекс дублей) и отслеживание
+    изменений. Когда общего лимита не хватает, он делится между сайтами по
+    очереди (см. FairShare), и поток заявок одного сайта не задерживает другие.
+    """
+    if resolve_proxy_url():
+        logger.info("Telegram API через прокси (TELEGRAM_PROXY_URL / TELEGRAM_PROXY)")
+    telegram = create_telegram_bot(BOT_TOKEN)
+    metrics = BotMetrics()
+    sender = create_send_queue(telegram)
+    bots = [
+        ModelixNotificationBot(site, telegram=telegram, sender=sender.for_tenant(site.name), metrics=metrics)
+        for site in sites
+    ]
+    sender.on_request = bots[0].observe_request
+    # Метрики — суммой по сайтам
+    metrics.queue_depth.collect = lambda: {
+        ('pipeline',): sum(bot.pipeline.depth for bot in bots),
+        ('telegram',): sender.depth,
+    }
+    metrics.cursor_lag.collect = lambda: _sum_lags(bot.cursor_lag() for bot in bots)
+    metrics_port = getattr(config, 'METRICS_PORT', 0)
+    metrics_server = MetricsServer(
+        metrics, host=getattr(config, 'METRICS_HOST', '127.0.0.1'), port=metrics_port
+    ) if metrics_port else None
+    commands = None
+    if getattr(config, 'BOT_COMMANDS', False):
+        commands = LeadCommands(
+            bots[0], bots[0].lead_index, stats=bots[0].stats, chats=bots[0].site.command_chats,
+            retry_delay=interval,
+        )
+        for bot in bots[1:]:
+            commands.add_site(bot, bot.lead_index, stats=bot.stats, chats=bot.site.command_chats)
+    # Имя сайта в логах его задач
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(SiteLogFilter())
+    logger.info(f"Сайтов: {len(bots)} ({', '.join(site.name for site in sites)})")
+    
+    tasks = []
+    keepalive_task = None
+    try:
+        await warm_up(telegram)
+        for bot in bots:
+            # Задача сайта копирует контекст вместе с current_site
+            token = current_site.set(bot.site.name)
+            tasks.append(asyncio.create_task(_run_site(bot, interval)))
+            current_site.reset(token)
+        if commands is not None:
+            await commands.start()
+        if metrics_server is not None:
+            try:
+                await metrics_server.start()
+            except OSError as e:
+                logger.error(f"Не удалось открыть порт метрик {metrics_server.port}: {e}")
+        keepalive_task = asyncio.create_task(keep_alive(telegram))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if keepalive_task is not None:
+            keepalive_task.cancel()
+        if commands is not None:
+            await commands.stop()
+        if metrics_server is not None:
+            await metrics_server.close()
+        await sender.close()
+        await telegram.shutdown()
+        await telegram.request.shutdown()
+
+
+async def _run_site(bot, interval):
+    """Ошибка одного сайта (нет БД и т.п.) не останавливает остальные"""
+    try:
+        await bot.run(interval=interval)
+    except Exception as e:
+        logger.error(f"Сайт {bot.site.name} остановлен из-за ошибки: {e}")
+
+
+def _sum_lags(lags):
+    total = {}
+    for lag in lags:
+        for key, value in lag.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def select_sites(name=None):
+    """Сайты для команд CLI: все или один по имени (--site)"""
+    sites = load_sites(config)
+    if name is None:
+        return sites
+    selected = [site for site in sites if site.name == name]
+    if not selected:
+        raise SystemExit(f"Сайт {name} не найден, есть: {', '.join(site.name for site in sites)}")
+    return selected
 
+
+def trace_report(hours, kind=None, site=None):
+    """Перцентили задержек по этапам доставки за последние hours часов"""
+    site = site or single_site(config)
+    state = StateStore(site.state_db_path)
+    try:
+        rows = TraceJournal(state).report(time.time() - hours * 3600, kind=kind)
+    finally:
+        state.close()
+    title = f"Этапы доставки заявок за {hours:g} ч" + (f" ({kind})" if kind else "")
+    if site.name != 'default':
+        title += f", сайт {site.name}"
+    print(title)
+    print(format_report(rows))
+
+
+def index_leads(page_size=DEFAULT_PAGE_SIZE, site=None):
+    """Добавить в поисковый индекс все заявки из БД Django (повторный запуск обновляет их)"""
+    site = site or single_site(config)
+    state = StateStore(site.state_db_path)
+    db = DjangoDatabase(site.db_path)
+    try:
+        index = LeadIndex(state)
+        if not index.available:
+            return
+        for kind, fetch in (('call_request', fetch_call_requests), ('print_order', fetch_print_orders)):
+            after_id = total = 0
+            while True:
+                rows = fetch(db, after_id, page_size)
+                if not rows:
+                    break
+                index.add(kind, rows)
+                after_id = rows[-1].id
+                total += len(rows)
+            print(f"{kind}: проиндексировано заявок {total}")
+        print(f"Всего в индексе: {index.count()}")
+    finally:
+        db.close()
+        state.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Бот уведомлений Modelix")
+    parser.add_argument('--site', help="только этот сайт из SITES (для команд; по умолчанию все)")
+    commands = parser.add_subparsers(dest='command')
+    report_parser = commands.add_parser('trace-report', help="p50/p95/p99 задержек по этапам доставки")
+    report_parser.add_argument('--hours', type=float, default=24, help="период отчёта в часах (по умолчанию 24)")
+    report_parser.add_argument('--kind', choices=['call_request', 'print_order'], help="только заявки этого вида")
+    changelog_parser = commands.add_parser(
+        'install-changelog', help="триггеры журнала изменений в БД Django (правка сообщений при обработке заявки)"
+    )
+    changelog_parser.add_argument('--uninstall', action='store_true', help="удалить журнал и триггеры")
+    commands.add_parser('index-leads', help="добавить все заявки из БД Django в индекс поиска (/find, /lead)")
+    args = parser.parse_args()
+    
+    if args.command is None:
+        asyncio.run(main())
+    else:
+        for site in select_sites(args.site):
+            if args.command == 'trace-report':
+                trace_report(args.hours, args.kind, site=site)
+            elif args.command == 'install-changelog':
+                install_change_log(site.db_path, uninstall=args.uninstall)
+                print(("Журнал изменений удалён из " if args.uninstall else "Журнал изменений установлен в ") + site.db_path)
+            elif args.command == 'index-leads':
+                if site.name != 'default':
+                    print(f"Сайт {site.name}")
+                index_leads(site=site)
@@ -0,0 +1,303 @@
+"""Журнал изменений заявок в БД Django (триггеры SQLite) и правка уже отправленных сообщений.
+
+Установщик (``python bot.py install-changelog``) добавляет в БД Django
+таблицу ``modelix_bot_changelog`` и триггеры AFTER INSERT / AFTER UPDATE на
+``main_callrequest`` и ``main_printorder``. Бот читает журнал по номеру
+записи (seq) после своего курсора — стоимость синхронизации зависит от числа
+изменений, а не от размера таблиц — и правит отправленное раньше сообщение
+заявки (``edit_message_text`` / ``edit_message_caption``), если его текст
+изменился, например, менеджер отметил заявку обработанной.
+
+После миграций Django, пересоздающих таблицы заявок, триггеры пропадают —
+установщик нужно запустить снова.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import time
+
+from telegram.error import BadRequest, TelegramError
+
+from db_rows import fetch_call_requests_by_ids, fetch_print_orders_by_ids
+from send_queue import is_permanent_error
+
+logger = logging.getLogger(__name__)
+
+CHANGELOG_TABLE = "modelix_bot_changelog"
+
+# Сколько последних записей журнала хранить в БД Django (более старые удаляет триггер)
+CHANGELOG_KEEP = 10000
+
+# Таблица Django -> вид заявки в outbox
+TABLES = {
+    "main_callrequest": "call_request",
+    "main_printorder": "print_order",
+}
+
+# Unix-время с долями секунды (unixepoch('subsec') есть только с SQLite 3.42)
+_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+
+def install_script(keep: int = CHANGELOG_KEEP) -> str:
+    parts = [f"""
+CREATE TABLE IF NOT EXISTS {CHANGELOG_TABLE} (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tbl TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+DROP TRIGGER IF EXISTS {CHANGELOG_TABLE}_trim;
+CREATE TRIGGER {CHANGELOG_TABLE}_trim AFTER INSERT ON {CHANGELOG_TABLE}
+BEGIN
+    DELETE FROM {CHANGELOG_TABLE} WHERE seq <= NEW.seq - {int(keep)};
+END;
+"""]
+    for table in TABLES:
+        for op, event in (("insert", "INSERT"), ("update", "UPDATE")):
+            trigger = f"modelix_bot_{table}_{op}"
+            parts.append(f"""
+DROP TRIGGER IF EXISTS {trigger};
+CREATE TRIGGER {trigger} AFTER {event} ON {table}
+BEGIN
+    INSERT INTO {CHANGELOG_TABLE} (tbl, row_id, op, ts) VALUES ('{table}', NEW.id, '{op}', {_NOW});
+END;
+""")
+    return "".join(parts)
+
+
+def uninstall_script() -> str:
+    triggers = [f"modelix_bot_{table}_{op}" for table in TABLES for op in ("insert", "update")]
+    triggers.append(f"{CHANGELOG_TABLE}_trim")
+    return "".join(f"DROP TRIGGER IF EXISTS {name};\n" for name in triggers) + \
+        f"DROP TABLE IF EXISTS {CHANGELOG_TABLE};\n"
+
+
+def install(db_path: str, uninstall: bool = False):
+    """Установить (или удалить) журнал и триггеры; нужна запись в БД Django."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA busy_timeout = 5000")
+        script = uninstall_script() if uninstall else install_script()
+        conn.executescript(f"BEGIN IMMEDIATE;\n{script}COMMIT;\n")
+    finally:
+        conn.close()
+
+
+# Заявка может быть отправлена в несколько чатов (ROUTES) — по сообщению на чат
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent_messages (
+    kind TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    is_caption INTEGER NOT NULL,
+    base TEXT NOT NULL,
+    text TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (kind, source_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS sent_messages_sent_at ON sent_messages (sent_at);
+"""
+
+SELECT_TABLE = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+SELECT_MAX_SEQ = f"SELECT COALESCE(MAX(seq), 0) FROM {CHANGELOG_TABLE}"
+SELECT_CHANGES = f"SELECT seq, tbl, row_id, op, ts FROM {CHANGELOG_TABLE} WHERE seq > ? ORDER BY seq LIMIT ?"
+
+CURSOR_NAME = "last_changelog_seq"
+
+# Ошибки правки, после которых сообщение больше не пытаемся править
+_GONE_ERRORS = ("message to edit not found", "message can't be edited", "chat not found")
+
+
+class StatusSync:
+    """Читает журнал изменений и правит сообщения заявок, отправленные ботом.
+
+    Текст сообщения запоминается при отправке (``remember``) вместе с
+    исходным текстом заявки (``base``): всё, что бот добавил после него
+    (ссылки на большие файлы и т.п.), сохраняется при правке. Сообщения
+    сводок не запоминаются и не правятся.
+
+    Заявки, которые ждут обработки в статистике (``bot.stats``), при
+    отметке обработанными попадают в неё в одной транзакции со сдвигом курсора.
+    """
+
+    def __init__(self, bot, page_size: int = 200, retention: float = 30 * 24 * 3600, retry_delay: float = 30):
+        self.bot = bot
+        self.state = bot.state
+        self.page_size = page_size
+        self.retention = retention
+        self.retry_delay = retry_delay
+        self.available: bool | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.state.ensure_schema(STATE_SCHEMA)
+
+    # --- сообщения (база состояния, вызывается в потоке) ---
+
+    def remember(self, kind: str, source_id: int, chat_id: int, message_id: int, base: str, text: str,
+                 is_caption: bool = False):
+        with self.state.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sent_messages "
+                "(kind, source_id, chat_id, message_id, is_caption, base, text, sent_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, source_id, chat_id, message_id, int(is_caption), base, text, time.time()),
+            )
+
+    def purge(self):
+        with self.state.transaction() as conn:
+            conn.execute("DELETE FROM sent_messages WHERE sent_at < ?", (time.time() - self.retention,))
+
+    def _update(self, kind: str, source_id: int, chat_id: int, base: str, text: str):
+        with self.state.transaction() as conn:
+            conn.execute(
+                "UPDATE sent_messages SET base = ?, text = ? WHERE kind = ? AND source_id = ? AND chat_id = ?",
+                (base, text, kind, source_id, chat_id),
+            )
+
+    def _forget(self, kind: str, source_id: int, chat_id: int):
+        with self.state.transaction() as conn:
+            conn.execute(
+                "DELETE FROM sent_messages WHERE kind = ? AND source_id = ? AND chat_id = ?",
+                (kind, source_id, chat_id),
+            )
+
+    # --- цикл синхронизации ---
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                done = await self.sync()
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации статусов заявок: {e}")
+                done = False
+            if not done:
+                # Курсор не сдвинут — повторим позже, даже если новых изменений не будет
+                await asyncio.sleep(self.retry_delay)
+                self._wakeup.set()
+
+    def _check_available(self) -> bool:
+        available = bool(self.bot.db.execute(SELECT_TABLE, (CHANGELOG_TABLE,)))
+        if available != self.available:
+            if available:
+                logger.info(f"Журнал изменений {CHANGELOG_TABLE} найден, статусы заявок синхронизируются")
+            elif self.available is not None:
+                logger.warning(f"Журнал изменений {CHANGELOG_TABLE} пропал из БД Django")
+            self.available = available
+        return available
+
+    def _read_page(self, after_seq: int):
+        """Страница журнала и всё, что нужно для правки (в потоке).
+
+        Возвращает (последний seq, правки [(kind, id, сообщение, строка), ...],
+        обработанные заявки для статистики [(kind, id, created_at, время отметки), ...]).
+        """
+        rows = self.bot.db.execute(SELECT_CHANGES, (after_seq, self.page_size))
+        if not rows:
+            return None, [], []
+        # Вид заявки -> {id: время последнего изменения на странице}
+        changed: dict[str, dict[int, float]] = {}
+        for _seq, table, row_id, op, ts in rows:
+            if op == "update" and table in TABLES:
+                changed.setdefault(TABLES[table], {})[row_id] = ts
+        edits, processed = [], []
+        for kind, updated in changed.items():
+            sent = {}
+            for source_id in updated:
+                found = self.state.query(
+                    "SELECT chat_id, message_id, is_caption, base, text FROM sent_messages "
+                    "WHERE kind = ? AND source_id = ?", (kind, source_id),
+                )
+                if found:
+                    sent[source_id] = found
+            pending = self.bot.stats.pending(kind, updated)
+            if not sent and not pending:
+                continue
+            fetch = fetch_print_orders_by_ids if kind == "print_order" else fetch_call_requests_by_ids
+            for row in fetch(self.bot.db, sorted(set(sent) | set(pending))):
+                for message in sent.get(row.id, ()):
+                    edits.append((kind, row.id, message, row))
+                if row.id in pending and row.is_processed:
+                    processed.append((kind, row.id, pending[row.id], updated[row.id]))
+        return rows[-1][0], edits, processed
+
+    async def sync(self) -> bool:
+        """Обработать журнал после курсора; False — правку нужно повторить позже."""
+        if not await asyncio.to_thread(self._check_available):
+            return True
+        cursors = await asyncio.to_thread(self.state.get_cursors)
+        if CURSOR_NAME not in cursors:
+            # Первый запуск с журналом: старые изменения не переигрываем
+            last_seq = (await asyncio.to_thread(self.bot.db.execute, SELECT_MAX_SEQ))[0][0]
+            await asyncio.to_thread(self.state.set_cursors, {CURSOR_NAME: last_seq})
+            return True
+        cursor = cursors[CURSOR_NAME]
+        while True:
+            last_seq, edits, processed = await asyncio.to_thread(self._read_page, cursor)
+            if last_seq is None:
+                return True
+            for kind, source_id, sent, row in edits:
+                if not await self._edit(kind, source_id, sent, row):
+                    return False
+            cursor = last_seq
+            await asyncio.to_thread(
+                self.state.set_cursors, {CURSOR_NAME: cursor},
+                also=lambda conn: self.bot.stats.record_processed(conn, processed),
+            )
+
+    async def _edit(self, kind: str, source_id: int, sent, row) -> bool:
+        chat_id, message_id, is_caption, base, text = sent
+        new_base = self.bot.format_print_order(row) if kind == "print_order" else self.bot.format_call_request(row)
+        # Добавленное ботом после текста заявки (ссылки на большие файлы) остаётся
+        new_text = new_base + text[len(base):] if text.startswith(base) else new_base
+        if new_text == text:
+            return True
+        try:
+            if is_caption:
+                await self.bot.sender.call(
+                    chat_id, "edit_message_caption", message_id=message_id, caption=new_text, parse_mode="HTML"
+                )
+            else:
+                await self.bot.sender.call(
+                    chat_id, "edit_message_text", message_id=message_id, text=new_text,
+                    parse_mode="HTML", disable_web_page_preview=True,
+                )
+        except BadRequest as e:
+            reason = str(e).lower()
+            if "message is not modified" in reason:
+                pass
+            elif any(error in reason for error in _GONE_ERRORS):
+                logger.warning(f"Сообщение заявки {kind} ID={source_id} больше нельзя править: {e}")
+                await asyncio.to_thread(self._forget, kind, source_id, chat_id)
+                return True
+            else:
+                logger.error(f"Не удалось обновить сообщение заявки {kind} ID={source_id}: {e}")
+                return True
+        except TelegramError as e:
+            if is_permanent_error(e):
+                logger.error(f"Не удалось обновить сообщение заявки {kind} ID={source_id}: {e}")
+                return True
+            logger.warning(f"Обновление сообщения заявки {kind} ID={source_id} отложено: {e}")
+            return False
+        await asyncio.to_thread(self._update, kind, source_id, chat_id, new_base, new_text)
+        logger.info(f"Сообщение заявки {kind} ID={source_id} обновлено")
+        return True
@@ -0,0 +1,118 @@
+"""Долгоживущее read-only соединение с SQLite-базой Django."""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DjangoDatabase:
+    """Одно соединение на всё время работы бота вместо connect/close на каждой проверке.
+
+    - база открывается в режиме ``mode=ro`` (бот не может ничего записать и не
+      берёт блокировку записи);
+    - подготовленные запросы переиспользуются кэшем ``cached_statements``
+      (ключ — текст SQL, поэтому запросы держим в константах);
+    - при ошибке SQLite или подмене файла базы соединение открывается заново;
+    - ``has_changed()`` по ``PRAGMA data_version`` позволяет пропустить SELECT,
+      если с прошлой проверки никто ничего не закоммитил.
+
+    Запросы выполняются в пуле потоков (см. bot.py), поэтому доступ к
+    соединению сериализован блокировкой.
+    """
+
+    def __init__(self, db_path: str, busy_timeout_ms: int = 5000, cached_statements: int = 64):
+        self.db_path = os.path.abspath(db_path)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._conn: sqlite3.Connection | None = None
+        self._file_id: tuple[int, int] | None = None
+        self._last_data_version: int | None = None
+        self._lock = threading.RLock()
+
+    def _stat_file_id(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self.db_path)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro",
+            uri=True,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        # Читатель в WAL не блокирует Django; busy_timeout — на случай checkpoint/rollback-журнала
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        self._file_id = self._stat_file_id()
+        self._last_data_version = None
+        logger.info(f"Открыто read-only соединение с БД {self.db_path}")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Вернуть открытое соединение, переподключившись при подмене файла базы."""
+        with self._lock:
+            return self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            file_id = self._stat_file_id()
+            if file_id is not None and file_id != self._file_id:
+                logger.info(f"Файл БД {self.db_path} был заменён, переподключаемся")
+                self.reset()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def execute(self, sql: str, params=()) -> list:
+        """Выполнить запрос; при ошибке SQLite один раз переподключиться и повторить.
+
+        Возвращает все строки результата (курсор не держит чтение открытым).
+        """
+        with self._lock:
+            try:
+                return self._connection().execute(sql, params).fetchall()
+            except sqlite3.DatabaseError as e:
+                logger.warning(f"Ошибка SQLite ({e}), переподключаемся к БД")
+                self.reset()
+                return self._connection().execute(sql, params).fetchall()
+
+    def data_version(self) -> int:
+        """Текущее значение PRAGMA data_version этого соединения."""
+        return self.execute("PRAGMA data_version")[0][0]
+
+    def has_changed(self) -> bool:
+        """Были ли коммиты в базу с прошлого вызова (после переподключения — всегда да)."""
+        with self._lock:
+            try:
+                version = self.data_version()
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось прочитать PRAGMA data_version: {e}")
+                self.reset()
+                return True
+            changed = version != self._last_data_version
+            self._last_data_version = version
+            return changed
+
+    def reset(self):
+        """Закрыть соединение; следующее обращение откроет его заново."""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except sqlite3.Error:
+                    pass
+            self._conn = None
+            self._file_id = None
+            self._last_data_version = None
+
+    def close(self):
+        """Закрыть соединение при остановке бота."""
+        self.reset()
@@ -0,0 +1,102 @@
+"""Строки таблиц заявок Django: типизированные кортежи и постраничные запросы к ним."""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+
+class CallRequestRow(NamedTuple):
+    id: int
+    name: str
+    phone: str
+    created_at: str
+    is_processed: int
+
+
+class PrintOrderRow(NamedTuple):
+    id: int
+    name: str
+    phone: str
+    email: str
+    service_type: str
+    message: str
+    file: str
+    created_at: str
+    is_processed: int
+
+
+# Типы услуг заявки на печать (choices поля service_type в Django)
+SERVICE_TYPES = {
+    "other": "Другое",
+    "complex": "Комплекс услуг",
+    "3d_modeling": "3D моделирование",
+    "3d_printing": "3D печать",
+    "3d_scanning": "3D сканирование",
+    "reverse_engineering": "Реверс-инжиниринг",
+    "engineering": "Инжиниринг",
+    "post_processing": "Постобработка",
+}
+
+
+# Тексты запросов — константы: по ним sqlite3 находит подготовленные statement'ы в кэше.
+# Чтение по ключу (id > последний прочитанный) страницами по LIMIT строк: память
+# не зависит от размера накопившейся очереди, а отправка начинается с первой страницы
+SELECT_CALL_REQUESTS_PAGE = """
+    SELECT id, name, phone, created_at, is_processed
+    FROM main_callrequest
+    WHERE id > ?
+    ORDER BY id ASC
+    LIMIT ?
+"""
+
+SELECT_PRINT_ORDERS_PAGE = """
+    SELECT id, name, phone, email, service_type, message, file, created_at, is_processed
+    FROM main_printorder
+    WHERE id > ?
+    ORDER BY id ASC
+    LIMIT ?
+"""
+
+DEFAULT_PAGE_SIZE = 200
+
+
+def fetch_call_requests(db, after_id: int, limit: int = DEFAULT_PAGE_SIZE) -> list[CallRequestRow]:
+    """Страница заявок на звонок с id больше after_id."""
+    return [CallRequestRow._make(row) for row in db.execute(SELECT_CALL_REQUESTS_PAGE, (after_id, limit))]
+
+
+def fetch_print_orders(db, after_id: int, limit: int = DEFAULT_PAGE_SIZE) -> list[PrintOrderRow]:
+    """Страница заявок на печать с id больше after_id."""
+    return [PrintOrderRow._make(row) for row in db.execute(SELECT_PRINT_ORDERS_PAGE, (after_id, limit))]
+
+
+# Чтение по списку id (синхронизация статуса по журналу изменений, см. change_log.py);
+# число id в запросе ограничено размером страницы журнала
+SELECT_CALL_REQUESTS_BY_IDS = """
+    SELECT id, name, phone, created_at, is_processed
+    FROM main_callrequest
+    WHERE id IN ({})
+"""
+
+SELECT_PRINT_ORDERS_BY_IDS = """
+    SELECT id, name, phone, email, service_type, message, file, created_at, is_processed
+    FROM main_printorder
+    WHERE id IN ({})
+"""
+
+
+def _placeholders(ids) -> str:
+    return ", ".join("?" * len(ids))
+
+
+def fetch_call_requests_by_ids(db, ids) -> list[CallRequestRow]:
+    if not ids:
+        return []
+    sql = SELECT_CALL_REQUESTS_BY_IDS.format(_placeholders(ids))
+    return [CallRequestRow._make(row) for row in db.execute(sql, list(ids))]
+
+
+def fetch_print_orders_by_ids(db, ids) -> list[PrintOrderRow]:
+    if not ids:
+        return []
+    sql = SELECT_PRINT_ORDERS_BY_IDS.format(_placeholders(ids))
+    return [PrintOrderRow._make(row) for row in db.execute(sql, list(ids))]
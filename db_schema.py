@@ -0,0 +1,114 @@
+"""Поиск таблицы вложений заявок на печать по схеме БД Django (один раз, с кэшем)."""
+from __future__ import annotations
+
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+ORDER_TABLE = "main_printorder"
+
+# Известные варианты имён — проверяются первыми, в этом порядке
+CANDIDATE_TABLES = (
+    "main_printorderfile",
+    "main_printorder_file",
+    "main_orderfile",
+    "main_file",
+    "main_printorderfiles",
+)
+FK_COLUMNS = ("print_order_id", "order_id", "printorder_id")
+FILE_COLUMNS = ("file", "file_path")
+
+# Ограничение числа параметров в одном запросе (SQLITE_MAX_VARIABLE_NUMBER в старых сборках — 999)
+MAX_IN_PARAMS = 500
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class AttachmentSchema:
+    """Кэш найденной таблицы вложений: (таблица, колонка FK, колонка файла).
+
+    Схема читается из ``sqlite_master`` и ``PRAGMA table_info`` при первом
+    обращении и повторно — только если изменился ``PRAGMA schema_version``
+    (то есть Django применил миграцию).
+    """
+
+    def __init__(self):
+        self.table: str | None = None
+        self.fk_column: str | None = None
+        self.file_column: str | None = None
+        self._schema_version: int | None = None
+        self._select_sql: str | None = None
+
+    def ensure(self, db) -> bool:
+        """Обновить кэш при изменении схемы; True, если таблица вложений найдена."""
+        version = db.execute("PRAGMA schema_version")[0][0]
+        if version != self._schema_version:
+            self._discover(db)
+            self._schema_version = version
+        return self.table is not None
+
+    def _discover(self, db):
+        rows = db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'main\\_%' ESCAPE '\\'"
+        )
+        tables = {row[0] for row in rows}
+        ordered = [t for t in CANDIDATE_TABLES if t in tables]
+        ordered += sorted(t for t in tables if t not in CANDIDATE_TABLES and t != ORDER_TABLE)
+
+        self.table = self.fk_column = self.file_column = self._select_sql = None
+        for table in ordered:
+            found = self._match_table(db, table, known=table in CANDIDATE_TABLES)
+            if found:
+                self.table, self.fk_column, self.file_column = table, found[0], found[1]
+                self._select_sql = (
+                    f"SELECT {_quote(self.fk_column)}, {_quote(self.file_column)} "
+                    f"FROM {_quote(self.table)} WHERE {_quote(self.fk_column)} IN ({{placeholders}}) "
+                    f"ORDER BY {_quote(self.fk_column)}, rowid"
+                )
+                logger.info(
+                    f"Таблица вложений: {self.table} ({self.fk_column} -> {ORDER_TABLE}, файл в {self.file_column})"
+                )
+                return
+        logger.info("Таблица вложений заявок на печать не найдена, используется только поле file")
+
+    def _match_table(self, db, table: str, known: bool) -> tuple[str, str] | None:
+        """Вернуть (колонка FK, колонка файла) или None, если таблица не подходит."""
+        columns = {row[1] for row in db.execute(f"PRAGMA table_info({_quote(table)})")}
+        file_column = next((c for c in FILE_COLUMNS if c in columns), None)
+        if file_column is None:
+            return None
+        # Надёжнее всего — объявленный внешний ключ на main_printorder
+        for row in db.execute(f"PRAGMA foreign_key_list({_quote(table)})"):
+            if row[2] == ORDER_TABLE and row[3] in columns:
+                return row[3], file_column
+        # Для известных имён таблиц допускаем FK без ограничения в схеме
+        if known:
+            fk_column = next((c for c in FK_COLUMNS if c in columns), None)
+            if fk_column is not None:
+                return fk_column, file_column
+        return None
+
+    def fetch_files(self, db, order_ids) -> dict[int, list[str]]:
+        """Файлы всех заявок пачкой: {order_id: [путь, ...]} одним запросом на 500 ID."""
+        files: dict[int, list[str]] = {}
+        order_ids = list(order_ids)
+        if not order_ids:
+            return files
+        try:
+            if not self.ensure(db):
+                return files
+            for start in range(0, len(order_ids), MAX_IN_PARAMS):
+                chunk = order_ids[start:start + MAX_IN_PARAMS]
+                sql = self._select_sql.format(placeholders=", ".join("?" * len(chunk)))
+                for order_id, file_value in db.execute(sql, chunk):
+                    if file_value and str(file_value).strip():
+                        files.setdefault(order_id, []).append(str(file_value).strip())
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения таблицы вложений {self.table}: {e}")
+            # Схему перечитаем при следующем обращении
+            self._schema_version = None
+            raise
+        return files
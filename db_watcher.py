@@ -0,0 +1,191 @@
+"""Отслеживание изменений SQLite-базы Django: inotify (Linux) или PRAGMA data_version."""
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import sqlite3
+import struct
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Флаги inotify из <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+WATCH_MODES = ("auto", "inotify", "poll", "off")
+
+
+def _load_inotify():
+    """Вернуть libc с inotify_* или None (не Linux / нет поддержки)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DatabaseWatcher:
+    """Будит цикл проверки только когда база Django действительно изменилась.
+
+    Режимы:
+    - inotify: события по файлу базы и его ``-wal`` (нулевая нагрузка в простое);
+    - poll: опрос ``PRAGMA data_version`` на долгоживущем соединении;
+    - off: только таймер (как раньше);
+    - auto: inotify, если доступен, иначе poll.
+    """
+
+    def __init__(self, db_path: str, mode: str = "auto", poll_interval: float = 0.5,
+                 debounce: float = 0.05, database=None):
+        if mode not in WATCH_MODES:
+            raise ValueError(f"Неизвестный режим отслеживания БД: {mode!r} (допустимо: {', '.join(WATCH_MODES)})")
+        self.db_path = os.path.abspath(db_path)
+        self.requested_mode = mode
+        self.mode = "off"
+        self.poll_interval = poll_interval
+        # Общее соединение (DjangoDatabase); без него режим poll открывает своё
+        self.database = database
+        self.debounce = debounce
+        self._db_name = os.path.basename(self.db_path)
+        self._watched_names = {
+            os.fsencode(self._db_name),
+            os.fsencode(self._db_name + "-wal"),
+        }
+        self._event: asyncio.Event | None = None
+        self._inotify_fd: int | None = None
+        self._poll_task: asyncio.Task | None = None
+        self._conn: sqlite3.Connection | None = None
+        self._data_version: int | None = None
+
+    async def start(self):
+        """Выбрать режим и начать отслеживание."""
+        self._event = asyncio.Event()
+        mode = self.requested_mode
+        if mode in ("auto", "inotify"):
+            if self._start_inotify():
+                self.mode = "inotify"
+            elif mode == "inotify":
+                logger.warning("inotify недоступен, переключаемся на опрос PRAGMA data_version")
+                mode = "poll"
+            else:
+                mode = "poll"
+        if mode == "poll":
+            self._poll_task = asyncio.create_task(self._poll_data_version())
+            self.mode = "poll"
+        logger.info(f"Отслеживание изменений БД: режим {self.mode} ({self.db_path})")
+
+    def _start_inotify(self) -> bool:
+        libc = _load_inotify()
+        if libc is None:
+            return False
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logger.warning(f"inotify_init1 не удался: {os.strerror(ctypes.get_errno())}")
+            return False
+        # Следим за каталогом: -wal создаётся и удаляется, а сам файл базы могут подменить
+        directory = os.path.dirname(self.db_path)
+        wd = libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            logger.warning(f"inotify_add_watch({directory}) не удался: {os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return False
+        self._inotify_fd = fd
+        asyncio.get_running_loop().add_reader(fd, self._on_inotify)
+        return True
+
+    def _on_inotify(self):
+        """Прочитать накопившиеся события и разбудить цикл, если затронута база."""
+        changed = False
+        while True:
+            try:
+                data = os.read(self._inotify_fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                _wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if name in self._watched_names:
+                    changed = True
+        if changed:
+            self._event.set()
+
+    def _read_data_version(self) -> int:
+        if self.database is not None:
+            return self.database.data_version()
+        if self._conn is None:
+            self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    async def _poll_data_version(self):
+        """Опрос PRAGMA data_version: значение меняется после чужого коммита."""
+        while True:
+            try:
+                version = await asyncio.to_thread(self._read_data_version)
+                if self._data_version is not None and version != self._data_version:
+                    self._event.set()
+                self._data_version = version
+            except sqlite3.Error as e:
+                logger.warning(f"Ошибка чтения PRAGMA data_version: {e}")
+                self._close_connection()
+                self._data_version = None
+                self._event.set()
+            await asyncio.sleep(self.poll_interval)
+
+    async def wait(self, timeout: float) -> bool:
+        """Дождаться изменения БД не дольше timeout секунд.
+
+        Возвращает True, если было изменение, и False, если сработал таймер.
+        """
+        if self._event is None or self.mode == "off":
+            await asyncio.sleep(timeout)
+            return False
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        # Коммит Django пишет несколько страниц подряд — собираем их в одно пробуждение
+        if self.debounce:
+            await asyncio.sleep(self.debounce)
+        self._event.clear()
+        return True
+
+    def _close_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def close(self):
+        """Остановить отслеживание и освободить ресурсы."""
+        if self._inotify_fd is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._inotify_fd)
+            except RuntimeError:
+                pass
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        self._close_connection()
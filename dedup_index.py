@@ -0,0 +1,136 @@
+"""Индекс недавних заявок (имя, телефон) для отсева дублей звонков, с хранением в базе состояния."""
+from __future__ import annotations
+
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dedup (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dedup_expires_at ON dedup (expires_at);
+"""
+
+_SPACES = re.compile(r"\s+")
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(phone) -> str:
+    """Телефон только цифрами (8XXXXXXXXXX → 7XXXXXXXXXX)."""
+    digits = _NON_DIGITS.sub("", str(phone or ""))
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return digits
+
+
+def normalize_key(name, phone) -> str:
+    """Ключ заявки: имя без регистра и лишних пробелов, телефон — normalize_phone."""
+    name = _SPACES.sub(" ", str(name or "")).strip().casefold()
+    return f"{name}|{normalize_phone(phone)}"
+
+
+class DedupIndex:
+    """Словарь ключ → момент истечения и «колесо» корзин по времени истечения.
+
+    Проверка и добавление — O(1). Истёкшие ключи удаляются целыми корзинами
+    шириной ``bucket_width`` секунд: каждый ключ попадает в корзину один раз
+    на добавление, поэтому очистка тоже O(1) в среднем. Изменения копятся и
+    записываются в базу состояния вместе с пачкой outbox (``write``), после
+    перезапуска индекс восстанавливается (``load``).
+    """
+
+    def __init__(self, store, ttl: float = 120, bucket_width: float = 10):
+        self.store = store
+        self.ttl = ttl
+        self.bucket_width = bucket_width
+        self._expires: dict[str, float] = {}
+        self._wheel: dict[int, list[str]] = {}
+        self._next_bucket: int | None = None
+        # Изменённые ключи: ключ -> (новый срок, прежний срок или None)
+        self._dirty: dict[str, tuple[float, float | None]] = {}
+        store.ensure_schema(SCHEMA)
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def _bucket(self, expires_at: float) -> int:
+        return int(expires_at // self.bucket_width)
+
+    def _expire(self, now: float):
+        current = self._bucket(now)
+        if self._next_bucket is None:
+            self._next_bucket = current
+        # Корзины, целиком оставшиеся в прошлом; пустые пропускаем без перебора
+        while self._next_bucket < current and self._wheel:
+            for key in self._wheel.pop(self._next_bucket, ()):
+                # Ключ мог быть продлён и лежать ещё и в более поздней корзине
+                expires_at = self._expires.get(key)
+                if expires_at is not None and expires_at <= now:
+                    del self._expires[key]
+            self._next_bucket += 1
+        self._next_bucket = max(self._next_bucket, current)
+
+    def _put(self, key: str, expires_at: float):
+        self._expires[key] = expires_at
+        self._wheel.setdefault(self._bucket(expires_at), []).append(key)
+
+    def contains(self, name, phone, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        self._expire(now)
+        expires_at = self._expires.get(normalize_key(name, phone))
+        return expires_at is not None and expires_at > now
+
+    def add(self, name, phone, now: float | None = None):
+        """Запомнить заявку на ttl секунд (повторное добавление продлевает срок)."""
+        now = time.time() if now is None else now
+        self._expire(now)
+        key = normalize_key(name, phone)
+        expires_at = now + self.ttl
+        previous = self._dirty[key][1] if key in self._dirty else self._expires.get(key)
+        self._put(key, expires_at)
+        self._dirty[key] = (expires_at, previous)
+
+    def check_and_add(self, name, phone, now: float | None = None) -> bool:
+        """True, если такая заявка уже была за последние ttl секунд; иначе запомнить её."""
+        now = time.time() if now is None else now
+        if self.contains(name, phone, now):
+            return True
+        self.add(name, phone, now)
+        return False
+
+    def take_changes(self) -> dict:
+        """Изменения с прошлого вызова — для записи в той же транзакции, что и пачка outbox."""
+        changes, self._dirty = self._dirty, {}
+        return changes
+
+    def rollback(self, changes):
+        """Отменить изменения, если пачка не записалась: её строки будут прочитаны
+        заново и не должны оказаться дублями самих себя."""
+        for key, (_expires_at, previous) in changes.items():
+            if previous is None:
+                self._expires.pop(key, None)
+            else:
+                self._expires[key] = previous
+
+    @staticmethod
+    def write(conn, changes):
+        """Записать изменения и удалить истёкшие ключи (внутри транзакции базы состояния)."""
+        if changes:
+            conn.executemany(
+                "INSERT INTO dedup (key, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at",
+                [(key, expires_at) for key, (expires_at, _previous) in changes.items()],
+            )
+        conn.execute("DELETE FROM dedup WHERE expires_at <= ?", (time.time(),))
+
+    def load(self):
+        """Восстановить неистёкшие ключи из базы состояния."""
+        now = time.time()
+        for key, expires_at in self.store.query("SELECT key, expires_at FROM dedup WHERE expires_at > ?", (now,)):
+            self._put(key, expires_at)
+        if self._expires:
+            logger.info(f"Восстановлено ключей для отсева дублей: {len(self._expires)}")
@@ -0,0 +1,110 @@
+"""Сводки: при наплыве заявок их тексты упаковываются в несколько длинных сообщений."""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
+DIGEST_SEPARATOR = "\n\n" + "—" * 12 + "\n\n"
+
+
+def digest_header(count: int) -> str:
+    return f"<b>📋 Сводка заявок: {count}</b>"
+
+
+def render_digest(texts) -> str:
+    """Текст сводки: заголовок и тексты заявок через разделитель."""
+    return digest_header(len(texts)) + DIGEST_SEPARATOR + DIGEST_SEPARATOR.join(texts)
+
+
+class DigestBuffer:
+    """Копит тексты заявок и отправляет их сводкой.
+
+    Сводка уходит, когда следующий текст уже не помещается в ``limit``
+    символов (триггер по размеру) или через ``window`` секунд после первого
+    текста в буфере (триггер по времени). ``send(texts)`` отправляет сводку
+    и возвращает True при успехе; ``on_done(items, ok)`` получает результат
+    для всех заявок сводки.
+
+    Упаковка включается, когда отправки ждут больше ``threshold`` заявок, и
+    остаётся включённой, пока буфер не опустеет, — иначе заявки из буфера
+    ушли бы позже более новых.
+    """
+
+    def __init__(self, send, on_done, threshold: int, window: float = 10.0, limit: int = MESSAGE_LIMIT):
+        self.send = send
+        self.on_done = on_done
+        self.threshold = threshold
+        self.window = window
+        self.limit = limit
+        self._items: list = []
+        self._texts: list[str] = []
+        self._length = 0
+        self._timer: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    def should_pack(self, backlog: int) -> bool:
+        return bool(self._items) or backlog > self.threshold
+
+    def _length_with(self, text: str) -> int:
+        # Заголовок считаем с запасом на число заявок до 9999
+        return len(digest_header(9999)) + self._length + len(DIGEST_SEPARATOR) * (len(self._texts) + 1) + len(text)
+
+    def fits_alone(self, text: str) -> bool:
+        return len(digest_header(1)) + len(DIGEST_SEPARATOR) + len(text) <= self.limit
+
+    def add(self, item, text: str):
+        """Добавить текст заявки; при переполнении текущая сводка отправляется сразу."""
+        if self._items and self._length_with(text) > self.limit:
+            self._flush_now()
+        self._items.append(item)
+        self._texts.append(text)
+        self._length += len(text)
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        self._flush_now()
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._items:
+            return
+        items, texts = self._items, self._texts
+        self._items, self._texts, self._length = [], [], 0
+        task = asyncio.create_task(self._deliver(items, texts))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _deliver(self, items, texts):
+        try:
+            ok = await self.send(texts)
+        except Exception as e:
+            logger.error(f"Ошибка отправки сводки из {len(items)} заявок: {e}")
+            ok = False
+        self.on_done(items, ok)
+
+    async def flush(self):
+        """Отправить накопленное сейчас и дождаться отправки всех сводок."""
+        self._flush_now()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def close(self):
+        """Остановить таймер и отправки; неподтверждённые заявки останутся в outbox."""
+        tasks = list(self._flushes)
+        if self._timer is not None:
+            tasks.append(self._timer)
+            self._timer = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._items, self._texts, self._length = [], [], 0
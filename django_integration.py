@@ -5,20 +5,52 @@ Django интеграция для отправки уведомлений че
 Если используете прокси для Telegram: скопируйте рядом telegram_client.py
 (из корня этого репозитория) в приложение Django (например main/), чтобы импорт
 main.telegram_client или корневой telegram_client находился в PYTHONPATH.
+Так же подключается send_queue.py — очередь отправки с лимитами Telegram и
+повторами при RetryAfter/сетевых ошибках.
+
+Сигнал не ждёт Telegram: после коммита транзакции сообщение кладётся в
+ограниченную очередь в памяти, а отправляет его фоновый поток со своим
+event loop и одним Bot (см. DeliveryThread). При остановке воркера очередь
+дописывается (atexit, не дольше TELEGRAM_FLUSH_TIMEOUT секунд).
+
+Если задан TELEGRAM_BOT_SOCKET (settings или окружение) и запущен bot.py с тем
+же путём, воркеры Django не открывают своих соединений с Telegram: после
+коммита в сокет уходит короткое событие «модель id» (ingest_socket.py), а
+заявку читает из БД и отправляет сам бот — через свой пул и лимиты.
 """
 import asyncio
+import atexit
+import os
+import threading
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from telegram import Bot
 from telegram.error import TelegramError
 
 try:
-    from telegram_client import create_telegram_bot
+    from telegram_client import create_telegram_bot, keep_alive, warm_up
 except ImportError:
     try:
-        from main.telegram_client import create_telegram_bot
+        from main.telegram_client import create_telegram_bot, keep_alive, warm_up
     except ImportError:
-        create_telegram_bot = None  # type: ignore[misc,assignment]
+        create_telegram_bot = keep_alive = warm_up = None  # type: ignore[misc,assignment]
+
+try:
+    from ingest_socket import send_event
+except ImportError:
+    try:
+        from main.ingest_socket import send_event
+    except ImportError:
+        send_event = None  # type: ignore[misc,assignment]
+
+try:
+    from send_queue import TelegramSendQueue
+except ImportError:
+    try:
+        from main.send_queue import TelegramSendQueue
+    except ImportError:
+        TelegramSendQueue = None  # type: ignore[misc,assignment]
 from datetime import datetime
 import logging
 
@@ -38,7 +70,12 @@ class TelegramNotifier:
     
     _instance = None
     _bot = None
+    _sender = None
     _channel_id = None
+    _queue_size = 1000
+    _flush_timeout = 10
+    _delivery_thread = None
+    _delivery_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
@@ -53,6 +90,8 @@ class TelegramNotifier:
                 from django.conf import settings
                 BOT_TOKEN = getattr(settings, 'TELEGRAM_BOT_TOKEN', None)
                 CHANNEL_ID = getattr(settings, 'TELEGRAM_CHANNEL_ID', None)
+                self._queue_size = getattr(settings, 'TELEGRAM_QUEUE_SIZE', self._queue_size)
+                self._flush_timeout = getattr(settings, 'TELEGRAM_FLUSH_TIMEOUT', self._flush_timeout)
                 
                 # Если не найдено в settings, пытаемся импортировать из config
                 if not BOT_TOKEN or not CHANNEL_ID:
@@ -82,38 +121,173 @@ class TelegramNotifier:
             else:
                 self._bot = Bot(token=BOT_TOKEN)
             self._channel_id = CHANNEL_ID
+            if TelegramSendQueue is not None:
+                self._sender = TelegramSendQueue(self._bot)
+            atexit.register(self.flush)
     
     async def send_message_async(self, message: str):
         """Асинхронная отправка сообщения"""
         try:
-            await self._bot.send_message(
-                chat_id=self._channel_id,
-                text=message,
-                parse_mode='HTML',
-                disable_web_page_preview=True
-            )
+            if self._sender is not None:
+                await self._sender.send_message(
+                    self._channel_id,
+                    text=message,
+                    parse_mode='HTML',
+                    disable_web_page_preview=True
+                )
+            else:
+                await self._bot.send_message(
+                    chat_id=self._channel_id,
+                    text=message,
+                    parse_mode='HTML',
+                    disable_web_page_preview=True
+                )
             logger.info(f"Уведомление отправлено в канал {self._channel_id}")
         except TelegramError as e:
             logger.error(f"Ошибка отправки уведомления: {e}")
     
     def send_message(self, message: str):
-        """Синхронная обёртка для отправки сообщения"""
+        """Поставить сообщение в очередь фонового потока (не блокирует запрос)"""
         try:
-            # Создаём новый event loop если его нет
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            # Если loop уже запущен, создаём task
-            if loop.is_running():
-                asyncio.create_task(self.send_message_async(message))
-            else:
-                # Иначе запускаем синхронно
-                loop.run_until_complete(self.send_message_async(message))
+            self._delivery().submit(message)
         except Exception as e:
             logger.error(f"Ошибка при отправке уведомления: {e}")
+    
+    def _delivery(self):
+        """Фоновый поток доставки; после fork (gunicorn --preload) создаётся заново"""
+        thread = self._delivery_thread
+        if thread is None or thread.pid != os.getpid() or not thread.is_alive():
+            with TelegramNotifier._delivery_lock:
+                thread = self._delivery_thread
+                if thread is None or thread.pid != os.getpid() or not thread.is_alive():
+                    thread = DeliveryThread(self, maxsize=self._queue_size)
+                    thread.start()
+                    TelegramNotifier._delivery_thread = thread
+        return thread
+    
+    def flush(self, timeout=None):
+        """Дождаться отправки очереди (вызывается при остановке воркера)"""
+        thread = self._delivery_thread
+        if thread is not None and thread.pid == os.getpid():
+            thread.stop(self._flush_timeout if timeout is None else timeout)
+
+
+class DeliveryThread(threading.Thread):
+    """Поток с одним event loop: забирает сообщения из очереди и отправляет их через notifier
+    
+    Постановка в очередь — O(1) и не ждёт сеть; при переполнении сообщение
+    отбрасывается с записью в лог (запрос пользователя важнее уведомления,
+    а bot.py всё равно дошлёт заявку из БД).
+    
+    Event loop создаётся сразу, поэтому submit() и stop() не ждут запуска
+    потока: сообщения и признак остановки ставятся в loop под одной
+    блокировкой и выполняются в порядке постановки — всё принятое до stop()
+    отправляется, а после stop() сообщения не принимаются.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, notifier, maxsize=1000):
+        super().__init__(name='telegram-notifier', daemon=True)
+        self.notifier = notifier
+        self.maxsize = maxsize
+        self.pid = os.getpid()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+    
+    def run(self):
+        asyncio.set_event_loop(self._loop)
+        # Очередь создаётся в потоке loop; поставленные до запуска вызовы _put выполнятся после этого
+        self._queue = asyncio.Queue()
+        try:
+            self._loop.run_until_complete(self._consume())
+            if self.notifier._sender is not None:
+                self._loop.run_until_complete(self.notifier._sender.close())
+            # HTTP-клиенты и фоновая проверка маршрутов принадлежат этому loop
+            self._loop.run_until_complete(self.notifier._bot.request.shutdown())
+        finally:
+            self._loop.close()
+    
+    async def _consume(self):
+        # После остановки предыдущего потока HTTP-клиент закрыт — initialize() откроет его заново
+        await self.notifier._bot.request.initialize()
+        keepalive_task = None
+        if warm_up is not None:
+            # Один пул соединений на воркер: прогреваем его и не даём остыть
+            await warm_up(self.notifier._bot)
+            keepalive_task = asyncio.create_task(keep_alive(self.notifier._bot))
+        try:
+            await self._consume_messages()
+        finally:
+            if keepalive_task is not None:
+                keepalive_task.cancel()
+    
+    async def _consume_messages(self):
+        while True:
+            message = await self._queue.get()
+            if message is self._STOP:
+                return
+            try:
+                await self.notifier.send_message_async(message)
+            except Exception as e:
+                logger.error(f"Ошибка фоновой отправки уведомления: {e}")
+            finally:
+                with self._lock:
+                    self._pending -= 1
+    
+    def _put(self, message):
+        # Выполняется в потоке loop
+        self._queue.put_nowait(message)
+    
+    def submit(self, message: str) -> bool:
+        """Положить сообщение в очередь; False, если очередь переполнена или поток останавливается"""
+        with self._lock:
+            if self._closed:
+                logger.warning("Поток уведомлений Telegram остановлен, сообщение пропущено")
+                return False
+            if self._pending >= self.maxsize:
+                logger.warning(f"Очередь уведомлений Telegram переполнена ({self.maxsize}), сообщение пропущено")
+                return False
+            self._pending += 1
+            self._loop.call_soon_threadsafe(self._put, message)
+        return True
+    
+    def stop(self, timeout=10):
+        """Отправить всё, что уже в очереди, и остановить поток (не дольше timeout секунд)"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                try:
+                    self._loop.call_soon_threadsafe(self._put, self._STOP)
+                except RuntimeError:
+                    # Поток уже завершился и закрыл loop
+                    return
+        if not self.is_alive():
+            return
+        self.join(timeout)
+        if self.is_alive():
+            logger.warning(f"Не успели отправить {self._pending} уведомлений за {timeout} с при остановке")
+
+
+def get_bot_socket_path():
+    """Путь к сокету bot.py (TELEGRAM_BOT_SOCKET) или None, если события не используются"""
+    if send_event is None:
+        return None
+    try:
+        from django.conf import settings
+        path = getattr(settings, 'TELEGRAM_BOT_SOCKET', None)
+    except Exception:
+        path = None
+    return path or os.getenv('TELEGRAM_BOT_SOCKET') or None
+
+
+def notify_bot(socket_path, model, object_id):
+    """Сообщить bot.py о новой заявке; если бот недоступен, он найдёт её в БД после запуска"""
+    if not send_event(socket_path, model, object_id):
+        logger.warning(f"Событие {model} ID={object_id} не доставлено, бот найдёт заявку при сверке с БД")
 
 
 def format_call_request_message(instance):
@@ -201,9 +375,16 @@ if CallRequest is not None:
         """Отправить уведомление о новой заявке на звонок"""
         if created:  # Только для новых заявок
             try:
+                socket_path = get_bot_socket_path()
+                if socket_path:
+                    # Заявку отправит bot.py; ему — только событие после коммита
+                    object_id = instance.pk
+                    transaction.on_commit(lambda: notify_bot(socket_path, 'callrequest', object_id))
+                    return
                 message = format_call_request_message(instance)
                 notifier = TelegramNotifier()
-                notifier.send_message(message)
+                # Отправка только после коммита: откат транзакции не даст ложного уведомления
+                transaction.on_commit(lambda: notifier.send_message(message))
             except Exception as e:
                 logger.error(f"Ошибка отправки уведомления о заявке на звонок: {e}")
 
@@ -213,9 +394,16 @@ if PrintOrder is not None:
         """Отправить уведомление о новой заявке на печать"""
         if created:  # Только для новых заявок
             try:
+                socket_path = get_bot_socket_path()
+                if socket_path:
+                    # Заявку отправит bot.py; ему — только событие после коммита
+                    object_id = instance.pk
+                    transaction.on_commit(lambda: notify_bot(socket_path, 'printorder', object_id))
+                    return
                 message = format_print_order_message(instance)
                 notifier = TelegramNotifier()
-                notifier.send_message(message)
+                # Отправка только после коммита: откат транзакции не даст ложного уведомления
+                transaction.on_commit(lambda: notifier.send_message(message))
             except Exception as e:
                 logger.error(f"Ошибка отправки уведомления о заявке на печать: {e}")
 
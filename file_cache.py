@@ -0,0 +1,127 @@
+"""Кэш Telegram file_id по содержимому файла: повторная отправка тех же байт без загрузки."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_ids (
+    sha256 TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS file_ids_last_used ON file_ids (last_used);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+HASH_CHUNK = 1024 * 1024
+
+# Через сколько новых file_id чистить кэш (evict) в работающем боте
+EVICT_EVERY = 100
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 файла, читаем кусками по 1 МБ."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileIdCache:
+    """Отображение sha256 содержимого -> file_id, который Telegram вернул при первой загрузке.
+
+    Хэш файла пересчитывается только если изменились его размер или mtime
+    (таблица ``file_hashes``); сам расчёт идёт в отдельном потоке. Записи,
+    не использованные дольше ``max_age`` секунд, не выдаются ``lookup`` и
+    вместе с записями сверх ``max_entries`` удаляются ``evict`` — при запуске
+    и после каждых EVICT_EVERY новых file_id.
+
+    ``lookup``, ``remember``, ``forget`` и ``evict`` пишут в базу состояния:
+    из event loop их вызывают через ``asyncio.to_thread``.
+    """
+
+    def __init__(self, store, max_age: float = 30 * 24 * 3600, max_entries: int = 5000):
+        self.store = store
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._remembered = 0
+        store.ensure_schema(SCHEMA)
+
+    async def digest(self, path: str, remember_path: bool = True) -> str:
+        """sha256 файла: из кэша по (путь, размер, mtime) или подсчётом (всё — в потоке).
+
+        Для временных файлов (архивы, части) путь не запоминается.
+        """
+        if not remember_path:
+            return await asyncio.to_thread(hash_file, path)
+        return await asyncio.to_thread(self._digest_remembered, path)
+
+    def _digest_remembered(self, path: str) -> str:
+        st = os.stat(path)
+        rows = self.store.query(
+            "SELECT sha256 FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, st.st_size, st.st_mtime_ns),
+        )
+        if rows:
+            return rows[0][0]
+        sha256 = hash_file(path)
+        with self.store.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, sha256),
+            )
+        return sha256
+
+    def lookup(self, sha256: str) -> str | None:
+        now = time.time()
+        rows = self.store.query(
+            "SELECT file_id FROM file_ids WHERE sha256 = ? AND last_used >= ?", (sha256, now - self.max_age),
+        )
+        if not rows:
+            return None
+        with self.store.transaction() as conn:
+            conn.execute("UPDATE file_ids SET last_used = ? WHERE sha256 = ?", (now, sha256))
+        return rows[0][0]
+
+    def remember(self, sha256: str, file_id: str, size: int):
+        now = time.time()
+        with self.store.transaction() as conn:
+            conn.execute(
+                "INSERT INTO file_ids (sha256, file_id, size, created_at, last_used) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET file_id = excluded.file_id, last_used = excluded.last_used",
+                (sha256, file_id, size, now, now),
+            )
+        self._remembered += 1
+        if self._remembered % EVICT_EVERY == 0:
+            self.evict()
+
+    def forget(self, sha256: str):
+        """Убрать file_id, который Telegram больше не принимает."""
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM file_ids WHERE sha256 = ?", (sha256,))
+
+    def evict(self):
+        """Удалить устаревшие записи и оставить не больше max_entries последних."""
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM file_ids WHERE last_used < ?", (time.time() - self.max_age,))
+            conn.execute(
+                "DELETE FROM file_ids WHERE sha256 NOT IN "
+                "(SELECT sha256 FROM file_ids ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            # Хэши путей без file_id больше не нужны
+            conn.execute("DELETE FROM file_hashes WHERE sha256 NOT IN (SELECT sha256 FROM file_ids)")
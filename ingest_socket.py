@@ -0,0 +1,90 @@
+"""Приём событий о новых заявках от Django по локальному Unix-сокету.
+
+Протокол — строки ``<модель> <id>\\n`` (например ``printorder 42``). Событие
+лишь будит бота: заявка читается из БД по курсору, как и при опросе,
+поэтому потерянное или повторное событие ничего не ломает.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+# Имя модели Django -> вид заявки в outbox
+MODELS = {
+    "callrequest": "call_request",
+    "printorder": "print_order",
+}
+
+
+def parse_event(line: bytes) -> tuple[str, int] | None:
+    """(вид заявки, id) или None для неизвестной/испорченной строки."""
+    parts = line.decode("ascii", errors="replace").split()
+    if len(parts) != 2 or parts[0].lower() not in MODELS or not parts[1].isdigit():
+        return None
+    return MODELS[parts[0].lower()], int(parts[1])
+
+
+def send_event(path: str, model: str, object_id: int, timeout: float = 0.5) -> bool:
+    """Отправить событие боту (синхронно, для Django); False, если бот недоступен."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(f"{model} {int(object_id)}\n".encode("ascii"))
+        return True
+    except OSError as e:
+        logger.warning(f"Бот уведомлений недоступен по сокету {path}: {e}")
+        return False
+
+
+class IngestServer:
+    """Unix-сокет, на котором бот принимает события; ``on_event(kind, id)`` вызывается в event loop."""
+
+    def __init__(self, path: str, on_event, mode: int = 0o660):
+        self.path = path
+        self.on_event = on_event
+        self.mode = mode
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> bool:
+        if not hasattr(asyncio, "start_unix_server"):
+            logger.warning("Unix-сокеты недоступны на этой платформе, события Django не принимаются")
+            return False
+        # Сокет от предыдущего запуска мешает bind
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, self.mode)
+        logger.info(f"Приём событий Django по сокету {self.path}")
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                event = parse_event(line)
+                if event is None:
+                    logger.warning(f"Непонятное событие по сокету: {line[:100]!r}")
+                    continue
+                self.on_event(*event)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            logger.warning(f"Ошибка чтения события по сокету: {e}")
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -12,12 +12,18 @@ REM Проверка Python
 echo 1️⃣ Проверка Python...
 python --version >nul 2>&1
 if errorlevel 1 (
-    echo ❌ Python не найден. Установите Python 3.7+
+    echo ❌ Python не найден. Установите Python 3.10+
     pause
     exit /b 1
 )
 
 for /f "tokens=2" %%i in ('python --version 2^>^&1') do set PYTHON_VERSION=%%i
+python -c "import sys; sys.exit(sys.version_info < (3, 10))"
+if errorlevel 1 (
+    echo ❌ Нужен Python 3.10+, найден %PYTHON_VERSION%
+    pause
+    exit /b 1
+)
 echo ✅ Python найден: %PYTHON_VERSION%
 echo.
 
@@ -11,11 +11,15 @@ cd "$(dirname "$0")"
 # Проверка Python
 echo "1️⃣ Проверка Python..."
 if ! command -v python3 &> /dev/null; then
-    echo "❌ Python 3 не найден. Установите Python 3.7+"
+    echo "❌ Python 3 не найден. Установите Python 3.10+"
     exit 1
 fi
 
 PYTHON_VERSION=$(python3 --version | cut -d ' ' -f 2)
+if ! python3 -c 'import sys; sys.exit(sys.version_info < (3, 10))'; then
+    echo "❌ Нужен Python 3.10+, найден $PYTHON_VERSION"
+    exit 1
+fi
 echo "✅ Python найден: $PYTHON_VERSION"
 echo ""
 
@@ -0,0 +1,244 @@
+"""Команды /find <запрос>, /lead <id> и /stats [дней]: поиск и статистика заявок, обновления через get_updates.
+
+Отвечают только в канале уведомлений и в чатах из BOT_COMMAND_CHATS —
+остальным данные клиентов не показываются. Смещение обновлений хранится
+в базе состояния: после перезапуска старые команды не выполняются заново.
+
+При нескольких сайтах (SITES) токен опрашивает один LeadCommands: чат
+получает ответы по тем сайтам, к которым у него есть доступ (канал сайта
+или его command_chats), по сообщению на сайт.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from html import escape
+from typing import NamedTuple
+
+from telegram.error import Conflict, InvalidToken, TelegramError
+
+from db_rows import SERVICE_TYPES
+from lead_stats import format_stats
+
+logger = logging.getLogger(__name__)
+
+CURSOR_NAME = "telegram_update_offset"
+
+# Сколько заявок показывать в ответе /find и сколько символов текста заявки в /lead
+FIND_LIMIT = 10
+MESSAGE_PREVIEW = 1500
+
+KIND_TITLES = {"call_request": "📞 Звонок", "print_order": "🖨 Печать"}
+
+# Модели Django заявок (ссылки на страницу заявки в админке)
+ADMIN_MODELS = {"call_request": "main/callrequest", "print_order": "main/printorder"}
+
+HELP_TEXT = (
+    "<b>Поиск заявок</b>\n\n"
+    "/find &lt;запрос&gt; — по имени, телефону, email, услуге или тексту заявки\n"
+    "/lead &lt;id&gt; — заявка по номеру\n"
+    "/stats [дней] — статистика заявок (по умолчанию за 7 дней)"
+)
+
+# Наибольший период /stats в днях (дневные корзины хранятся без ограничения)
+STATS_MAX_DAYS = 366
+
+
+def format_date(created_at: str) -> str:
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(created_at, fmt).strftime("%d.%m.%Y %H:%M")
+        except ValueError:
+            continue
+    return created_at
+
+
+def format_found(query: str, leads) -> str:
+    if not leads:
+        return f"🔎 По запросу «{escape(query)}» ничего не найдено"
+    more = len(leads) > FIND_LIMIT
+    lines = [f"🔎 <b>Заявки по запросу «{escape(query)}»</b>" + (f" (первые {FIND_LIMIT})" if more else "")]
+    for lead in leads[:FIND_LIMIT]:
+        line = (f"\n{KIND_TITLES[lead.kind]} <b>#{lead.source_id}</b> · {format_date(lead.created_at)}\n"
+                f"👤 {escape(lead.name)} · <code>{escape(lead.phone)}</code>")
+        if lead.email:
+            line += f" · {escape(lead.email)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def admin_link(admin_url: str, lead) -> str:
+    return f"{admin_url.rstrip('/')}/{ADMIN_MODELS[lead.kind]}/{lead.source_id}/change/"
+
+
+def format_lead(lead, admin_url: str | None = None) -> str:
+    lines = [
+        f"{KIND_TITLES[lead.kind]} <b>#{lead.source_id}</b> · {format_date(lead.created_at)}",
+        "",
+        f"👤 <b>Имя:</b> {escape(lead.name)}",
+        f"📱 <b>Телефон:</b> <code>{escape(lead.phone)}</code>",
+    ]
+    if lead.kind == "print_order":
+        service = lead.service_type.split(" ", 1)[0]
+        message = lead.message.strip() or "Не указано"
+        ellipsis = "..." if len(message) > MESSAGE_PREVIEW else ""
+        lines += [
+            f"📧 <b>Email:</b> {escape(lead.email)}",
+            f"🛠️ <b>Услуга:</b> {escape(SERVICE_TYPES.get(service, service))}",
+            f"💬 <b>Сообщение:</b> {escape(message[:MESSAGE_PREVIEW])}{ellipsis}",
+        ]
+    if admin_url:
+        lines.append(f'🔗 <a href="{escape(admin_link(admin_url, lead))}">Открыть в админке</a>')
+    return "\n".join(lines)
+
+
+def parse_chat_ids(raw) -> set[str]:
+    """BOT_COMMAND_CHATS: id чатов или @username через запятую/пробел."""
+    if isinstance(raw, (list, tuple, set)):
+        return {str(value).strip() for value in raw if str(value).strip()}
+    return set(str(raw or "").replace(",", " ").split())
+
+
+class CommandSite(NamedTuple):
+    bot: object
+    index: object
+    stats: object
+    chats: set
+
+
+class LeadCommands:
+    """Длинный опрос ``get_updates`` и ответы на команды поиска заявок.
+
+    Ответы уходят через очередь отправки (лимиты Telegram общие с уведомлениями),
+    поиск и статистика читаются в потоке из базы состояния (см. LeadIndex, LeadStats).
+    Смещение обновлений хранится в базе состояния первого сайта.
+    """
+
+    def __init__(self, bot, index, stats=None, chats=(), poll_timeout: int = 30, retry_delay: float = 30):
+        self.bot = bot
+        self.sites: list[CommandSite] = []
+        self.add_site(bot, index, stats, chats)
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self.username: str | None = None
+        self._task: asyncio.Task | None = None
+
+    def add_site(self, bot, index, stats=None, chats=()):
+        """Ещё один сайт: команды из его канала и chats отвечают по его заявкам."""
+        self.sites.append(CommandSite(bot, index, stats, parse_chat_ids(chats) | {str(bot.channel_id)}))
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        telegram = self.bot.bot
+        cursors = await asyncio.to_thread(self.bot.state.get_cursors)
+        offset = cursors.get(CURSOR_NAME)
+        conflict_logged = False
+        while True:
+            try:
+                if self.username is None:
+                    # Bot.initialize() открывает и соединение get_updates (закрывается в Bot.shutdown())
+                    await telegram.initialize()
+                    self.username = telegram.username
+                    logger.info(f"Команды /find, /lead и /stats включены для @{self.username}")
+                updates = await telegram.get_updates(
+                    offset=offset, timeout=self.poll_timeout, allowed_updates=["message", "channel_post"],
+                )
+                conflict_logged = False
+            except InvalidToken as e:
+                logger.error(f"Команды поиска заявок выключены: {e}")
+                return
+            except Conflict as e:
+                # Вебхук или другой процесс с тем же токеном — команды ему и достаются
+                if not conflict_logged:
+                    logger.warning(f"get_updates недоступен, команды поиска заявок не обрабатываются: {e}")
+                    conflict_logged = True
+                await asyncio.sleep(self.retry_delay)
+                continue
+            except TelegramError as e:
+                logger.warning(f"Ошибка получения обновлений Telegram: {e}")
+                await asyncio.sleep(min(self.retry_delay, 5))
+                continue
+            if not updates:
+                continue
+            for update in updates:
+                try:
+                    await self.handle(update)
+                except TelegramError as e:
+                    logger.error(f"Не удалось ответить на команду: {e}")
+                except Exception as e:
+                    logger.error(f"Ошибка обработки команды: {e}")
+            offset = updates[-1].update_id + 1
+            await asyncio.to_thread(self.bot.state.set_cursors, {CURSOR_NAME: offset})
+
+    @staticmethod
+    def _allowed(chats, chat) -> bool:
+        return str(chat.id) in chats or (chat.username is not None and f"@{chat.username}" in chats)
+
+    async def handle(self, update):
+        message = update.effective_message
+        chat = update.effective_chat
+        if message is None or chat is None or not message.text or not message.text.startswith("/"):
+            return
+        command, _, argument = message.text.partition(" ")
+        command, _, mention = command[1:].partition("@")
+        if mention and self.username and mention.lower() != self.username.lower():
+            return
+        command, argument = command.lower(), argument.strip()
+        if command not in ("find", "lead", "stats", "help"):
+            return
+        sites = [site for site in self.sites if self._allowed(site.chats, chat)]
+        if not sites:
+            logger.info(f"Команда /{command} из чата {chat.id} без доступа к заявкам — не отвечаем")
+            return
+
+        started = time.perf_counter()
+        if not self._understood(command, argument):
+            texts = [HELP_TEXT]
+        else:
+            texts = []
+            for site in sites:
+                text = await self._answer(site, command, argument)
+                if len(self.sites) > 1:
+                    text = f"🏷 <b>{escape(site.bot.site.name)}</b>\n{text}"
+                texts.append(text)
+        logger.info(f"Команда /{command} {argument!r} из чата {chat.id}: {1000 * (time.perf_counter() - started):.1f} мс")
+        for text in texts:
+            await self.bot.sender.send_message(
+                chat.id, text=text, parse_mode="HTML", disable_web_page_preview=True,
+                reply_to_message_id=message.message_id,
+            )
+
+    @staticmethod
+    def _understood(command: str, argument: str) -> bool:
+        if command == "find":
+            return bool(argument)
+        if command == "lead":
+            return argument.lstrip("#").isdigit()
+        return command == "stats"
+
+    async def _answer(self, site: CommandSite, command: str, argument: str) -> str:
+        if command == "stats":
+            if site.stats is None:
+                return HELP_TEXT
+            days = int(argument) if argument.isdigit() else 7
+            summary = await asyncio.to_thread(site.stats.summary, max(1, min(days, STATS_MAX_DAYS)))
+            return format_stats(summary)
+        if not site.index.available:
+            return "Поиск заявок недоступен: SQLite собран без FTS5"
+        if command == "find":
+            leads = await asyncio.to_thread(site.index.search, argument, FIND_LIMIT + 1)
+            return format_found(argument, leads)
+        leads = await asyncio.to_thread(site.index.get, int(argument.lstrip("#")))
+        admin_url = site.bot.site.admin_url
+        return "\n\n".join(format_lead(lead, admin_url) for lead in leads) or \
+            f"Заявка #{escape(argument.lstrip('#'))} не найдена в индексе"
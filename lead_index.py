@@ -0,0 +1,181 @@
+"""Полнотекстовый индекс заявок (SQLite FTS5 в базе состояния) для команд /find и /lead.
+
+Индекс пополняется строками, которые бот читает из БД Django, в той же
+транзакции, что и пачка outbox: поиск не обращается к ``db.sqlite3``
+сайта. Телефон индексируется цифрами в двух видах — 7XXXXXXXXXX и
+XXXXXXXXXX, — поэтому находится по любому началу номера, с 8, +7 или без
+кода страны. Старые заявки добавляются командой ``python bot.py index-leads``.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import sqlite3
+from typing import NamedTuple
+
+from db_rows import SERVICE_TYPES
+from dedup_index import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS leads USING fts5(
+    kind UNINDEXED,
+    source_id UNINDEXED,
+    created_at UNINDEXED,
+    phone_display UNINDEXED,
+    name,
+    phone,
+    email,
+    service_type,
+    message,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Вид заявки -> младший бит rowid: /lead <id> — выборка по rowid, без поиска
+KIND_BITS = {"call_request": 0, "print_order": 1}
+
+# Запрос, похожий на номер телефона: цифры, пробелы, скобки, дефисы, плюс
+_PHONE_QUERY = re.compile(r"[\d\s()+\-.]+")
+_DIGITS = re.compile(r"\d+")
+_WORD = re.compile(r"\w")
+
+
+class Lead(NamedTuple):
+    kind: str
+    source_id: int
+    created_at: str
+    name: str
+    phone: str
+    email: str
+    service_type: str
+    message: str
+
+
+def lead_rowid(kind: str, source_id: int) -> int:
+    return int(source_id) * 2 + KIND_BITS[kind]
+
+
+def phone_terms(phone) -> str:
+    """Телефон для индекса: 7XXXXXXXXXX и XXXXXXXXXX (или просто цифры, если номер не российский)."""
+    digits = normalize_phone(phone)
+    if len(digits) == 11 and digits.startswith("7"):
+        return f"{digits} {digits[1:]}"
+    return digits
+
+
+def _phone_query(digits: str) -> str:
+    """Префиксный поиск по телефону: начало номера с 8/7 или без кода страны."""
+    digits = normalize_phone(digits)
+    variants = [digits]
+    if len(digits) > 1 and digits[0] in "78":
+        variants.append(digits[1:])
+    return "(" + " OR ".join(f'phone:"{variant}"*' for variant in variants) + ")"
+
+
+def build_query(text: str) -> str | None:
+    """Выражение MATCH: все слова запроса как префиксы (И), номера телефонов — по колонке phone.
+
+    Пользовательский ввод не попадает в синтаксис FTS5 как есть: каждое слово
+    берётся в кавычки (кавычки внутри удваиваются).
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+    digits = "".join(_DIGITS.findall(text))
+    if _PHONE_QUERY.fullmatch(text) and len(digits) >= 3:
+        return _phone_query(digits)
+    terms = []
+    for token in text.split():
+        if not _WORD.search(token):
+            continue
+        if token.lstrip("+").isdigit() and len(token.lstrip("+")) >= 3:
+            terms.append(_phone_query(token))
+        else:
+            terms.append('"' + token.replace('"', '""') + '"*')
+    return " AND ".join(terms) or None
+
+
+def index_entries(kind: str, rows) -> list[tuple]:
+    """Строки индекса для страницы заявок (CallRequestRow / PrintOrderRow)."""
+    entries = []
+    for row in rows:
+        if kind == "print_order":
+            service = row.service_type or ""
+            email, message = row.email or "", row.message or ""
+            # Код услуги и её название: находится и по «3d_printing», и по «печать»
+            service_text = f"{service} {SERVICE_TYPES.get(service, '')}".strip()
+        else:
+            email = service = service_text = message = ""
+        entries.append((
+            lead_rowid(kind, row.id), kind, row.id, str(row.created_at or ""), str(row.phone or ""),
+            str(row.name or ""), phone_terms(row.phone), str(email), service_text, str(message),
+        ))
+    return entries
+
+
+class LeadIndex:
+    """Поиск по заявкам в виртуальной таблице FTS5 ``leads`` базы состояния.
+
+    Если SQLite собран без FTS5, индекс выключается (``available`` = False):
+    запись ничего не делает, команды отвечают, что поиск недоступен.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        try:
+            store.ensure_schema(SCHEMA)
+            self.available = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Поиск по заявкам недоступен (SQLite без FTS5): {e}")
+            self.available = False
+
+    def entries(self, kind: str, rows) -> list[tuple]:
+        return index_entries(kind, rows) if self.available else []
+
+    @staticmethod
+    def write(conn, entries):
+        """Добавить или обновить строки индекса (внутри транзакции базы состояния)."""
+        if entries:
+            conn.executemany(
+                "INSERT OR REPLACE INTO leads (rowid, kind, source_id, created_at, phone_display, "
+                "name, phone, email, service_type, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                entries,
+            )
+
+    def add(self, kind: str, rows):
+        """Проиндексировать строки отдельной транзакцией (заполнение индекса старыми заявками)."""
+        entries = self.entries(kind, rows)
+        if entries:
+            with self.store.transaction() as conn:
+                self.write(conn, entries)
+
+    def count(self) -> int:
+        if not self.available:
+            return 0
+        return self.store.query("SELECT COUNT(*) FROM leads")[0][0]
+
+    def search(self, text: str, limit: int = 10) -> list[Lead]:
+        """Заявки по запросу, самые релевантные первыми (вызывается в потоке)."""
+        query = build_query(text)
+        if not self.available or query is None:
+            return []
+        rows = self.store.query(
+            "SELECT kind, source_id, created_at, name, phone_display, email, service_type, message "
+            "FROM leads WHERE leads MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit),
+        )
+        return [Lead._make(row) for row in rows]
+
+    def get(self, source_id: int) -> list[Lead]:
+        """Заявки с этим id (звонок и печать нумеруются независимо)."""
+        if not self.available:
+            return []
+        rowids = [lead_rowid(kind, source_id) for kind in KIND_BITS]
+        rows = self.store.query(
+            "SELECT kind, source_id, created_at, name, phone_display, email, service_type, message "
+            "FROM leads WHERE rowid IN (?, ?) ORDER BY rowid",
+            rowids,
+        )
+        return [Lead._make(row) for row in rows]
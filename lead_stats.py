@@ -0,0 +1,319 @@
+"""Статистика заявок: счётчики по часам и дням и время до обработки, агрегированные заранее.
+
+Счётчики (вид заявки × услуга × час / день создания) увеличиваются в той же
+транзакции, что и пачка outbox, и только для заявок, впервые попавших в
+outbox: строки, перечитанные после отката курсора, не считаются дважды.
+Ответ на /stats читает десятки корзин, а не строки заявок, и не
+обращается к БД Django. Время до обработки
+считается по журналу изменений (см. change_log.py): заявка ждёт в
+``stats_pending``, пока её не отметят обработанной, после чего попадает в
+гистограмму дня обработки; медиана оценивается по гистограмме.
+
+Корзины — по местному времени сервера бота.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from db_rows import SERVICE_TYPES
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stats_counts (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    service_type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (period, bucket, kind, service_type)
+);
+CREATE TABLE IF NOT EXISTS stats_processing (
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, kind, bin)
+);
+CREATE TABLE IF NOT EXISTS stats_pending (
+    kind TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (kind, source_id)
+);
+CREATE INDEX IF NOT EXISTS stats_pending_created_at ON stats_pending (created_at);
+"""
+
+HOUR_FORMAT = "%Y-%m-%d %H"
+DAY_FORMAT = "%Y-%m-%d"
+
+# Верхние границы корзин времени до обработки (секунды); последняя корзина — «дольше недели»
+PROCESSING_BINS = (60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400, 172800, 604800)
+
+# Сколько хранить почасовые корзины и заявки, ещё не отмеченные обработанными
+HOUR_RETENTION = 31 * 24 * 3600
+PENDING_RETENTION = 90 * 24 * 3600
+
+SUMMARY_CURSOR = "stats_summary_day"
+
+KIND_NAMES = {"call_request": "звонки", "print_order": "печать"}
+
+
+def processing_bin(seconds: float) -> int:
+    for index, upper in enumerate(PROCESSING_BINS):
+        if seconds <= upper:
+            return index
+    return len(PROCESSING_BINS)
+
+
+def histogram_median(counts: dict[int, int]) -> float | None:
+    """Медиана по гистограмме (линейно внутри корзины); для последней корзины — её нижняя граница."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    half = total / 2
+    seen = 0
+    for index in range(len(PROCESSING_BINS) + 1):
+        count = counts.get(index, 0)
+        if count and seen + count >= half:
+            lower = PROCESSING_BINS[index - 1] if index else 0
+            if index == len(PROCESSING_BINS):
+                return float(lower)
+            return lower + (PROCESSING_BINS[index] - lower) * (half - seen) / count
+        seen += count
+    return None
+
+
+def format_duration(seconds: float) -> str:
+    minutes = int(round(seconds / 60))
+    if minutes < 1:
+        return "меньше минуты"
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    parts = [f"{days} дн"] if days else []
+    if hours:
+        parts.append(f"{hours} ч")
+    if minutes and not days:
+        parts.append(f"{minutes} мин")
+    return " ".join(parts)
+
+
+class LeadStats:
+    """Счётчики заявок в базе состояния.
+
+    ``entries`` готовит изменения для пачки строк, ``write`` и
+    ``record_processed`` записывают их внутри транзакции вызывающего
+    (пачка outbox, сдвиг курсора журнала изменений). Чтение (``summary``)
+    выполняется в потоке.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        store.ensure_schema(SCHEMA)
+        self._task: asyncio.Task | None = None
+
+    # --- запись ---
+
+    @staticmethod
+    def entries(kind: str, rows, created_timestamp) -> tuple[Counter, list[tuple]]:
+        """(счётчики {(period, bucket, kind, service): n}, необработанные заявки [(kind, id, created_at)])."""
+        counts = Counter()
+        pending = []
+        now = time.time()
+        for row in rows:
+            created_at = created_timestamp(row.created_at) or now
+            local = time.localtime(created_at)
+            service = str(getattr(row, "service_type", "") or "")
+            counts[("hour", time.strftime(HOUR_FORMAT, local), kind, service)] += 1
+            counts[("day", time.strftime(DAY_FORMAT, local), kind, service)] += 1
+            if not row.is_processed:
+                pending.append((kind, row.id, created_at))
+        return counts, pending
+
+    @staticmethod
+    def write(conn, entries):
+        counts, pending = entries
+        if counts:
+            conn.executemany(
+                "INSERT INTO stats_counts (period, bucket, kind, service_type, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(period, bucket, kind, service_type) DO UPDATE SET count = count + excluded.count",
+                [(*key, count) for key, count in counts.items()],
+            )
+        if pending:
+            conn.executemany(
+                "INSERT OR IGNORE INTO stats_pending (kind, source_id, created_at) VALUES (?, ?, ?)", pending,
+            )
+
+    def pending(self, kind: str, ids) -> dict[int, float]:
+        """created_at тех заявок из ids, которые ещё ждут обработки."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        rows = self.store.query(
+            f"SELECT source_id, created_at FROM stats_pending WHERE kind = ? AND source_id IN ({', '.join('?' * len(ids))})",
+            [kind, *ids],
+        )
+        return dict(rows)
+
+    @staticmethod
+    def record_processed(conn, processed):
+        """Заявки, отмеченные обработанными: [(kind, id, created_at, processed_at), ...]."""
+        if not processed:
+            return
+        bins = Counter()
+        for kind, _source_id, created_at, processed_at in processed:
+            day = time.strftime(DAY_FORMAT, time.localtime(processed_at))
+            bins[(day, kind, processing_bin(max(0.0, processed_at - created_at)))] += 1
+        conn.executemany(
+            "INSERT INTO stats_processing (day, kind, bin, count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(day, kind, bin) DO UPDATE SET count = count + excluded.count",
+            [(*key, count) for key, count in bins.items()],
+        )
+        conn.executemany(
+            "DELETE FROM stats_pending WHERE kind = ? AND source_id = ?",
+            [(kind, source_id) for kind, source_id, _created_at, _processed_at in processed],
+        )
+
+    def purge(self):
+        now = time.time()
+        with self.store.transaction() as conn:
+            conn.execute(
+                "DELETE FROM stats_counts WHERE period = 'hour' AND bucket < ?",
+                (time.strftime(HOUR_FORMAT, time.localtime(now - HOUR_RETENTION)),),
+            )
+            conn.execute("DELETE FROM stats_pending WHERE created_at < ?", (now - PENDING_RETENTION,))
+
+    # --- чтение ---
+
+    def summary(self, days: int = 7, today: date | None = None) -> dict:
+        """Сводка за последние days дней (включая сегодня): O(корзин), не O(заявок)."""
+        today = today or date.today()
+        since = (today - timedelta(days=days - 1)).strftime(DAY_FORMAT)
+        # Верхняя граница нужна для сводки за прошедший день: сегодняшние корзины в неё не входят
+        until = today.strftime(DAY_FORMAT)
+        yesterday = (today - timedelta(days=1)).strftime(DAY_FORMAT)
+        by_day: dict[str, Counter] = {}
+        services = Counter()
+        for bucket, kind, service, count in self.store.query(
+            "SELECT bucket, kind, service_type, count FROM stats_counts "
+            "WHERE period = 'day' AND bucket >= ? AND bucket <= ?",
+            (since, until),
+        ):
+            by_day.setdefault(bucket, Counter())[kind] += count
+            if kind == "print_order":
+                services[service] += count
+        hours = Counter()
+        for bucket, count in self.store.query(
+            "SELECT bucket, SUM(count) FROM stats_counts WHERE period = 'hour' AND bucket >= ? AND bucket <= ? "
+            "GROUP BY bucket",
+            (until + " 00", until + " 23"),
+        ):
+            hours[int(bucket[-2:])] += count
+        processing = Counter()
+        for bin_index, count in self.store.query(
+            "SELECT bin, SUM(count) FROM stats_processing WHERE day >= ? AND day <= ? GROUP BY bin",
+            (since, until),
+        ):
+            processing[bin_index] += count
+        total = Counter()
+        for counts in by_day.values():
+            total.update(counts)
+        return {
+            "days": days,
+            "today": by_day.get(until, Counter()),
+            "yesterday": by_day.get(yesterday, Counter()),
+            "total": total,
+            "services": services,
+            "hours": hours,
+            "processed": sum(processing.values()),
+            "median_to_processed": histogram_median(processing),
+        }
+
+    def day_summary(self, day: date) -> dict:
+        """Сводка за один день (ежедневный отчёт)."""
+        return self.summary(days=1, today=day)
+
+    # --- ежедневный отчёт ---
+
+    async def start_daily(self, bot, at: str):
+        """Отправлять в канал сводку за вчера каждый день в at (ЧЧ:ММ, местное время)."""
+        hour, minute = (int(part) for part in at.split(":"))
+        self._task = asyncio.create_task(self._daily(bot, hour, minute))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _daily(self, bot, hour: int, minute: int):
+        while True:
+            now = datetime.now()
+            due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if due > now:
+                await asyncio.sleep((due - now).total_seconds())
+            cursors = await asyncio.to_thread(self.store.get_cursors)
+            today = int(date.today().strftime("%Y%m%d"))
+            if cursors.get(SUMMARY_CURSOR) != today:
+                yesterday = date.today() - timedelta(days=1)
+                summary = await asyncio.to_thread(self.day_summary, yesterday)
+                if await bot.send_notification(format_daily(summary, yesterday)):
+                    await asyncio.to_thread(self.store.set_cursors, {SUMMARY_CURSOR: today})
+                    logger.info(f"Ежедневная сводка за {yesterday:%d.%m.%Y} отправлена")
+                else:
+                    await asyncio.sleep(600)
+                    continue
+            # До того же времени завтра
+            now = datetime.now()
+            await asyncio.sleep((due + timedelta(days=1) - now).total_seconds())
+
+
+def _kinds(counts: Counter) -> str:
+    total = sum(counts.values())
+    parts = [f"{KIND_NAMES[kind]} {counts[kind]}" for kind in KIND_NAMES if counts.get(kind)]
+    return f"<b>{total}</b>" + (f" ({', '.join(parts)})" if parts else "")
+
+
+def _services(services: Counter) -> list[str]:
+    return [
+        f"• {SERVICE_TYPES.get(service, service) or 'не указана'} — {count}"
+        for service, count in services.most_common()
+    ]
+
+
+def _median(summary: dict) -> str:
+    median = summary["median_to_processed"]
+    if median is None:
+        return "нет данных (нужен журнал изменений: python bot.py install-changelog)"
+    prefix = "больше " if median >= PROCESSING_BINS[-1] else ""
+    return f"{prefix}{format_duration(median)} (обработано {summary['processed']})"
+
+
+def format_stats(summary: dict) -> str:
+    lines = [
+        "📊 <b>Статистика заявок</b>",
+        "",
+        f"Сегодня: {_kinds(summary['today'])}",
+        f"Вчера: {_kinds(summary['yesterday'])}",
+        f"За {summary['days']} дн: {_kinds(summary['total'])}",
+    ]
+    if summary["hours"]:
+        lines.append("По часам сегодня: " + " · ".join(
+            f"{hour:02d}ч {count}" for hour, count in sorted(summary["hours"].items())
+        ))
+    if summary["services"]:
+        lines += ["", f"<b>Услуги (печать, {summary['days']} дн):</b>", *_services(summary["services"])]
+    lines += ["", f"⏱ Медиана до обработки ({summary['days']} дн): {_median(summary)}"]
+    return "\n".join(lines)
+
+
+def format_daily(summary: dict, day: date) -> str:
+    lines = [f"📊 <b>Заявки за {day:%d.%m.%Y}:</b> {_kinds(summary['today'])}"]
+    if summary["services"]:
+        lines += ["", *_services(summary["services"])]
+    lines += ["", f"⏱ Медиана до обработки: {_median(summary)}"]
+    return "\n".join(lines)
@@ -0,0 +1,234 @@
+"""Метрики бота в текстовом формате Prometheus и локальный HTTP-сервер /metrics (без внешних зависимостей)."""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900, 3600)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values) or ({(): 0} if not self.labels else {})
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in values.items()]
+
+
+class Gauge(_Metric):
+    """Значение выставляется через set() или вычисляется при каждом опросе функцией ``collect``.
+
+    ``collect()`` возвращает число или словарь {значения меток (кортеж): число}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, *args, collect=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collect = collect
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.collect is not None:
+            try:
+                values = self.collect()
+            except Exception as e:
+                logger.warning(f"Не удалось вычислить метрику {self.name}: {e}")
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # значения меток -> [счётчики корзин..., сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        lines = []
+        for key, state in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = _format_labels(self.labels, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labels, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{le} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    """Набор метрик; render() собирает текст для /metrics."""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), collect=None) -> Gauge:
+        return self._add(Gauge(name, help_text, labels, collect=collect))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets=buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Минимальный HTTP-сервер: GET /metrics отдаёт registry.render() (вычисляется в потоке)."""
+
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                body = (await asyncio.to_thread(self.registry.render)).encode()
+                status, content_type = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                body, status, content_type = b"Not Found\n", "404 Not Found", "text/plain"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug(f"Ошибка запроса метрик: {e}")
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+class BotMetrics(Registry):
+    """Метрики ModelixNotificationBot (имена с префиксом modelix_)."""
+
+    def __init__(self):
+        super().__init__()
+        self.poll_duration = self.histogram(
+            "modelix_poll_duration_seconds", "Длительность проверки БД Django (все страницы обеих таблиц)")
+        self.db_query = self.histogram(
+            "modelix_db_query_seconds", "Время запроса страницы новых заявок", labels=("table",))
+        self.send_latency = self.histogram(
+            "modelix_telegram_request_seconds", "Время одного запроса к Bot API", labels=("method", "result"))
+        self.end_to_end = self.histogram(
+            "modelix_end_to_end_seconds", "От created_at заявки до подтверждения Telegram",
+            labels=("kind",), buckets=LATENCY_BUCKETS)
+        self.sent = self.counter("modelix_leads_sent_total", "Доставленные заявки", labels=("kind",))
+        self.failed = self.counter("modelix_leads_failed_total", "Неудачные попытки доставки заявок", labels=("kind",))
+        self.duplicates = self.counter("modelix_leads_duplicate_total", "Заявки на звонок, отсеянные как дубли")
+        self.skipped = self.counter(
+            "modelix_rows_skipped_total", "Прочитанные строки, уже бывшие в outbox", labels=("kind",))
+        self.uploaded_bytes = self.counter("modelix_uploaded_bytes_total", "Байт загружено в Telegram")
+        self.retry_after = self.counter("modelix_retry_after_total", "Ответы RetryAfter (flood control)")
+        self.queue_depth = self.gauge(
+            "modelix_queue_depth", "Ожидают отправки: заявки в конвейере и запросы в очереди Bot API",
+            labels=("queue",))
+        self.cursor_lag = self.gauge(
+            "modelix_cursor_lag", "MAX(id) в таблице Django минус последний прочитанный id", labels=("table",))
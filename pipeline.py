@@ -0,0 +1,289 @@
+"""Конвейер уведомлений: чтение БД → форматирование → отправка, стадии связаны очередями asyncio."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import NamedTuple
+
+from digest import DigestBuffer
+from trace_journal import current_lead
+
+logger = logging.getLogger(__name__)
+
+# Сколько недоставленных записей outbox читать за раз при запуске
+RESTORE_BATCH = 200
+
+
+class RowBatch(NamedTuple):
+    """Новые строки одной таблицы, прочитанные за одну проверку."""
+    kind: str
+    rows: list
+    # Для заявок на печать — вложения {order_id: [путь, ...]}
+    files_by_order: dict
+    # Когда страница прочитана (time.time(), для журнала трассировки)
+    read_at: float = 0.0
+
+
+class NotificationPipeline:
+    """Стадии конвейера работают независимо, поэтому медленная загрузка
+    файла не задерживает чтение новых заявок, а чтение БД — отправку.
+
+    - чтение: по сигналу ``wake()`` читает новые строки БД Django страницами
+      в пуле потоков (``bot.check_for_updates``);
+    - форматирование: дубли, тексты, запись пачки в outbox вместе с курсором
+      (``bot.enqueue_batch``);
+    - отправка: ``concurrency`` обработчиков; заявка целиком отправляется
+      одним обработчиком, поэтому её сообщения идут по порядку;
+    - подтверждения: доставленные записи отмечаются в outbox пачкой,
+      неудачные возвращаются в очередь через ``retry_delay`` секунд.
+
+    Если ``digest_threshold`` > 0 и отправки ждут больше заявок, их тексты
+    упаковываются в сводки (см. DigestBuffer), а файлы заявок на печать
+    по-прежнему уходят отдельно по каждой заявке.
+
+    Очереди ограничены: если отправка не успевает, стадии выше ждут, а не
+    копят строки в памяти.
+
+    ``metrics`` (BotMetrics) получает число доставленных и неудачных заявок и
+    задержку от создания заявки (``payload['created_at']``) до подтверждения.
+    ``trace`` (TraceJournal) — этапы queue/send/ack каждой заявки.
+    """
+
+    def __init__(self, bot, concurrency: int = 4, queue_size: int = 100, retry_delay: float = 30,
+                 digest_threshold: int = 0, digest_window: float = 10.0, metrics=None, trace=None):
+        self.bot = bot
+        self.metrics = metrics
+        self.trace = trace
+        # Начало отправки записей outbox: id -> time.time()
+        self._sending: dict[int, float] = {}
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.retry_delay = retry_delay
+        self.digest_threshold = digest_threshold
+        self.digest_window = digest_window
+        self.digest: DigestBuffer | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._batches: asyncio.Queue | None = None
+        self._items: asyncio.Queue | None = None
+        self._acks: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._retries: set[asyncio.Task] = set()
+        # Пачка не попала в outbox: прочитанное после неё отбрасывается, курсоры откатывает стадия чтения
+        self._rewind_requested = False
+
+    async def start(self):
+        """Запустить стадии и вернуть в очередь записи outbox, не доставленные до перезапуска."""
+        self._wakeup = asyncio.Event()
+        # Не больше двух прочитанных страниц ждут форматирования
+        self._batches = asyncio.Queue(maxsize=2)
+        self._items = asyncio.Queue(maxsize=self.queue_size)
+        self._acks = asyncio.Queue()
+        if self.digest_threshold > 0:
+            self.digest = DigestBuffer(
+                self.bot.send_digest, self._digest_done, self.digest_threshold, window=self.digest_window
+            )
+        self._tasks = [
+            asyncio.create_task(self._read_stage()),
+            asyncio.create_task(self._format_stage()),
+            asyncio.create_task(self._ack_stage()),
+        ]
+        self._tasks += [asyncio.create_task(self._send_stage()) for _ in range(self.concurrency)]
+
+    @property
+    def depth(self) -> int:
+        """Сколько заявок ждёт отправки."""
+        return self._items.qsize() if self._items is not None else 0
+
+    def wake(self):
+        """Попросить стадию чтения проверить БД (повторные сигналы до проверки склеиваются)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def join(self):
+        """Дождаться, пока всё прочитанное будет отправлено и подтверждено."""
+        await self._batches.join()
+        await self._items.join()
+        if self.digest is not None:
+            await self.digest.flush()
+        await self._acks.join()
+
+    async def stop(self):
+        """Остановить стадии; незавершённые отправки останутся в outbox до следующего запуска."""
+        if self.digest is not None:
+            await self.digest.close()
+        tasks = self._tasks + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retries.clear()
+
+    async def _restore_pending(self):
+        after_id = 0
+        while True:
+            items = await asyncio.to_thread(self.bot.state.pending, RESTORE_BATCH, after_id)
+            if not items:
+                return
+            logger.info(f"Недоставленных уведомлений в outbox: {len(items)}, ставим в очередь")
+            for item in items:
+                await self._items.put(item)
+            after_id = items[-1].id
+
+    async def _read_stage(self):
+        # Новые записи появятся в outbox только после этого — дважды одну запись не отправим
+        await self._restore_pending()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._rewind_requested:
+                try:
+                    async with aclosing(self.bot.check_for_updates()) as pages:
+                        async for batch in pages:
+                            if self._rewind_requested:
+                                break
+                            await self._batches.put(batch)
+                except Exception as e:
+                    logger.error(f"Ошибка чтения новых заявок: {e}")
+                    self._rewind_requested = True
+            if self._rewind_requested:
+                await self._rewind()
+
+    async def _format_stage(self):
+        while True:
+            batch = await self._batches.get()
+            try:
+                # Пачки после неудачной будут прочитаны заново после отката курсоров
+                if self._rewind_requested:
+                    continue
+                for item in await self.bot.enqueue_batch(batch):
+                    await self._items.put(item)
+            except Exception as e:
+                logger.error(f"Ошибка постановки заявок {batch.kind} в очередь: {e}")
+                self._rewind_requested = True
+                self.wake()
+            finally:
+                self._batches.task_done()
+
+    async def _rewind(self):
+        """Откатить курсоры чтения к сохранённым (только из стадии чтения, пока она не читает)
+
+        Прочитанные, но не записанные в outbox пачки отбрасываются и прочитаются
+        заново; повторы outbox отбросит по (kind, source_id).
+        """
+        while not self._batches.empty():
+            self._batches.get_nowait()
+            self._batches.task_done()
+        try:
+            await self.bot.rewind_cursors()
+        except Exception as e:
+            # Откат повторится при следующем пробуждении стадии чтения
+            logger.error(f"Не удалось восстановить курсоры: {e}")
+            return
+        self._rewind_requested = False
+        self.bot.recheck_pending = True
+        self.wake()
+
+    async def _send_stage(self):
+        while True:
+            item = await self._items.get()
+            if self.trace is not None:
+                self.trace.dequeued(item.kind, item.source_id)
+            self._sending[item.id] = time.time()
+            # Загрузки файлов внутри _deliver записываются как этапы этой заявки
+            token = current_lead.set((item.kind, item.source_id))
+            try:
+                ok = await self._deliver(item)
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомления {item.kind} ID={item.source_id}: {e}")
+                ok = False
+            finally:
+                current_lead.reset(token)
+                self._items.task_done()
+            if ok is not None:
+                self._acks.put_nowait((item, ok, time.time()))
+
+    async def _deliver(self, item):
+        """Результат отправки; None — текст заявки ждёт в сводке (её отправка и подтвердит заявку)."""
+        text = item.payload['text']
+        # Сводка уходит только в канал по умолчанию: заявки с маршрутами (chats) отправляются по одной
+        if (self.digest is None or item.payload.get('chats') or not self.digest.should_pack(self._items.qsize())
+                or not self.digest.fits_alone(text)):
+            return await self.bot.deliver_item(item)
+        if item.payload.get('files') and not item.payload.get('files_sent'):
+            if not await self.bot.deliver_item_files(item):
+                return False
+            # Если сводка не уйдёт, повтор отправит только текст заявки
+            item.payload['files_sent'] = True
+            await asyncio.to_thread(self.bot.state.update_payload, item.id, item.payload)
+        self.digest.add(item, text)
+        return None
+
+    def _digest_done(self, items, ok: bool):
+        now = time.time()
+        for item in items:
+            self._acks.put_nowait((item, ok, now))
+
+    async def _ack_stage(self):
+        while True:
+            acks = [await self._acks.get()]
+            # Всё, что успело накопиться, подтверждаем одной транзакцией
+            while not self._acks.empty():
+                acks.append(self._acks.get_nowait())
+            self._observe(acks)
+            try:
+                delivered = [item.id for item, ok, _at in acks if ok]
+                failed = [item for item, ok, _at in acks if not ok]
+                if delivered:
+                    await asyncio.to_thread(self.bot.state.mark_delivered, delivered)
+                    await self._trace_delivered(acks)
+                if failed:
+                    await asyncio.to_thread(
+                        self.bot.state.mark_failed, [(item.id, 'отправка не удалась') for item in failed]
+                    )
+                    logger.warning(f"Не доставлено {len(failed)} уведомлений, повтор через {self.retry_delay:.0f} с")
+                    for item in failed:
+                        self._schedule_retry(item)
+                logger.info(f"Доставлено уведомлений: {len(delivered)} из {len(acks)}")
+            except Exception as e:
+                # Неподтверждённые записи остаются pending и будут отправлены после перезапуска
+                logger.error(f"Ошибка записи подтверждений в outbox: {e}")
+            finally:
+                for _ in acks:
+                    self._acks.task_done()
+
+    def _observe(self, acks):
+        if self.metrics is None:
+            return
+        now = time.time()
+        for item, ok, _at in acks:
+            if not ok:
+                self.metrics.failed.inc(kind=item.kind)
+                continue
+            self.metrics.sent.inc(kind=item.kind)
+            created_at = item.payload.get('created_at')
+            if created_at is not None:
+                self.metrics.end_to_end.observe(max(0.0, now - created_at), kind=item.kind)
+
+    async def _trace_delivered(self, acks):
+        committed = time.time()
+        for item, ok, at in acks:
+            started = self._sending.pop(item.id, None)
+            if self.trace is None or not ok:
+                continue
+            self.trace.record(item.kind, item.source_id, "send", started, at)
+            self.trace.record(item.kind, item.source_id, "ack", at, committed)
+        if self.trace is not None:
+            await asyncio.to_thread(self.trace.flush)
+
+    def _schedule_retry(self, item):
+        task = asyncio.create_task(self._retry_later(item._replace(attempts=item.attempts + 1)))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, item):
+        await asyncio.sleep(self.retry_delay)
+        if self.trace is not None:
+            self.trace.queued(item.kind, item.source_id)
+        await self._items.put(item)
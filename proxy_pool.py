@@ -0,0 +1,166 @@
+"""Несколько маршрутов до Telegram API (прокси и, по желанию, напрямую) с проверкой и переключением."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+import httpx
+from telegram.error import NetworkError, TimedOut
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+# Адрес для проверки маршрута по умолчанию (со своим TELEGRAM_API_URL — он): любой HTTP-ответ
+# означает, что TCP/TLS/прокси работают
+PROBE_URL = "https://api.telegram.org/"
+
+# Ошибки, при которых запрос гарантированно не ушёл в Telegram: его можно сразу
+# повторить через другой маршрут без риска отправить сообщение дважды
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ProxyError, httpx.PoolTimeout)
+
+
+class Route:
+    """Маршрут (прокси или прямое соединение) со своей статистикой и автоматом-предохранителем.
+
+    Задержка и доля ошибок — экспоненциальные скользящие средние. После
+    ``failure_threshold`` ошибок подряд маршрут размыкается на ``cooldown``
+    секунд (при повторных размыканиях — вдвое дольше, до ``max_cooldown``),
+    затем пропускает один запрос на пробу.
+    """
+
+    def __init__(self, name: str, request: BaseRequest, alpha: float = 0.3, failure_threshold: int = 3,
+                 cooldown: float = 30.0, max_cooldown: float = 300.0):
+        self.name = name
+        self.request = request
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.open_until > time.monotonic()
+
+    def score(self) -> float:
+        """Чем меньше, тем лучше: средняя задержка с штрафом за ошибки."""
+        # Непроверенный маршрут считаем средним, чтобы он получил шанс
+        latency = 1.0 if self.latency is None else self.latency
+        return latency * (1.0 + 10.0 * self.error_rate)
+
+    def record_success(self, latency: float | None):
+        """Удачный запрос; latency=None — время не показательно (загрузка файла)."""
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+        self.error_rate -= self.alpha * self.error_rate
+        self.failures = 0
+        if self.open_until:
+            logger.info(f"Маршрут Telegram {self.name} снова работает")
+        self.open_until = 0.0
+        self.cooldown = self.base_cooldown
+
+    def record_failure(self, error: Exception):
+        self.error_rate += self.alpha * (1.0 - self.error_rate)
+        self.failures += 1
+        if self.failures >= self.failure_threshold and not self.is_open:
+            self.open_until = time.monotonic() + self.cooldown
+            logger.warning(
+                f"Маршрут Telegram {self.name} отключён на {self.cooldown:.0f} с после "
+                f"{self.failures} ошибок подряд: {error}"
+            )
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+
+
+class ProxyPoolRequest(BaseRequest):
+    """BaseRequest, который отправляет каждый запрос через лучший доступный маршрут.
+
+    Маршруты ранжируются по ``Route.score()``; разомкнутые пропускаются, пока
+    есть другие. Если соединение не удалось установить (запрос точно не
+    ушёл), тот же запрос сразу повторяется через следующий маршрут; прочие
+    ошибки учитываются в статистике и передаются вызывающему (повтор решает
+    очередь отправки). Фоновая проверка раз в ``probe_interval`` секунд
+    обновляет статистику всех маршрутов, в том числе простаивающих.
+    """
+
+    def __init__(self, routes: list[Route], probe_interval: float = 30.0, probe_url: str = PROBE_URL):
+        if not routes:
+            raise ValueError("Нужен хотя бы один маршрут до Telegram API")
+        self.routes = routes
+        self.probe_interval = probe_interval
+        self.probe_url = probe_url
+        self._probe_task: asyncio.Task | None = None
+
+    @property
+    def read_timeout(self):
+        return self.routes[0].request.read_timeout
+
+    def ranked(self) -> list[Route]:
+        """Маршруты в порядке предпочтения: сначала замкнутые по score, затем разомкнутые по времени восстановления."""
+        closed = sorted((r for r in self.routes if not r.is_open), key=Route.score)
+        opened = sorted((r for r in self.routes if r.is_open), key=lambda r: r.open_until)
+        return closed + opened
+
+    async def initialize(self):
+        for route in self.routes:
+            await route.request.initialize()
+        self._ensure_probe()
+
+    async def shutdown(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        for route in self.routes:
+            await route.request.shutdown()
+
+    def _ensure_probe(self):
+        if self.probe_interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        task = self._probe_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._probe_task = loop.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.gather(*(self.probe(route) for route in self.routes))
+            await asyncio.sleep(self.probe_interval)
+
+    async def probe(self, route: Route) -> bool:
+        started = time.monotonic()
+        try:
+            await route.request.do_request(self.probe_url, "GET")
+        except Exception as e:
+            route.record_failure(e)
+            logger.debug(f"Проверка маршрута Telegram {route.name} не удалась: {e}")
+            return False
+        route.record_success(time.monotonic() - started)
+        return True
+
+    async def do_request(self, url, method, request_data=None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE, pool_timeout=BaseRequest.DEFAULT_NONE):
+        self._ensure_probe()
+        routes = self.ranked()
+        for index, route in enumerate(routes):
+            started = time.monotonic()
+            try:
+                result = await route.request.do_request(
+                    url, method, request_data,
+                    read_timeout=read_timeout, write_timeout=write_timeout,
+                    connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+                )
+            except (NetworkError, TimedOut) as e:
+                route.record_failure(e)
+                if isinstance(e.__cause__, _NOT_SENT_ERRORS) and index + 1 < len(routes):
+                    logger.warning(f"Маршрут Telegram {route.name} недоступен ({e}), пробуем {routes[index + 1].name}")
+                    continue
+                raise
+            # Время загрузки файла зависит от его размера, а не от маршрута
+            uploading = request_data is not None and bool(request_data.multipart_data)
+            route.record_success(None if uploading else time.monotonic() - started)
+            return result
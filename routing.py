@@ -0,0 +1,79 @@
+"""Маршрутизация заявок по чатам: правила по виду заявки и услуге (ROUTES в config.py).
+
+Правило — словарь:
+
+- ``chats`` — id чатов (или @username), куда отправить заявку;
+- ``kind`` — ``call_request`` / ``print_order`` (или список), без ключа — любой;
+- ``service_type`` — код услуги или список кодов (звонки под такое правило не попадают);
+- ``copy`` — True: копия (архив и т.п.), не заменяет канал по умолчанию.
+
+Заявка уходит во все чаты подошедших правил. Если ни одно правило без
+``copy`` не подошло, она уходит в канал по умолчанию (CHANNEL_ID) и в копии.
+"""
+from __future__ import annotations
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+RULE_KEYS = {"chats", "kind", "service_type", "copy"}
+KINDS = {"call_request", "print_order"}
+
+
+def _as_set(value) -> set[str] | None:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return {value}
+    return {str(item) for item in value}
+
+
+class RouteRule:
+    def __init__(self, rule: dict):
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Неизвестные ключи в правиле маршрутизации {rule}: {', '.join(sorted(unknown))}")
+        chats = rule.get("chats")
+        if chats is None or chats == "" or chats == []:
+            raise ValueError(f"В правиле маршрутизации нет chats: {rule}")
+        self.chats = [chats] if isinstance(chats, (str, int)) else list(chats)
+        self.kinds = _as_set(rule.get("kind"))
+        if self.kinds is not None and not self.kinds <= KINDS:
+            raise ValueError(f"Неизвестный вид заявки в правиле маршрутизации: {rule}")
+        self.service_types = _as_set(rule.get("service_type"))
+        self.copy = bool(rule.get("copy", False))
+
+    def matches(self, kind: str, service_type: str | None) -> bool:
+        if self.kinds is not None and kind not in self.kinds:
+            return False
+        if self.service_types is not None and (service_type or "") not in self.service_types:
+            return False
+        return True
+
+
+class Router:
+    """Чаты для заявки; без правил — всегда только канал по умолчанию."""
+
+    def __init__(self, rules, default_chat):
+        if isinstance(rules, str):
+            rules = json.loads(rules) if rules.strip() else []
+        self.routes = [RouteRule(rule) for rule in rules or ()]
+        self.default_chat = default_chat
+
+    def __bool__(self) -> bool:
+        return bool(self.routes)
+
+    def targets(self, kind: str, service_type: str | None = None) -> list:
+        chats, copies = [], []
+        for route in self.routes:
+            if route.matches(kind, service_type):
+                (copies if route.copy else chats).extend(route.chats)
+        if not chats:
+            chats = [self.default_chat]
+        targets, seen = [], set()
+        for chat in chats + copies:
+            if str(chat) not in seen:
+                seen.add(str(chat))
+                targets.append(chat)
+        return targets
@@ -0,0 +1,327 @@
+"""Очередь отправки в Telegram с ограничением частоты и повторами (RetryAfter, сетевые ошибки)."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API: ~30 сообщений в секунду на бота и ~20 в минуту в один канал/группу
+DEFAULT_GLOBAL_RATE = 30.0
+DEFAULT_CHAT_RATE_PER_MINUTE = 20.0
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Ошибка, которую бессмысленно повторять (неверный запрос, слишком большой файл и т.п.)."""
+    return isinstance(error, BadRequest)
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """RetryAfter.retry_after: int в PTB 20.x, timedelta в более новых версиях."""
+    delay = error.retry_after
+    if hasattr(delay, "total_seconds"):
+        delay = delay.total_seconds()
+    return float(delay)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Flood control от Telegram: до этого момента не отправляем ничего
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float = 1.0) -> float:
+        """Сколько секунд ждать до возможности потратить cost токенов (0 — можно сейчас)."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        cost = min(cost, self.capacity)
+        if self.tokens < cost:
+            wait = max(wait, (cost - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, cost: float = 1.0):
+        self._refill(time.monotonic())
+        self.tokens -= min(cost, self.capacity)
+
+    def block_for(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class FairShare:
+    """Токены общего ведра по очереди между арендаторами (сайтами).
+
+    Пока токенов хватает, запрос проходит сразу. Когда общего лимита не
+    хватает, ожидающие встают в очередь своего арендатора, а освободившиеся
+    токены выдаются арендаторам по кругу — по одному запросу за ход: сайт с
+    потоком заявок не отодвигает заявки остальных сайтов.
+    """
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self._waiting: OrderedDict = OrderedDict()
+        self._task: asyncio.Task | None = None
+
+    async def acquire(self, tenant, cost: float = 1.0):
+        if not self._waiting and self.bucket.delay(cost) <= 0:
+            self.bucket.consume(cost)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(tenant, deque()).append((cost, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._grant())
+        await future
+
+    async def _grant(self):
+        while self._waiting:
+            tenant, waiting = next(iter(self._waiting.items()))
+            cost, future = waiting[0]
+            if future.cancelled():
+                waiting.popleft()
+            else:
+                wait = self.bucket.delay(cost)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                waiting.popleft()
+                self.bucket.consume(cost)
+                future.set_result(None)
+            # Следующий ход — следующему арендатору
+            del self._waiting[tenant]
+            if waiting:
+                self._waiting[tenant] = waiting
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for waiting in self._waiting.values():
+            for _cost, future in waiting:
+                future.cancel()
+        self._waiting.clear()
+
+
+class _Job:
+    __slots__ = ("method", "kwargs", "cost", "future", "tenant")
+
+    def __init__(self, method: str, kwargs: dict, cost: float, future: asyncio.Future, tenant=None):
+        self.method = method
+        self.kwargs = kwargs
+        self.cost = cost
+        self.future = future
+        self.tenant = tenant
+
+
+class TelegramSendQueue:
+    """Все отправки бота идут через эту очередь.
+
+    - у каждого чата своя FIFO-очередь и свой обработчик: порядок сообщений в
+      чате сохраняется, а flood control одного чата не задерживает другие;
+    - общее ведро токенов ограничивает суммарную частоту запросов бота; когда
+      его не хватает, токены достаются арендаторам (сайтам, см. ``for_tenant``)
+      по очереди (FairShare);
+    - на ``RetryAfter`` ждём ровно ``retry_after`` секунд и повторяем тот же запрос;
+    - сетевые ошибки повторяются с экспоненциальной задержкой и случайным разбросом;
+    - ``BadRequest`` не повторяется и сразу возвращается вызывающему.
+
+    ``on_request(method, seconds, error)`` вызывается после каждой попытки
+    (error — None при успехе); используется для метрик.
+    """
+
+    def __init__(self, bot, global_rate: float = DEFAULT_GLOBAL_RATE,
+                 chat_rate_per_minute: float = DEFAULT_CHAT_RATE_PER_MINUTE,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 on_request=None):
+        self.bot = bot
+        self.on_request = on_request
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.global_share = FairShare(self.global_bucket)
+        self.chat_rate = chat_rate_per_minute / 60.0
+        self.chat_burst = max(1.0, chat_rate_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queues: dict = {}
+        self._workers: dict = {}
+        self._buckets: dict = {}
+        self._pending = 0
+
+    @property
+    def depth(self) -> int:
+        """Сколько запросов ждёт отправки (включая выполняющиеся)."""
+        return self._pending
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый event loop (например, повторный asyncio.run) — старые обработчики ему не принадлежат
+            self._loop = loop
+            self._queues = {}
+            self._workers = {}
+            self.global_share = FairShare(self.global_bucket)
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def for_tenant(self, tenant) -> TenantSender:
+        """Очередь от имени арендатора (сайта): общие лимиты, поочерёдная доля общего ведра."""
+        return TenantSender(self, tenant)
+
+    async def call(self, chat_id, method: str, cost: float = 1.0, tenant=None, **kwargs):
+        """Поставить вызов ``bot.<method>(chat_id=..., **kwargs)`` в очередь и дождаться результата."""
+        self._bind_loop()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+        worker = self._workers.get(chat_id)
+        if worker is None or worker.done():
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id, queue))
+        future = self._loop.create_future()
+        queue.put_nowait(_Job(method, dict(kwargs, chat_id=chat_id), cost, future, tenant))
+        self._pending += 1
+        try:
+            return await future
+        finally:
+            self._pending -= 1
+
+    async def send_message(self, chat_id, **kwargs):
+        return await self.call(chat_id, "send_message", **kwargs)
+
+    async def send_document(self, chat_id, **kwargs):
+        return await self.call(chat_id, "send_document", **kwargs)
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        # Альбом Telegram считает как несколько сообщений
+        return await self.call(chat_id, "send_media_group", cost=len(media), media=media, **kwargs)
+
+    async def close(self):
+        """Остановить обработчики очередей (ожидающие вызовы получат CancelledError)."""
+        workers = [worker for worker in self._workers.values() if not worker.done()]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers = {}
+        self.global_share.close()
+
+    async def _worker(self, chat_id, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            try:
+                if job.future.cancelled():
+                    continue
+                result = await self._execute(chat_id, job)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                queue.task_done()
+
+    async def _wait_for_tokens(self, chat_bucket: TokenBucket, cost: float, tenant=None):
+        # У чата один обработчик: пока ждём общее ведро, токены чата никто не потратит
+        while True:
+            wait = chat_bucket.delay(cost)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        await self.global_share.acquire(tenant, cost)
+        chat_bucket.consume(cost)
+
+    async def _execute(self, chat_id, job: _Job):
+        chat_bucket = self._bucket(chat_id)
+        method = getattr(self.bot, job.method)
+        attempt = 0
+        while True:
+            await self._wait_for_tokens(chat_bucket, job.cost, job.tenant)
+            _rewind_files(job.kwargs)
+            started = time.monotonic()
+            try:
+                result = await method(**job.kwargs)
+                self._report(job.method, started, None)
+                return result
+            except RetryAfter as e:
+                self._report(job.method, started, e)
+                delay = retry_after_seconds(e)
+                logger.warning(f"Flood control в чате {chat_id}: ждём {delay:.0f} с перед повтором {job.method}")
+                chat_bucket.block_for(delay)
+                # RetryAfter не считаем неудачной попыткой — Telegram сам назвал время повтора
+            except NetworkError as e:
+                self._report(job.method, started, e)
+                if is_permanent_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                logger.warning(
+                    f"Сетевая ошибка {job.method} в чат {chat_id}: {e}; "
+                    f"повтор {attempt}/{self.max_retries} через {delay:.1f} с"
+                )
+                await asyncio.sleep(delay)
+
+    def _report(self, method: str, started: float, error: Exception | None):
+        if self.on_request is not None:
+            self.on_request(method, time.monotonic() - started, error)
+
+
+class TenantSender:
+    """Очередь отправки одного сайта поверх общей TelegramSendQueue (тот же интерфейс).
+
+    Закрывает общую очередь её владелец, ``close`` здесь ничего не делает.
+    """
+
+    def __init__(self, queue: TelegramSendQueue, tenant):
+        self.queue = queue
+        self.tenant = tenant
+
+    @property
+    def depth(self) -> int:
+        return self.queue.depth
+
+    async def call(self, chat_id, method: str, cost: float = 1.0, **kwargs):
+        return await self.queue.call(chat_id, method, cost=cost, tenant=self.tenant, **kwargs)
+
+    async def send_message(self, chat_id, **kwargs):
+        return await self.call(chat_id, "send_message", **kwargs)
+
+    async def send_document(self, chat_id, **kwargs):
+        return await self.call(chat_id, "send_document", **kwargs)
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        return await self.call(chat_id, "send_media_group", cost=len(media), media=media, **kwargs)
+
+    async def close(self):
+        pass
+
+
+def _rewind_files(kwargs: dict):
+    """Перемотать открытые файлы в начало: иначе повтор загрузит пустой документ."""
+    for value in kwargs.values():
+        if hasattr(value, "seek") and hasattr(value, "read"):
+            try:
+                value.seek(0)
+            except (OSError, ValueError):
+                pass
@@ -0,0 +1,110 @@
+"""Сайты, которые обслуживает бот: один (DJANGO_DB_PATH, CHANNEL_ID) или несколько (SITES).
+
+Определение сайта в SITES — словарь:
+
+- ``name`` — короткое имя (в логах, именах файлов состояния, ответах команд);
+- ``db_path`` — путь к db.sqlite3 сайта;
+- ``channel`` — канал уведомлений (по умолчанию CHANNEL_ID);
+- ``media_root`` — каталог media/ (по умолчанию рядом с db.sqlite3);
+- ``media_url`` — публичный адрес media/ для ссылок на большие файлы (по умолчанию MEDIA_URL);
+- ``admin_url`` — адрес админки Django для ссылок в ответах /lead (по умолчанию ADMIN_URL);
+- ``state_db_path`` — база состояния (по умолчанию bot_state.<name>.sqlite3 рядом с ботом);
+- ``routes`` — маршруты заявок (см. routing.py, по умолчанию нет);
+- ``command_chats`` — чаты, где команды отвечают по этому сайту (кроме его канала);
+- ``socket`` — Unix-сокет событий от Django (по умолчанию нет).
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+from typing import NamedTuple
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SITE_KEYS = {"name", "db_path", "channel", "media_root", "media_url", "admin_url", "state_db_path",
+             "routes", "command_chats", "socket"}
+
+# Сайт, заявки которого обрабатывает текущая задача asyncio (для логов)
+current_site: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_site", default=None)
+
+
+class Site(NamedTuple):
+    name: str
+    db_path: str
+    channel_id: str
+    media_root: str
+    media_url: str | None
+    admin_url: str | None
+    state_db_path: str
+    routes: object
+    command_chats: object
+    socket: str
+
+
+def default_state_db_path(config) -> str:
+    """STATE_DB_PATH или bot_state.sqlite3 рядом с ботом"""
+    return getattr(config, "STATE_DB_PATH", None) or os.path.join(BOT_DIR, "bot_state.sqlite3")
+
+
+def single_site(config) -> Site:
+    """Сайт из настроек одного сайта (DJANGO_DB_PATH, CHANNEL_ID, ...)."""
+    db_path = config.DJANGO_DB_PATH
+    return Site(
+        name="default",
+        db_path=db_path,
+        channel_id=config.CHANNEL_ID,
+        media_root=os.path.join(os.path.dirname(db_path), "media"),
+        media_url=getattr(config, "MEDIA_URL", None),
+        admin_url=getattr(config, "ADMIN_URL", None),
+        state_db_path=default_state_db_path(config),
+        routes=getattr(config, "ROUTES", []),
+        command_chats=getattr(config, "BOT_COMMAND_CHATS", ""),
+        socket=getattr(config, "TELEGRAM_BOT_SOCKET", ""),
+    )
+
+
+def load_sites(config) -> list[Site]:
+    """Сайты из SITES (список словарей или JSON); пусто — один сайт из общих настроек."""
+    definitions = getattr(config, "SITES", None) or []
+    if isinstance(definitions, str):
+        definitions = json.loads(definitions) if definitions.strip() else []
+    if not definitions:
+        return [single_site(config)]
+    sites, names = [], set()
+    for definition in definitions:
+        unknown = set(definition) - SITE_KEYS
+        if unknown:
+            raise ValueError(f"Неизвестные ключи в определении сайта {definition}: {', '.join(sorted(unknown))}")
+        if not definition.get("name") or not definition.get("db_path"):
+            raise ValueError(f"У сайта должны быть name и db_path: {definition}")
+        name = str(definition["name"])
+        if name in names:
+            raise ValueError(f"Сайт {name} указан в SITES дважды")
+        names.add(name)
+        db_path = definition["db_path"]
+        sites.append(Site(
+            name=name,
+            db_path=db_path,
+            channel_id=definition.get("channel") or config.CHANNEL_ID,
+            media_root=definition.get("media_root") or os.path.join(os.path.dirname(db_path), "media"),
+            media_url=definition.get("media_url", getattr(config, "MEDIA_URL", None)),
+            admin_url=definition.get("admin_url", getattr(config, "ADMIN_URL", None)),
+            state_db_path=definition.get("state_db_path") or os.path.join(BOT_DIR, f"bot_state.{name}.sqlite3"),
+            routes=definition.get("routes", []),
+            command_chats=definition.get("command_chats", ""),
+            socket=definition.get("socket", ""),
+        ))
+    return sites
+
+
+class SiteLogFilter(logging.Filter):
+    """Имя сайта перед сообщением лога (в режиме нескольких сайтов)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        site = current_site.get()
+        if site is not None and not getattr(record, "site_tagged", False):
+            record.msg = f"[{site}] {record.msg}"
+            record.site_tagged = True
+        return True
@@ -0,0 +1,195 @@
+"""Локальное состояние бота в SQLite: курсоры и очередь исходящих уведомлений (outbox)."""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursors (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    delivered_at REAL,
+    UNIQUE (kind, source_id)
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, id);
+"""
+
+
+class OutboxItem(NamedTuple):
+    id: int
+    kind: str
+    source_id: int
+    payload: dict
+    attempts: int
+
+
+class StateStore:
+    """Журнал исходящих уведомлений с доставкой «хотя бы один раз».
+
+    Новые заявки попадают в ``outbox`` одной транзакцией на пачку вместе с
+    продвижением курсора ``last_*_id``: после сбоя заявка либо уже лежит в
+    журнале, либо будет прочитана из БД Django заново. Запись помечается
+    доставленной только после ответа Telegram.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        # В WAL коммит с synchronous=NORMAL не делает fsync на каждую транзакцию,
+        # при этом база остаётся целостной после сбоя
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT (ROLLBACK при исключении)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def ensure_schema(self, script: str):
+        """Создать таблицы дополнительного модуля (кэш file_id и т.п.)."""
+        with self._lock:
+            self._conn.executescript(script)
+
+    def query(self, sql: str, params=()) -> list:
+        """Прочитать строки вне транзакции записи."""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # --- курсоры ---
+
+    def get_cursors(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM cursors").fetchall())
+
+    def set_cursors(self, cursors: dict[str, int], also=None):
+        """Записать курсоры; ``also(conn)`` — дополнительные записи в той же транзакции."""
+        with self.transaction() as conn:
+            self._write_cursors(conn, cursors)
+            if also is not None:
+                also(conn)
+
+    @staticmethod
+    def _write_cursors(conn, cursors: dict[str, int]):
+        # Курсоры только растут: запоздавшая запись старого значения их не откатит
+        conn.executemany(
+            "INSERT INTO cursors (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+            list(cursors.items()),
+        )
+
+    def migrate_json_state(self, json_path: str) -> bool:
+        """Перенести курсоры из старого bot_state.json (только если в базе их ещё нет)."""
+        if self.get_cursors() or not os.path.exists(json_path):
+            return False
+        with open(json_path, "r") as f:
+            state = json.load(f)
+        cursors = {
+            name: int(state.get(name) or 0)
+            for name in ("last_call_request_id", "last_print_order_id")
+        }
+        self.set_cursors(cursors)
+        os.replace(json_path, json_path + ".migrated")
+        logger.info(f"Состояние перенесено из {json_path} в {self.path}: {cursors}")
+        return True
+
+    # --- outbox ---
+
+    def enqueue(self, kind: str, items, cursor_name: str, cursor_value: int, also=None) -> list[OutboxItem]:
+        """Добавить пачку [(source_id, payload), ...] и сдвинуть курсор одной транзакцией.
+
+        ``also(conn, created)`` — дополнительные записи в той же транзакции (индекс дублей и т.п.);
+        created — записи, действительно добавленные в outbox.
+        Возвращает добавленные записи (уже бывшие в outbox пропускаются).
+        """
+        now = time.time()
+        created = []
+        with self.transaction() as conn:
+            for source_id, payload in items:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO outbox (kind, source_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (kind, source_id, json.dumps(payload, ensure_ascii=False), now),
+                )
+                if cursor.rowcount:
+                    created.append(OutboxItem(cursor.lastrowid, kind, source_id, payload, 0))
+            self._write_cursors(conn, {cursor_name: cursor_value})
+            if also is not None:
+                also(conn, created)
+        return created
+
+    def pending(self, limit: int = 500, after_id: int = 0) -> list[OutboxItem]:
+        """Недоставленные записи в порядке постановки (начиная после after_id)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, source_id, payload, attempts FROM outbox "
+                "WHERE status = 'pending' AND id > ? ORDER BY id LIMIT ?",
+                (after_id, limit),
+            ).fetchall()
+        return [OutboxItem(row[0], row[1], row[2], json.loads(row[3]), row[4]) for row in rows]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def mark_delivered(self, outbox_ids):
+        """Отметить доставленными (одна транзакция на пачку подтверждений)."""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE outbox SET status = 'delivered', delivered_at = ? WHERE id = ?",
+                [(now, outbox_id) for outbox_id in outbox_ids],
+            )
+
+    def update_payload(self, outbox_id: int, payload: dict):
+        """Записать изменённый payload (например, отметку об уже отправленных файлах)."""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE outbox SET payload = ? WHERE id = ?",
+                (json.dumps(payload, ensure_ascii=False), outbox_id),
+            )
+
+    def mark_failed(self, failures):
+        """Увеличить счётчик попыток [(outbox_id, текст ошибки), ...]; запись остаётся в очереди."""
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                [(error, outbox_id) for outbox_id, error in failures],
+            )
+
+    def purge_delivered(self, older_than: float):
+        """Удалить доставленные записи старше older_than секунд."""
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM outbox WHERE status = 'delivered' AND delivered_at < ?",
+                (time.time() - older_than,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,36 @@
-"""Сборка telegram.Bot (python-telegram-bot 20+) с опциональным HTTP/SOCKS прокси."""
+"""Сборка telegram.Bot (python-telegram-bot 20+) с опциональным HTTP/SOCKS прокси и настройкой пула."""
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
 from urllib.parse import quote
 
+import httpx
 from telegram import Bot
-from telegram.request import HTTPXRequest
+from telegram.request import BaseRequest, HTTPXRequest
+
+from proxy_pool import PROBE_URL, ProxyPoolRequest, Route
+
+logger = logging.getLogger(__name__)
+
+# Параметры HTTP-пула: имя настройки (env / config.py) -> (значение по умолчанию, тип)
+HTTP_SETTINGS = {
+    "TELEGRAM_POOL_SIZE": (8, int),
+    "TELEGRAM_CONNECT_TIMEOUT": (10.0, float),
+    "TELEGRAM_READ_TIMEOUT": (20.0, float),
+    "TELEGRAM_WRITE_TIMEOUT": (60.0, float),
+    "TELEGRAM_POOL_TIMEOUT": (5.0, float),
+    # Сколько секунд держать простаивающее соединение (в httpx по умолчанию всего 5)
+    "TELEGRAM_KEEPALIVE_EXPIRY": (120.0, float),
+    "TELEGRAM_HTTP2": (False, bool),
+    # Прогрев соединения (get_me) при старте и период keep-alive пинга (0 — выключен)
+    "TELEGRAM_WARMUP": (True, bool),
+    "TELEGRAM_KEEPALIVE_PING": (50.0, float),
+    # Несколько прокси (TELEGRAM_PROXY_URLS): добавить ли прямое соединение и период их проверки
+    "TELEGRAM_PROXY_DIRECT": (False, bool),
+    "TELEGRAM_PROXY_PROBE_INTERVAL": (30.0, float),
+}
 
 
 def normalize_telegram_proxy_url(raw: str | None) -> str | None:
@@ -44,10 +69,193 @@ def resolve_proxy_url() -> str | None:
     return normalize_telegram_proxy_url(raw or None)
 
 
-def create_telegram_bot(token: str, proxy_url: str | None = None) -> Bot:
-    """Создать Bot; для SOCKS нужен пакет httpx[socks] (см. requirements.txt)."""
-    proxy = normalize_telegram_proxy_url(proxy_url) if proxy_url else resolve_proxy_url()
-    if proxy:
-        request = HTTPXRequest(proxy_url=proxy)
-        return Bot(token=token, request=request)
-    return Bot(token=token)
+def resolve_proxy_urls() -> list[str]:
+    """Все прокси: TELEGRAM_PROXY_URLS (через запятую, пробел или с новой строки), затем одиночный прокси."""
+    raw = os.getenv("TELEGRAM_PROXY_URLS")
+    if raw is None:
+        try:
+            import config as _cfg
+
+            raw = getattr(_cfg, "TELEGRAM_PROXY_URLS", "")
+        except ImportError:
+            raw = ""
+    if isinstance(raw, str):
+        raw = raw.replace(",", " ").split()
+    urls = [normalize_telegram_proxy_url(value) for value in raw]
+    single = resolve_proxy_url()
+    if single and single not in urls:
+        urls.insert(0, single)
+    return [url for url in urls if url]
+
+
+def resolve_api_url() -> str | None:
+    """Свой адрес Bot API (локальный telegram-bot-api или заглушка для бенчмарка), иначе None."""
+    raw = os.getenv("TELEGRAM_API_URL")
+    if raw is None:
+        try:
+            import config as _cfg
+
+            raw = getattr(_cfg, "TELEGRAM_API_URL", "")
+        except ImportError:
+            raw = ""
+    return (raw or "").strip().rstrip("/") or None
+
+
+def _route_name(proxy_url: str | None) -> str:
+    """Имя маршрута для логов: адрес прокси без логина и пароля."""
+    if not proxy_url:
+        return "direct"
+    scheme, _, rest = proxy_url.partition("://")
+    return f"{scheme}://{rest.rpartition('@')[2]}"
+
+
+def _parse_setting(raw, kind):
+    if kind is bool:
+        if isinstance(raw, str):
+            return raw.strip().lower() in ("1", "true", "yes", "on")
+        return bool(raw)
+    return kind(raw)
+
+
+def resolve_http_settings() -> dict:
+    """Настройки HTTP-пула; порядок как у прокси: переменные окружения, затем config.py."""
+    try:
+        import config as _cfg
+    except ImportError:
+        _cfg = None
+    settings = {}
+    for name, (default, kind) in HTTP_SETTINGS.items():
+        raw = os.getenv(name)
+        if raw is None or raw.strip() == "":
+            raw = getattr(_cfg, name, default)
+        try:
+            settings[name] = _parse_setting(raw, kind)
+        except (TypeError, ValueError):
+            logger.warning(f"Некорректное значение {name}={raw!r}, используем {default!r}")
+            settings[name] = default
+    return settings
+
+
+class TunedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest с настраиваемым keepalive_expiry (в HTTPXRequest он не выставляется)."""
+
+    def __init__(self, keepalive_expiry: float | None = None, **kwargs):
+        super().__init__(**kwargs)
+        if keepalive_expiry is not None:
+            pool_size = kwargs.get("connection_pool_size", 1)
+            self._client_kwargs["limits"] = httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive_expiry,
+            )
+            self._client = self._build_client()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_request(proxy_url: str | None = None, settings: dict | None = None) -> HTTPXRequest:
+    """HTTPXRequest с пулом, таймаутами и keep-alive из настроек (см. HTTP_SETTINGS)."""
+    settings = settings or resolve_http_settings()
+    http_version = "1.1"
+    if settings["TELEGRAM_HTTP2"]:
+        if _http2_available():
+            http_version = "2"
+        else:
+            logger.warning("TELEGRAM_HTTP2 включён, но пакет h2 не установлен (pip install httpx[http2]) — используем HTTP/1.1")
+    kwargs = dict(
+        connection_pool_size=settings["TELEGRAM_POOL_SIZE"],
+        connect_timeout=settings["TELEGRAM_CONNECT_TIMEOUT"],
+        read_timeout=settings["TELEGRAM_READ_TIMEOUT"],
+        write_timeout=settings["TELEGRAM_WRITE_TIMEOUT"],
+        pool_timeout=settings["TELEGRAM_POOL_TIMEOUT"],
+        http_version=http_version,
+    )
+    if proxy_url:
+        kwargs["proxy_url"] = proxy_url
+    return TunedHTTPXRequest(keepalive_expiry=settings["TELEGRAM_KEEPALIVE_EXPIRY"], **kwargs)
+
+
+def create_request(proxy_url: str | None = None, settings: dict | None = None,
+                   api_url: str | None = None) -> BaseRequest:
+    """Запросы к Telegram: один маршрут или пул (несколько прокси / прокси и прямое соединение).
+
+    Пул проверяет маршруты запросом к api_url (свой Bot API), иначе к api.telegram.org.
+    """
+    settings = settings or resolve_http_settings()
+    if proxy_url:
+        return create_http_request(normalize_telegram_proxy_url(proxy_url), settings)
+    proxies = resolve_proxy_urls()
+    targets = list(proxies)
+    if settings["TELEGRAM_PROXY_DIRECT"] and proxies:
+        targets.append(None)
+    if len(targets) <= 1:
+        return create_http_request(targets[0] if targets else None, settings)
+    routes = [Route(_route_name(target), create_http_request(target, settings)) for target in targets]
+    logger.info(f"Маршруты до Telegram API: {', '.join(route.name for route in routes)}")
+    return ProxyPoolRequest(
+        routes,
+        probe_interval=settings["TELEGRAM_PROXY_PROBE_INTERVAL"],
+        probe_url=f"{api_url}/" if api_url else PROBE_URL,
+    )
+
+
+def create_polling_request(proxy_url: str | None = None, settings: dict | None = None) -> BaseRequest:
+    """Запросы get_updates: одно соединение через первый прокси.
+
+    Не через пул маршрутов: долгий опрос (десятки секунд на ответ) испортил бы
+    статистику задержек, по которой пул выбирает маршрут.
+    """
+    settings = dict(settings or resolve_http_settings(), TELEGRAM_POOL_SIZE=1)
+    if proxy_url:
+        return create_http_request(normalize_telegram_proxy_url(proxy_url), settings)
+    proxies = resolve_proxy_urls()
+    return create_http_request(proxies[0] if proxies else None, settings)
+
+
+def create_telegram_bot(token: str, proxy_url: str | None = None, api_url: str | None = None) -> Bot:
+    """Создать Bot; для SOCKS нужен пакет httpx[socks] (см. requirements.txt).
+
+    api_url (или TELEGRAM_API_URL) — адрес Bot API вместо https://api.telegram.org.
+    """
+    api_url = api_url or resolve_api_url()
+    kwargs = dict(
+        token=token,
+        request=create_request(proxy_url, api_url=api_url),
+        get_updates_request=create_polling_request(proxy_url),
+    )
+    if api_url:
+        kwargs.update(base_url=f"{api_url}/bot", base_file_url=f"{api_url}/file/bot")
+    return Bot(**kwargs)
+
+
+async def warm_up(bot: Bot) -> bool:
+    """Открыть соединение заранее (TCP + TLS + SOCKS), чтобы первое уведомление не ждало рукопожатия."""
+    if not resolve_http_settings()["TELEGRAM_WARMUP"]:
+        return False
+    try:
+        me = await bot.get_me()
+        logger.info(f"Соединение с Telegram прогрето: @{me.username}")
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось прогреть соединение с Telegram: {e}")
+        return False
+
+
+async def keep_alive(bot: Bot, interval: float | None = None):
+    """Периодический get_me, чтобы прокси и пул не закрывали простаивающее соединение."""
+    if interval is None:
+        interval = resolve_http_settings()["TELEGRAM_KEEPALIVE_PING"]
+    if not interval or interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await bot.get_me()
+        except Exception as e:
+            logger.debug(f"Keep-alive пинг Telegram не удался: {e}")
@@ -6,7 +6,7 @@ from datetime import datetime
 from telegram.error import TelegramError
 
 from config import BOT_TOKEN, CHANNEL_ID
-from telegram_client import create_telegram_bot, resolve_proxy_url
+from telegram_client import create_telegram_bot, resolve_http_settings, resolve_proxy_url
 
 
 async def test_bot():
@@ -18,6 +18,13 @@ async def test_bot():
         print("Прокси: да (TELEGRAM_PROXY_URL / TELEGRAM_PROXY)")
     else:
         print("Прокси: нет")
+    http = resolve_http_settings()
+    print(
+        f"HTTP: пул {http['TELEGRAM_POOL_SIZE']}, таймауты connect/read/write/pool "
+        f"{http['TELEGRAM_CONNECT_TIMEOUT']}/{http['TELEGRAM_READ_TIMEOUT']}/"
+        f"{http['TELEGRAM_WRITE_TIMEOUT']}/{http['TELEGRAM_POOL_TIMEOUT']} с, "
+        f"keep-alive {http['TELEGRAM_KEEPALIVE_EXPIRY']} с, HTTP/2: {'да' if http['TELEGRAM_HTTP2'] else 'нет'}"
+    )
 
     try:
         bot = create_telegram_bot(BOT_TOKEN)
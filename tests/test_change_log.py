@@ -0,0 +1,205 @@
+"""Журнал изменений: триггеры на настоящей SQLite-базе «Django» и правка отправленных сообщений через StatusSync."""
+import asyncio
+import sqlite3
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, NetworkError
+
+from change_log import CHANGELOG_TABLE, CURSOR_NAME, StatusSync, install, install_script
+from db_connection import DjangoDatabase
+from lead_stats import LeadStats
+from state_store import StateStore
+
+DJANGO_SCHEMA = """
+CREATE TABLE main_callrequest (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT, phone TEXT, created_at TEXT, is_processed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE main_printorder (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT, phone TEXT, email TEXT, service_type TEXT, message TEXT, file TEXT,
+    created_at TEXT, is_processed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+MAIN = -100100
+COPY = -100900
+
+
+def status(row):
+    return "✅ обработана" if row.is_processed else "🆕 новая"
+
+
+class FakeSender:
+    """TelegramSendQueue.call: записывает правки; errors[(chat_id, message_id)] — исключения для первых попыток."""
+
+    def __init__(self):
+        self.calls = []
+        self.errors = {}
+
+    async def call(self, chat_id, method, **kwargs):
+        self.calls.append((chat_id, method, kwargs))
+        raised = self.errors.get((chat_id, kwargs["message_id"]))
+        if raised:
+            raise raised.pop(0)
+        return True
+
+
+class Django:
+    """Запись в «БД Django», как это делает сайт."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+
+    def execute(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+@pytest.fixture
+def django(tmp_path):
+    path = str(tmp_path / "db.sqlite3")
+    django = Django(path)
+    django.conn.executescript(DJANGO_SCHEMA)
+    django.execute("INSERT INTO main_callrequest (name, phone, created_at) VALUES ('Иван', '+7999', '2026-10-17 10:00:00')")
+    django.execute("INSERT INTO main_callrequest (name, phone, created_at) VALUES ('Пётр', '+7998', '2026-10-17 10:05:00')")
+    django.execute(
+        "INSERT INTO main_printorder (name, phone, email, service_type, message, file, created_at) "
+        "VALUES ('Анна', '+7997', 'a@example.com', '3d_printing', '', '', '2026-10-17 11:00:00')"
+    )
+    install(path)
+    django.path = path
+    yield django
+    django.close()
+
+
+@pytest.fixture
+def sync(django, tmp_path):
+    state = StateStore(str(tmp_path / "state.sqlite3"))
+    db = DjangoDatabase(django.path)
+    bot = SimpleNamespace(
+        state=state,
+        db=db,
+        stats=LeadStats(state),
+        sender=FakeSender(),
+        format_call_request=lambda row: f"📞 {row.name}\n{status(row)}",
+        format_print_order=lambda row: f"🖨 {row.name}\n{status(row)}",
+    )
+    sync = StatusSync(bot, retry_delay=0)
+    yield sync
+    db.close()
+    state.close()
+
+
+def remember_sent(sync):
+    """Сообщения, отправленные до изменения статуса: звонок 1 — в два чата, заявка на печать — подписью к файлу."""
+    sync.remember("call_request", 1, MAIN, 11, "📞 Иван\n🆕 новая", "📞 Иван\n🆕 новая")
+    sync.remember("call_request", 1, COPY, 91, "📞 Иван\n🆕 новая", "📞 Иван\n🆕 новая")
+    sync.remember("call_request", 2, MAIN, 12, "📞 Пётр\n🆕 новая", "📞 Пётр\n🆕 новая")
+    sync.remember("print_order", 1, MAIN, 13, "🖨 Анна\n🆕 новая", "🖨 Анна\n🆕 новая\n\n📎 model.stl", is_caption=True)
+
+
+def sent_messages(sync):
+    return {
+        (kind, source_id, chat_id): text
+        for kind, source_id, chat_id, text in sync.state.query(
+            "SELECT kind, source_id, chat_id, text FROM sent_messages"
+        )
+    }
+
+
+def test_triggers_log_inserts_and_updates(django):
+    django.execute("UPDATE main_callrequest SET is_processed = 1 WHERE id = 2")
+    django.execute("INSERT INTO main_printorder (name, created_at) VALUES ('Олег', '2026-10-17 12:00:00')")
+    changes = django.execute(f"SELECT tbl, row_id, op FROM {CHANGELOG_TABLE} ORDER BY seq")
+    assert changes == [("main_callrequest", 2, "update"), ("main_printorder", 2, "insert")]
+
+
+def test_changelog_is_trimmed(django):
+    django.conn.executescript(install_script(keep=3))
+    for _ in range(5):
+        django.execute("UPDATE main_callrequest SET is_processed = 1 - is_processed WHERE id = 1")
+    seqs = [seq for (seq,) in django.execute(f"SELECT seq FROM {CHANGELOG_TABLE} ORDER BY seq")]
+    assert seqs == [3, 4, 5]
+
+
+def test_processed_lead_messages_are_edited(django, sync):
+    remember_sent(sync)
+    # Первый запуск с журналом запоминает его конец
+    assert asyncio.run(sync.sync())
+    assert sync.state.get_cursors() == {CURSOR_NAME: 0}
+
+    django.execute("UPDATE main_callrequest SET is_processed = 1 WHERE id = 1")
+    django.execute("UPDATE main_printorder SET is_processed = 1 WHERE id = 1")
+    assert asyncio.run(sync.sync())
+
+    edits = {(chat_id, kwargs["message_id"]): (method, kwargs.get("text") or kwargs.get("caption"))
+             for chat_id, method, kwargs in sync.bot.sender.calls}
+    assert edits == {
+        (MAIN, 11): ("edit_message_text", "📞 Иван\n✅ обработана"),
+        (COPY, 91): ("edit_message_text", "📞 Иван\n✅ обработана"),
+        # Добавленное ботом после текста заявки сохраняется
+        (MAIN, 13): ("edit_message_caption", "🖨 Анна\n✅ обработана\n\n📎 model.stl"),
+    }
+    assert sent_messages(sync) == {
+        ("call_request", 1, MAIN): "📞 Иван\n✅ обработана",
+        ("call_request", 1, COPY): "📞 Иван\n✅ обработана",
+        ("call_request", 2, MAIN): "📞 Пётр\n🆕 новая",
+        ("print_order", 1, MAIN): "🖨 Анна\n✅ обработана\n\n📎 model.stl",
+    }
+    assert sync.state.get_cursors() == {CURSOR_NAME: 2}
+
+
+def test_unchanged_text_is_not_edited(django, sync):
+    remember_sent(sync)
+    asyncio.run(sync.sync())
+    django.execute("UPDATE main_callrequest SET phone = '+7000' WHERE id = 2")
+    assert asyncio.run(sync.sync())
+    assert sync.bot.sender.calls == []
+    assert sync.state.get_cursors() == {CURSOR_NAME: 1}
+
+
+def test_message_gone_is_forgotten(django, sync):
+    remember_sent(sync)
+    asyncio.run(sync.sync())
+    sync.bot.sender.errors[(COPY, 91)] = [BadRequest("Message to edit not found")]
+    django.execute("UPDATE main_callrequest SET is_processed = 1 WHERE id = 1")
+    assert asyncio.run(sync.sync())
+    messages = sent_messages(sync)
+    assert ("call_request", 1, COPY) not in messages
+    assert messages[("call_request", 1, MAIN)] == "📞 Иван\n✅ обработана"
+
+
+def test_network_error_keeps_cursor_until_retry(django, sync):
+    remember_sent(sync)
+    asyncio.run(sync.sync())
+    sync.bot.sender.errors[(COPY, 91)] = [NetworkError("timeout")]
+    django.execute("UPDATE main_callrequest SET is_processed = 1 WHERE id = 1")
+    assert not asyncio.run(sync.sync())
+    assert sync.state.get_cursors() == {CURSOR_NAME: 0}
+    assert asyncio.run(sync.sync())
+    assert sync.state.get_cursors() == {CURSOR_NAME: 1}
+    assert sent_messages(sync)[("call_request", 1, COPY)] == "📞 Иван\n✅ обработана"
+
+
+def test_processed_lead_goes_to_stats(django, sync):
+    with sync.state.transaction() as conn:
+        sync.bot.stats.write(conn, (Counter(), [("call_request", 2, 1000.0)]))
+    asyncio.run(sync.sync())
+    django.execute("UPDATE main_callrequest SET is_processed = 1 WHERE id = 2")
+    assert asyncio.run(sync.sync())
+    # Сообщение заявки не запоминалось, но статистика её учла
+    assert sync.bot.sender.calls == []
+    assert sync.bot.stats.pending("call_request", [2]) == {}
+    assert sum(count for (count,) in sync.state.query("SELECT count FROM stats_processing")) == 1
+
+
+def test_without_changelog_nothing_is_read(django, sync):
+    install(django.path, uninstall=True)
+    assert asyncio.run(sync.sync())
+    assert sync.available is False
+    assert sync.state.get_cursors() == {}
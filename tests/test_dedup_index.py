@@ -0,0 +1,108 @@
+"""DedupIndex: истечение по «колесу» корзин, откат несохранённых изменений, восстановление из базы состояния."""
+import time
+
+import pytest
+
+from dedup_index import DedupIndex, normalize_key
+from state_store import StateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_normalize_key_ignores_case_spaces_and_phone_format():
+    assert normalize_key("  Иван   Петров ", "8 (999) 123-45-67") == normalize_key("иван петров", "+79991234567")
+
+
+def test_key_expires_after_ttl(store):
+    index = DedupIndex(store, ttl=120, bucket_width=10)
+    index.add("Иван", "+79991234567", now=1000)
+    assert index.contains("Иван", "+79991234567", now=1119)
+    assert not index.contains("Иван", "+79991234567", now=1121)
+    # Корзина целиком в прошлом — ключ удалён из словаря
+    index.contains("Другой", "1", now=1200)
+    assert len(index) == 0
+
+
+def test_repeated_add_extends_expiry(store):
+    index = DedupIndex(store, ttl=120, bucket_width=10)
+    index.add("Иван", "+79991234567", now=1000)
+    index.add("Иван", "+79991234567", now=1100)
+    # Старая корзина срабатывает, но продлённый ключ остаётся
+    assert index.contains("Иван", "+79991234567", now=1150)
+    assert not index.contains("Иван", "+79991234567", now=1221)
+
+
+def test_check_and_add(store):
+    index = DedupIndex(store, ttl=120)
+    assert not index.check_and_add("Иван", "+79991234567", now=1000)
+    assert index.check_and_add("иван", "89991234567", now=1010)
+
+
+def test_rollback_forgets_new_keys(store):
+    index = DedupIndex(store, ttl=120)
+    index.add("Иван", "+79991234567", now=1000)
+    index.rollback(index.take_changes())
+    assert not index.contains("Иван", "+79991234567", now=1001)
+
+
+def test_rollback_restores_previous_expiry(store):
+    index = DedupIndex(store, ttl=120)
+    index.add("Иван", "+79991234567", now=1000)
+    index.take_changes()
+    index.add("Иван", "+79991234567", now=1100)
+    index.rollback(index.take_changes())
+    assert index.contains("Иван", "+79991234567", now=1110)
+    assert not index.contains("Иван", "+79991234567", now=1121)
+
+
+def test_take_changes_keeps_first_previous_value(store):
+    index = DedupIndex(store, ttl=120)
+    index.add("Иван", "+79991234567", now=1000)
+    index.add("Иван", "+79991234567", now=1010)
+    # Два добавления в одной пачке: откат возвращает состояние до пачки
+    changes = index.take_changes()
+    assert list(changes.values()) == [(1130, None)]
+    assert index.take_changes() == {}
+
+
+def test_reload_from_state_db(store):
+    now = time.time()
+    index = DedupIndex(store, ttl=120)
+    index.add("Иван", "+79991234567", now=now)
+    index.add("Старый", "+79990000000", now=now - 600)
+    changes = index.take_changes()
+    with store.transaction() as conn:
+        DedupIndex.write(conn, changes)
+
+    restored = DedupIndex(store, ttl=120)
+    restored.load()
+    assert restored.contains("Иван", "+79991234567", now=now + 1)
+    # Истёкшие ключи удаляются при записи и не восстанавливаются
+    assert len(restored) == 1
+    assert store.query("SELECT COUNT(*) FROM dedup")[0][0] == 1
+
+
+def test_failed_enqueue_rolls_back_index_and_db(store):
+    index = DedupIndex(store, ttl=120)
+    index.add("Иван", "+79991234567")
+    changes = index.take_changes()
+
+    def write_indexes(conn, created):
+        DedupIndex.write(conn, changes)
+        raise RuntimeError("запись пачки не удалась")
+
+    with pytest.raises(RuntimeError):
+        store.enqueue("call_request", [(1, {"text": "x"})], "last_call_request_id", 1, also=write_indexes)
+    index.rollback(changes)
+
+    assert not index.contains("Иван", "+79991234567")
+    assert store.query("SELECT COUNT(*) FROM dedup")[0][0] == 0
+    assert store.query("SELECT COUNT(*) FROM outbox")[0][0] == 0
+    restored = DedupIndex(store, ttl=120)
+    restored.load()
+    assert len(restored) == 0
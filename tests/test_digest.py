@@ -0,0 +1,150 @@
+"""DigestBuffer: упаковка заявок в сводку, отправка по размеру (лимит Telegram) и по времени."""
+import asyncio
+
+import pytest
+
+from digest import MESSAGE_LIMIT, DigestBuffer, digest_header, render_digest
+
+
+class Recorder:
+    """send и on_done для DigestBuffer: сводки и результаты по заявкам."""
+
+    def __init__(self, results=()):
+        self.results = list(results)
+        self.sent = []
+        self.done = []
+
+    async def send(self, texts):
+        self.sent.append(list(texts))
+        return self.results.pop(0) if self.results else True
+
+    def on_done(self, items, ok):
+        self.done.extend((item, ok) for item in items)
+
+
+def lead_text(n, size=200):
+    return f"<b>Заявка #{n}</b>\n" + "x" * size
+
+
+def test_several_leads_in_one_message():
+    recorder = Recorder()
+
+    async def scenario():
+        digest = DigestBuffer(recorder.send, recorder.on_done, threshold=3, window=60)
+        for n in range(5):
+            digest.add(n, lead_text(n))
+        await digest.flush()
+
+    asyncio.run(scenario())
+    assert recorder.sent == [[lead_text(n) for n in range(5)]]
+    assert recorder.done == [(n, True) for n in range(5)]
+    text = render_digest(recorder.sent[0])
+    assert text.startswith(digest_header(5))
+    assert all(lead_text(n) in text for n in range(5))
+
+
+def test_size_limit_splits_under_telegram_limit():
+    recorder = Recorder()
+    texts = [lead_text(n, size=size) for n, size in enumerate([1500, 900, 1700, 300, 2500, 40, 3900, 1200] * 3)]
+
+    async def scenario():
+        digest = DigestBuffer(recorder.send, recorder.on_done, threshold=1, window=60)
+        for n, text in enumerate(texts):
+            digest.add(n, text)
+        await digest.flush()
+
+    asyncio.run(scenario())
+    assert len(recorder.sent) > 1
+    assert all(len(render_digest(sent)) <= MESSAGE_LIMIT for sent in recorder.sent)
+    # Все заявки ровно один раз и в исходном порядке
+    assert [text for sent in recorder.sent for text in sent] == texts
+    assert recorder.done == [(n, True) for n in range(len(texts))]
+
+
+def test_size_limit_flushes_without_waiting_for_window():
+    recorder = Recorder()
+
+    async def scenario():
+        digest = DigestBuffer(recorder.send, recorder.on_done, threshold=1, window=60)
+        digest.add(1, lead_text(1, size=3000))
+        digest.add(2, lead_text(2, size=3000))
+        await asyncio.sleep(0)
+        # Первая сводка ушла, вторая ждёт окна
+        assert recorder.sent == [[lead_text(1, size=3000)]]
+        await digest.close()
+
+    asyncio.run(scenario())
+    assert recorder.done == [(1, True)]
+
+
+def test_time_window_flushes():
+    recorder = Recorder()
+
+    async def scenario():
+        digest = DigestBuffer(recorder.send, recorder.on_done, threshold=1, window=0.05)
+        digest.add(1, lead_text(1))
+        digest.add(2, lead_text(2))
+        await asyncio.sleep(0.01)
+        assert recorder.sent == []
+        await asyncio.sleep(0.1)
+        assert recorder.sent == [[lead_text(1), lead_text(2)]]
+        # Следующий текст запускает новое окно
+        digest.add(3, lead_text(3))
+        await asyncio.sleep(0.1)
+        await digest.close()
+
+    asyncio.run(scenario())
+    assert recorder.sent == [[lead_text(1), lead_text(2)], [lead_text(3)]]
+
+
+def test_failed_send_reports_every_lead():
+    recorder = Recorder(results=[False])
+
+    async def scenario():
+        digest = DigestBuffer(recorder.send, recorder.on_done, threshold=1, window=60)
+        digest.add(1, lead_text(1))
+        digest.add(2, lead_text(2))
+        await digest.flush()
+
+    asyncio.run(scenario())
+    assert recorder.done == [(1, False), (2, False)]
+
+
+def test_send_exception_is_a_failure():
+    done = []
+
+    async def send(texts):
+        raise RuntimeError("timeout")
+
+    async def scenario():
+        digest = DigestBuffer(send, lambda items, ok: done.extend((item, ok) for item in items), threshold=1)
+        digest.add(1, lead_text(1))
+        await digest.flush()
+
+    asyncio.run(scenario())
+    assert done == [(1, False)]
+
+
+def test_should_pack_stays_on_until_buffer_is_empty():
+    recorder = Recorder()
+
+    async def scenario():
+        digest = DigestBuffer(recorder.send, recorder.on_done, threshold=3, window=60)
+        assert not digest.should_pack(3)
+        assert digest.should_pack(4)
+        digest.add(1, lead_text(1))
+        # Очередь опустела, но в буфере заявка: следующие тоже в сводку, иначе обгонят её
+        assert digest.should_pack(0)
+        await digest.flush()
+        assert not digest.should_pack(0)
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("size, fits", [(4000, True), (4096, False)])
+def test_fits_alone(size, fits):
+    digest = DigestBuffer(None, None, threshold=1)
+    text = "x" * size
+    assert digest.fits_alone(text) == fits
+    if fits:
+        assert len(render_digest([text])) <= MESSAGE_LIMIT
@@ -0,0 +1,103 @@
+"""FileIdCache: lookup/remember/forget, устаревание по max_age, evict по возрасту и числу записей."""
+import asyncio
+import time
+
+import pytest
+
+import file_cache
+from file_cache import FileIdCache, hash_file
+from state_store import StateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    yield store
+    store.close()
+
+
+def age(store, sha256, seconds):
+    """Сдвинуть last_used записи в прошлое."""
+    with store.transaction() as conn:
+        conn.execute("UPDATE file_ids SET last_used = ? WHERE sha256 = ?", (time.time() - seconds, sha256))
+
+
+def last_used(store, sha256):
+    return store.query("SELECT last_used FROM file_ids WHERE sha256 = ?", (sha256,))[0][0]
+
+
+def test_remember_lookup_forget(store):
+    cache = FileIdCache(store)
+    assert cache.lookup("a" * 64) is None
+    cache.remember("a" * 64, "FILE_A", 10)
+    assert cache.lookup("a" * 64) == "FILE_A"
+    # Повторная загрузка того же содержимого заменяет file_id
+    cache.remember("a" * 64, "FILE_A2", 10)
+    assert cache.lookup("a" * 64) == "FILE_A2"
+    cache.forget("a" * 64)
+    assert cache.lookup("a" * 64) is None
+
+
+def test_lookup_refreshes_last_used(store):
+    cache = FileIdCache(store, max_age=3600)
+    cache.remember("a" * 64, "FILE_A", 10)
+    age(store, "a" * 64, 3000)
+    assert cache.lookup("a" * 64) == "FILE_A"
+    assert last_used(store, "a" * 64) > time.time() - 60
+
+
+def test_lookup_ignores_entries_older_than_max_age(store):
+    cache = FileIdCache(store, max_age=3600)
+    cache.remember("a" * 64, "FILE_A", 10)
+    age(store, "a" * 64, 3601)
+    assert cache.lookup("a" * 64) is None
+    # Устаревшая запись не «оживает» от неудачного поиска
+    assert last_used(store, "a" * 64) < time.time() - 3600
+
+
+def test_evict_by_age_and_count(store):
+    cache = FileIdCache(store, max_age=3600, max_entries=2)
+    for n, sha256 in enumerate(("a" * 64, "b" * 64, "c" * 64, "d" * 64)):
+        cache.remember(sha256, f"FILE_{n}", 10)
+        age(store, sha256, 100 - n)
+    age(store, "d" * 64, 7200)
+    cache.evict()
+    # d устарела, из остальных остаются две последних по использованию
+    remaining = {row[0] for row in store.query("SELECT sha256 FROM file_ids")}
+    assert remaining == {"b" * 64, "c" * 64}
+
+
+def test_evict_runs_while_remembering(store, monkeypatch):
+    monkeypatch.setattr(file_cache, "EVICT_EVERY", 3)
+    cache = FileIdCache(store, max_entries=2)
+    for n in range(3):
+        cache.remember(str(n) * 64, f"FILE_{n}", 10)
+    assert store.query("SELECT COUNT(*) FROM file_ids")[0][0] == 2
+
+
+def test_digest_remembers_path_until_file_changes(store, tmp_path):
+    cache = FileIdCache(store)
+    path = tmp_path / "model.stl"
+    path.write_bytes(b"solid a")
+    assert asyncio.run(cache.digest(str(path))) == hash_file(str(path))
+    assert store.query("SELECT COUNT(*) FROM file_hashes")[0][0] == 1
+    path.write_bytes(b"solid ab")
+    assert asyncio.run(cache.digest(str(path))) == hash_file(str(path))
+    # Временные файлы не запоминаются
+    other = tmp_path / "part.zip"
+    other.write_bytes(b"zip")
+    asyncio.run(cache.digest(str(other), remember_path=False))
+    assert store.query("SELECT COUNT(*) FROM file_hashes")[0][0] == 1
+
+
+def test_evict_drops_path_hashes_without_file_id(store, tmp_path):
+    cache = FileIdCache(store)
+    path = tmp_path / "model.stl"
+    path.write_bytes(b"solid a")
+    sha256 = asyncio.run(cache.digest(str(path)))
+    cache.remember(sha256, "FILE_A", 7)
+    cache.evict()
+    assert store.query("SELECT COUNT(*) FROM file_hashes")[0][0] == 1
+    cache.forget(sha256)
+    cache.evict()
+    assert store.query("SELECT COUNT(*) FROM file_hashes")[0][0] == 0
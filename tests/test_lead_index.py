@@ -0,0 +1,81 @@
+"""build_query: пользовательский ввод /find не должен попадать в синтаксис FTS5 как есть."""
+from types import SimpleNamespace
+
+import pytest
+
+from lead_index import LeadIndex, build_query, phone_terms
+from state_store import StateStore
+
+HOSTILE = [
+    'a"b', '"', '"""', "*", "x*", "-", "-foo", "- -", "foo OR bar", "a NOT b", "AND",
+    "NEAR(a b)", "NEAR", "name:x", "phone:7*", "^x", "(", "a) OR (b", "тест:*\"",
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    index = LeadIndex(store)
+    if not index.available:
+        store.close()
+        pytest.skip("SQLite собран без FTS5")
+    index.add("call_request", [
+        SimpleNamespace(id=1, name='Иван "Ваня" Петров', phone="+7 (999) 123-45-67", created_at="2026-01-01 10:00:00"),
+    ])
+    index.add("print_order", [
+        SimpleNamespace(id=2, name="Anna OR Smith", phone="89997654321", created_at="2026-01-02 11:00:00",
+                        email="anna@example.com", service_type="3d_printing", message="NEAR корпус -деталь"),
+    ])
+    yield index
+    store.close()
+
+
+@pytest.mark.parametrize("text", [None, "", "   ", "*", "-", '"', '"""', "- -", "(", ")"])
+def test_empty_or_punctuation_only_gives_no_query(text):
+    assert build_query(text) is None
+
+
+def test_quotes_are_doubled_inside_a_quoted_prefix():
+    assert build_query('a"b') == '"a""b"*'
+    assert build_query('тест:*"') == '"тест:*"""*'
+
+
+@pytest.mark.parametrize("operator", ["OR", "NOT", "AND", "NEAR"])
+def test_operators_are_quoted_terms(operator):
+    assert build_query(f"foo {operator} bar") == f'"foo"* AND "{operator}"* AND "bar"*'
+
+
+def test_minus_and_star_stay_inside_quotes():
+    assert build_query("-foo") == '"-foo"*'
+    assert build_query("x*") == '"x*"*'
+    assert build_query("NEAR(a b)") == '"NEAR(a"* AND "b)"*'
+
+
+def test_phone_like_input_searches_phone_column():
+    assert build_query("+7 (999) 123-45-67") == '(phone:"79991234567"* OR phone:"9991234567"*)'
+    assert build_query("8999") == '(phone:"8999"* OR phone:"999"*)'
+    assert build_query("Иван 999") == '"Иван"* AND (phone:"999"*)'
+
+
+def test_phone_terms_store_both_forms():
+    assert phone_terms("8 (999) 123-45-67") == "79991234567 9991234567"
+
+
+@pytest.mark.parametrize("text", HOSTILE)
+def test_hostile_input_is_a_valid_match_expression(index, text):
+    # Не должно быть sqlite3.OperationalError (fts5: syntax error)
+    assert isinstance(index.search(text), list)
+
+
+def test_search_finds_by_name_with_quotes_phone_and_operator_words(index):
+    assert [lead.source_id for lead in index.search('"Ваня"')] == [1]
+    assert [lead.source_id for lead in index.search("8 999 123")] == [1]
+    assert [lead.source_id for lead in index.search("anna OR")] == [2]
+    assert [lead.source_id for lead in index.search("near")] == [2]
+    assert [lead.source_id for lead in index.search("печать")] == [2]
+    assert index.search("Иван OR Anna") == []
+
+
+def test_get_by_id(index):
+    assert [(lead.kind, lead.source_id) for lead in index.get(2)] == [("print_order", 2)]
+    assert index.get(3) == []
@@ -0,0 +1,92 @@
+"""LeadStats: корзины по дням и часам, медиана до обработки, сводка за один день."""
+import time
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from lead_stats import LeadStats, format_daily
+from state_store import StateStore
+
+DAY = date(2026, 10, 17)
+NEXT_DAY = date(2026, 10, 18)
+
+
+@pytest.fixture
+def stats(tmp_path):
+    store = StateStore(str(tmp_path / "state.sqlite3"))
+    yield LeadStats(store)
+    store.close()
+
+
+def at(day: date, hour: int) -> float:
+    return datetime(day.year, day.month, day.day, hour).timestamp()
+
+
+def lead(source_id, created_at, service_type="", is_processed=False):
+    return SimpleNamespace(id=source_id, created_at=created_at, service_type=service_type, is_processed=is_processed)
+
+
+def add(stats, kind, rows, processed=()):
+    with stats.store.transaction() as conn:
+        stats.write(conn, stats.entries(kind, rows, lambda created_at: created_at))
+        stats.record_processed(conn, list(processed))
+
+
+@pytest.fixture
+def two_days(stats):
+    add(stats, "print_order", [lead(1, at(DAY, 10), "3d_printing")],
+        processed=[("print_order", 1, at(DAY, 10), at(DAY, 10) + 120)])
+    add(stats, "print_order", [lead(2 + n, at(NEXT_DAY, 9), "3d_scanning") for n in range(5)],
+        processed=[("print_order", 2 + n, at(NEXT_DAY, 9), at(NEXT_DAY, 9) + 5 * 3600) for n in range(5)])
+    add(stats, "call_request", [lead(1, at(NEXT_DAY, 11))])
+    return stats
+
+
+def test_day_summary_counts_only_that_day(two_days):
+    summary = two_days.day_summary(DAY)
+    assert summary["today"] == {"print_order": 1}
+    assert summary["total"] == {"print_order": 1}
+    assert summary["services"] == {"3d_printing": 1}
+    assert summary["hours"] == {10: 1}
+    assert summary["processed"] == 1
+    # Одна заявка в корзине 60–300 с: медиана — середина корзины
+    assert summary["median_to_processed"] == pytest.approx(180)
+
+
+def test_day_summary_of_next_day(two_days):
+    summary = two_days.day_summary(NEXT_DAY)
+    assert summary["today"] == {"print_order": 5, "call_request": 1}
+    assert summary["services"] == {"3d_scanning": 5}
+    assert summary["hours"] == {9: 5, 11: 1}
+    assert summary["processed"] == 5
+    assert 14400 < summary["median_to_processed"] <= 28800
+
+
+def test_summary_over_several_days(two_days):
+    summary = two_days.summary(days=7, today=NEXT_DAY)
+    assert summary["today"] == {"print_order": 5, "call_request": 1}
+    assert summary["yesterday"] == {"print_order": 1}
+    assert summary["total"] == {"print_order": 6, "call_request": 1}
+    assert summary["services"] == {"3d_scanning": 5, "3d_printing": 1}
+    # Почасовая гистограмма — только за последний день
+    assert summary["hours"] == {9: 5, 11: 1}
+    assert summary["processed"] == 6
+
+
+def test_daily_post_lists_only_that_day_services(two_days):
+    text = format_daily(two_days.day_summary(DAY), DAY)
+    assert "Заявки за 17.10.2026:</b> <b>1</b> (печать 1)" in text
+    assert "3D сканирование" not in text
+
+
+def test_rows_already_counted_are_not_pending_twice(stats):
+    add(stats, "print_order", [lead(1, at(DAY, 10))])
+    add(stats, "print_order", [lead(1, at(DAY, 10))])
+    assert stats.pending("print_order", [1, 2]) == {1: at(DAY, 10)}
+
+
+def test_purge_keeps_recent_hours(stats):
+    add(stats, "call_request", [lead(1, time.time())])
+    stats.purge()
+    assert sum(stats.summary(days=1)["hours"].values()) == 1
@@ -0,0 +1,190 @@
+"""NotificationPipeline с поддельным ботом поверх настоящего StateStore: откат курсоров, порядок, повторы."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from pipeline import NotificationPipeline, RowBatch
+from state_store import StateStore
+
+CURSOR = "last_call_request_id"
+
+
+class FakeBot:
+    """Таблица заявок в памяти, страницы по page_size строк; курсор чтения сдвигается по мере чтения, как в боте."""
+
+    def __init__(self, state, ids, page_size=2):
+        self.state = state
+        self.rows = [SimpleNamespace(id=source_id) for source_id in ids]
+        self.page_size = page_size
+        self.last_id = 0
+        self.recheck_pending = False
+        # Сколько раз уронить запись пачки, начинающейся с этой заявки
+        self.fail_enqueue = {}
+        self.cursors = []
+        self.delivered = []
+        self.reads = []
+        # Результаты отправки сводок по порядку (дальше — успех)
+        self.digest_results = []
+        self.digests = []
+        self.uploads = []
+
+    async def check_for_updates(self):
+        self.recheck_pending = False
+        while True:
+            rows = [row for row in self.rows if row.id > self.last_id][:self.page_size]
+            if not rows:
+                return
+            self.reads.append(rows[0].id)
+            self.last_id = rows[-1].id
+            yield RowBatch("call_request", rows, {})
+
+    async def enqueue_batch(self, batch):
+        first = batch.rows[0].id
+        if self.fail_enqueue.get(first):
+            self.fail_enqueue[first] -= 1
+            # Стадия чтения успевает прочитать следующие страницы
+            await asyncio.sleep(0.01)
+            raise RuntimeError("database is locked")
+        items = [(row.id, {"text": f"#{row.id}"}) for row in batch.rows]
+        created = await asyncio.to_thread(self.state.enqueue, batch.kind, items, CURSOR, batch.rows[-1].id)
+        self.cursors.append(self.state.get_cursors()[CURSOR])
+        return created
+
+    async def rewind_cursors(self):
+        cursors = await asyncio.to_thread(self.state.get_cursors)
+        self.last_id = cursors.get(CURSOR, 0)
+
+    async def deliver_item(self, item):
+        self.delivered.append(item.source_id)
+        if not item.payload.get('files_sent'):
+            self.uploads.extend((item.source_id, path) for path in item.payload.get('files', []))
+        return True
+
+    async def deliver_item_files(self, item):
+        self.uploads.extend((item.source_id, path) for path in item.payload['files'])
+        return True
+
+    async def send_digest(self, texts):
+        self.digests.append(list(texts))
+        return self.digest_results.pop(0) if self.digest_results else True
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = StateStore(str(tmp_path / "state.sqlite3"))
+    yield state
+    state.close()
+
+
+async def run_until(pipeline, done, timeout=5.0):
+    await pipeline.start()
+    try:
+        pipeline.wake()
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not done():
+            assert asyncio.get_running_loop().time() < deadline, "конвейер не дошёл до конца"
+            await asyncio.sleep(0.005)
+        await pipeline.join()
+    finally:
+        await pipeline.stop()
+
+
+def test_failed_batch_is_reread_from_stored_cursor(state):
+    bot = FakeBot(state, range(1, 11))
+    bot.fail_enqueue = {3: 1}
+    pipeline = NotificationPipeline(bot, concurrency=1)
+
+    asyncio.run(run_until(pipeline, lambda: len(bot.delivered) >= 10))
+
+    # Страница с 3 прочитана заново, прочитанные после неё страницы отброшены и тоже перечитаны
+    assert bot.reads[:2] == [1, 3]
+    assert bot.reads.count(3) == 2
+    assert bot.delivered == list(range(1, 11))
+    assert bot.cursors == sorted(bot.cursors)
+    assert state.get_cursors() == {CURSOR: 10}
+    assert state.pending_count() == 0
+
+
+def test_rewind_never_moves_stored_cursor_back(state):
+    state.set_cursors({CURSOR: 4})
+    bot = FakeBot(state, range(1, 9))
+    bot.last_id = 4
+    bot.fail_enqueue = {5: 2}
+    pipeline = NotificationPipeline(bot, concurrency=1)
+
+    asyncio.run(run_until(pipeline, lambda: len(bot.delivered) >= 4))
+
+    assert bot.delivered == [5, 6, 7, 8]
+    assert all(cursor >= 4 for cursor in bot.cursors)
+    assert state.get_cursors() == {CURSOR: 8}
+
+
+def test_read_error_rewinds_and_rereads(state):
+    bot = FakeBot(state, range(1, 7))
+    pages = bot.check_for_updates
+    failures = [RuntimeError("disk I/O error")]
+
+    async def flaky_pages():
+        async for batch in pages():
+            if batch.rows[0].id == 3 and failures:
+                raise failures.pop()
+            yield batch
+
+    bot.check_for_updates = flaky_pages
+    pipeline = NotificationPipeline(bot, concurrency=1)
+
+    asyncio.run(run_until(pipeline, lambda: len(bot.delivered) >= 6))
+
+    assert bot.delivered == [1, 2, 3, 4, 5, 6]
+    assert state.get_cursors() == {CURSOR: 6}
+
+
+def test_pending_outbox_rows_are_sent_before_new_ones(state):
+    state.enqueue("call_request", [(1, {"text": "#1"}), (2, {"text": "#2"})], CURSOR, 2)
+    bot = FakeBot(state, range(1, 5))
+    bot.last_id = 2
+    pipeline = NotificationPipeline(bot, concurrency=1)
+
+    asyncio.run(run_until(pipeline, lambda: len(bot.delivered) >= 4))
+
+    assert bot.delivered == [1, 2, 3, 4]
+    assert state.pending_count() == 0
+
+
+def print_orders(count):
+    return [(n, {"text": f"#{n}", "files": [f"orders/{n}.stl"]}) for n in range(1, count + 1)]
+
+
+def test_digest_retry_does_not_upload_files_again(state):
+    # Наплыв: заявки уже в outbox, отправка начинается с упаковки в сводку
+    state.enqueue("print_order", print_orders(5), "last_print_order_id", 5)
+    bot = FakeBot(state, [])
+    bot.digest_results = [False]
+    pipeline = NotificationPipeline(bot, concurrency=1, retry_delay=0.01, digest_threshold=1, digest_window=0.01)
+
+    asyncio.run(run_until(pipeline, lambda: state.pending_count() == 0))
+
+    # Файлы каждой заявки загружены один раз, хотя её текст отправлялся дважды
+    assert sorted(bot.uploads) == [(n, f"orders/{n}.stl") for n in range(1, 6)]
+    assert bot.digests[0] == [f"#{n}" for n in range(1, 6)]
+    sent_again = [text for digest in bot.digests[1:] for text in digest] + [f"#{n}" for n in bot.delivered]
+    assert sorted(sent_again) == [f"#{n}" for n in range(1, 6)]
+
+
+def test_files_sent_mark_survives_restart(state):
+    state.enqueue("print_order", print_orders(3), "last_print_order_id", 3)
+    bot = FakeBot(state, [])
+    bot.digest_results = [False]
+    pipeline = NotificationPipeline(bot, concurrency=1, retry_delay=60, digest_threshold=1, digest_window=0.01)
+
+    asyncio.run(run_until(pipeline, lambda: bot.digests))
+
+    # Сводка не ушла: после перезапуска записи outbox помнят, что файлы уже отправлены
+    assert [item.payload.get("files_sent") for item in state.pending()] == [True, True, True]
+    restarted = FakeBot(state, [])
+    pipeline = NotificationPipeline(restarted, concurrency=1, digest_threshold=1, digest_window=0.01)
+
+    asyncio.run(run_until(pipeline, lambda: state.pending_count() == 0))
+
+    assert restarted.uploads == []
@@ -0,0 +1,74 @@
+"""Router: маршруты по услуге, копии и канал по умолчанию."""
+import pytest
+
+from routing import Router
+
+DEFAULT = "-100100"
+PRODUCTION = "-100200"
+ENGINEERING = "-100300"
+ARCHIVE = "-100900"
+
+RULES = [
+    {"service_type": "3d_printing", "chats": [PRODUCTION]},
+    {"service_type": ["3d_scanning", "reverse_engineering"], "chats": ENGINEERING},
+    {"chats": [ARCHIVE], "copy": True},
+]
+
+
+@pytest.fixture
+def router():
+    return Router(RULES, DEFAULT)
+
+
+def test_service_type_route_replaces_default_chat_and_keeps_copy(router):
+    assert router.targets("print_order", "3d_printing") == [PRODUCTION, ARCHIVE]
+
+
+def test_service_type_list(router):
+    assert router.targets("print_order", "reverse_engineering") == [ENGINEERING, ARCHIVE]
+
+
+def test_unmatched_service_goes_to_default_chat_and_copy(router):
+    assert router.targets("print_order", "modeling") == [DEFAULT, ARCHIVE]
+    assert router.targets("print_order", None) == [DEFAULT, ARCHIVE]
+
+
+def test_call_requests_do_not_match_service_rules(router):
+    assert router.targets("call_request") == [DEFAULT, ARCHIVE]
+
+
+def test_kind_rule():
+    router = Router([{"kind": "call_request", "chats": ["-100400"]}], DEFAULT)
+    assert router.targets("call_request") == ["-100400"]
+    assert router.targets("print_order", "3d_printing") == [DEFAULT]
+
+
+def test_chats_are_deduplicated_in_order():
+    router = Router([
+        {"kind": "print_order", "chats": [PRODUCTION, ARCHIVE]},
+        {"chats": [ARCHIVE, DEFAULT], "copy": True},
+    ], DEFAULT)
+    assert router.targets("print_order") == [PRODUCTION, ARCHIVE, DEFAULT]
+
+
+def test_no_rules_means_default_chat_only():
+    for rules in (None, [], "", "  "):
+        router = Router(rules, DEFAULT)
+        assert not router
+        assert router.targets("print_order", "3d_printing") == [DEFAULT]
+
+
+def test_rules_from_json():
+    router = Router('[{"service_type": "3d_printing", "chats": ["-100200"], "copy": true}]', DEFAULT)
+    assert router.targets("print_order", "3d_printing") == [DEFAULT, PRODUCTION]
+
+
+@pytest.mark.parametrize("rule", [
+    {"service_type": "3d_printing"},
+    {"chats": []},
+    {"chats": [PRODUCTION], "kind": "order"},
+    {"chats": [PRODUCTION], "services": "3d_printing"},
+])
+def test_invalid_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        Router([rule], DEFAULT)
@@ -0,0 +1,220 @@
+"""TelegramSendQueue, TokenBucket и FairShare с поддельным Bot и часами (без сети и без реального ожидания)."""
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+import send_queue
+from send_queue import FairShare, TelegramSendQueue, TokenBucket
+
+_real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    """time.monotonic и asyncio.sleep: sleep сдвигает часы и только уступает очередь задачам."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay, result=None):
+        if delay > 0:
+            self.sleeps.append(delay)
+            self.now += delay
+        await _real_sleep(0)
+        return result
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(send_queue.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(send_queue.asyncio, "sleep", clock.sleep)
+    # Задержка повтора — верхняя граница разброса
+    monkeypatch.setattr(send_queue.random, "uniform", lambda low, high: high)
+    return clock
+
+
+class FakeBot:
+    """send_message: записывает (время, chat_id, text); errors[text] — исключения для первых попыток."""
+
+    def __init__(self, clock, errors=None):
+        self.clock = clock
+        self.errors = {text: list(raised) for text, raised in (errors or {}).items()}
+        self.calls = []
+
+    async def send_message(self, chat_id, text):
+        self.calls.append((self.clock.now, chat_id, text))
+        raised = self.errors.get(text)
+        if raised:
+            raise raised.pop(0)
+        return f"sent {text}"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_token_bucket_refill_and_block(clock):
+    bucket = TokenBucket(rate=2.0, capacity=2.0)
+    assert bucket.delay() == 0
+    bucket.consume()
+    bucket.consume()
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.delay() == 0
+    bucket.block_for(10)
+    assert bucket.delay() == pytest.approx(10)
+    # Альбом дороже ёмкости ведра ждёт только полного ведра
+    clock.now += 10
+    assert bucket.delay(cost=5) == pytest.approx(0)
+
+
+def test_retry_after_is_waited_exactly(clock):
+    bot = FakeBot(clock, errors={"a": [RetryAfter(7), RetryAfter(7)]})
+    # RetryAfter не расходует попытки повтора
+    queue = TelegramSendQueue(bot, max_retries=0)
+
+    async def scenario():
+        result = await queue.send_message(-100, text="a")
+        await queue.close()
+        return result
+
+    assert run(scenario()) == "sent a"
+    times = [at for at, _chat, _text in bot.calls]
+    assert len(times) == 3
+    assert times[1] - times[0] == pytest.approx(7)
+    assert times[2] - times[1] == pytest.approx(7)
+    assert clock.sleeps == [7, 7]
+
+
+def test_network_error_is_retried_with_backoff(clock):
+    reported = []
+    bot = FakeBot(clock, errors={"a": [NetworkError("reset")] * 3})
+    queue = TelegramSendQueue(bot, max_retries=5, backoff_base=1.0, backoff_max=3.0,
+                              on_request=lambda method, seconds, error: reported.append((method, error)))
+
+    async def scenario():
+        result = await queue.send_message(-100, text="a")
+        await queue.close()
+        return result
+
+    assert run(scenario()) == "sent a"
+    assert len(bot.calls) == 4
+    # 1, 2, 4 — но не больше backoff_max
+    assert clock.sleeps == [1.0, 2.0, 3.0]
+    assert [error is None for _method, error in reported] == [False, False, False, True]
+
+
+def test_network_error_gives_up_after_max_retries(clock):
+    bot = FakeBot(clock, errors={"a": [NetworkError("reset")] * 10})
+    queue = TelegramSendQueue(bot, max_retries=2)
+
+    async def scenario():
+        try:
+            with pytest.raises(NetworkError):
+                await queue.send_message(-100, text="a")
+        finally:
+            await queue.close()
+
+    run(scenario())
+    assert len(bot.calls) == 3
+
+
+def test_bad_request_is_not_retried(clock):
+    bot = FakeBot(clock, errors={"a": [BadRequest("Chat not found")]})
+    queue = TelegramSendQueue(bot)
+
+    async def scenario():
+        try:
+            with pytest.raises(BadRequest):
+                await queue.send_message(-100, text="a")
+            # Очередь чата продолжает работать
+            return await queue.send_message(-100, text="b")
+        finally:
+            await queue.close()
+
+    assert run(scenario()) == "sent b"
+    assert [text for _at, _chat, text in bot.calls] == ["a", "b"]
+    assert clock.sleeps == []
+
+
+def test_messages_to_one_chat_keep_order(clock):
+    texts = [str(n) for n in range(40)]
+    # Flood control и сетевая ошибка посреди потока не меняют порядок
+    bot = FakeBot(clock, errors={"3": [RetryAfter(5)], "7": [NetworkError("reset")]})
+    queue = TelegramSendQueue(bot, chat_rate_per_minute=30)
+
+    async def scenario():
+        results = await asyncio.gather(*(queue.send_message(-100, text=text) for text in texts))
+        await queue.close()
+        return results
+
+    assert run(scenario()) == [f"sent {text}" for text in texts]
+    delivered = [text for _at, _chat, text in bot.calls]
+    assert delivered == texts[:4] + texts[3:8] + texts[7:]
+    # Сверх запаса (30 сообщений) — не чаще 30 в минуту
+    times = [at for at, _chat, _text in bot.calls]
+    assert times[-1] - times[0] >= 10 * 2
+
+
+def test_chats_do_not_wait_for_each_other(clock):
+    bot = FakeBot(clock, errors={"a": [RetryAfter(30)]})
+    queue = TelegramSendQueue(bot)
+
+    async def scenario():
+        slow = asyncio.create_task(queue.send_message(-100, text="a"))
+        await _real_sleep(0)
+        fast = await queue.send_message(-200, text="b")
+        await slow
+        await queue.close()
+        return fast
+
+    assert run(scenario()) == "sent b"
+    assert [(chat, text) for _at, chat, text in bot.calls] == [(-100, "a"), (-200, "b"), (-100, "a")]
+
+
+def test_fair_share_round_robin(clock):
+    granted = []
+
+    async def scenario():
+        share = FairShare(TokenBucket(rate=1.0, capacity=1.0))
+
+        async def take(tenant, n):
+            await share.acquire(tenant)
+            granted.append((tenant, n))
+
+        tasks = [asyncio.create_task(take("a", n)) for n in range(4)]
+        tasks += [asyncio.create_task(take("b", n)) for n in range(2)]
+        await asyncio.gather(*tasks)
+        share.close()
+
+    run(scenario())
+    # Первый запрос — из запаса, дальше по одному за ход каждому арендатору
+    assert granted == [("a", 0), ("a", 1), ("b", 0), ("a", 2), ("b", 1), ("a", 3)]
+    assert sum(clock.sleeps) == pytest.approx(5)
+
+
+def test_tenants_share_global_rate(clock):
+    bot = FakeBot(clock)
+    queue = TelegramSendQueue(bot, global_rate=1.0)
+    busy = queue.for_tenant("busy")
+    quiet = queue.for_tenant("quiet")
+
+    async def scenario():
+        # У занятого сайта поток заявок в пять чатов, у тихого — две заявки
+        tasks = [asyncio.create_task(busy.send_message(chat, text=f"busy {n}"))
+                 for n in range(3) for chat in range(-105, -100)]
+        await _real_sleep(0)
+        tasks += [asyncio.create_task(quiet.send_message(-200, text=f"quiet {n}")) for n in range(2)]
+        await asyncio.gather(*tasks)
+        await queue.close()
+
+    run(scenario())
+    senders = [text.split()[0] for _at, _chat, text in bot.calls]
+    # Тихий сайт не ждёт, пока занятый отправит все 15 сообщений
+    assert senders.index("quiet") <= 2
+    assert len(senders) - 1 - senders[::-1].index("quiet") <= 4
@@ -0,0 +1,112 @@
+"""StateStore: outbox «хотя бы один раз» — UNIQUE(kind, source_id), курсор в той же транзакции, курсоры не убывают."""
+import json
+
+import pytest
+
+from state_store import StateStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "state.sqlite3")
+
+
+@pytest.fixture
+def store(path):
+    store = StateStore(path)
+    yield store
+    store.close()
+
+
+def test_same_source_is_enqueued_once(store):
+    created = store.enqueue("call_request", [(1, {"text": "a"}), (2, {"text": "b"})], "last_call_request_id", 2)
+    assert [item.source_id for item in created] == [1, 2]
+    # Строки, перечитанные после отката курсора, в outbox не дублируются
+    again = store.enqueue("call_request", [(2, {"text": "b"}), (3, {"text": "c"})], "last_call_request_id", 3)
+    assert [item.source_id for item in again] == [3]
+    # Тот же id другой таблицы — другая заявка
+    other = store.enqueue("print_order", [(1, {"text": "p"})], "last_print_order_id", 1)
+    assert [item.source_id for item in other] == [1]
+    assert store.pending_count() == 4
+    assert store.get_cursors() == {"last_call_request_id": 3, "last_print_order_id": 1}
+
+
+def test_undelivered_rows_survive_restart(path):
+    store = StateStore(path)
+    store.enqueue("call_request", [(1, {"text": "a"}), (2, {"text": "b"})], "last_call_request_id", 2)
+    first, _second = store.pending()
+    store.mark_delivered([first.id])
+    # Сбой до подтверждения второй заявки: соединение закрыто без штатной остановки
+    store._conn.close()
+
+    reopened = StateStore(path)
+    try:
+        pending = reopened.pending()
+        assert [(item.kind, item.source_id, item.payload) for item in pending] == [
+            ("call_request", 2, {"text": "b"}),
+        ]
+        assert reopened.get_cursors() == {"last_call_request_id": 2}
+    finally:
+        reopened.close()
+
+
+def test_failed_enqueue_leaves_neither_rows_nor_cursor(store):
+    def fail(conn, created):
+        raise RuntimeError("stats")
+
+    with pytest.raises(RuntimeError):
+        store.enqueue("call_request", [(1, {"text": "a"})], "last_call_request_id", 1, also=fail)
+    assert store.pending() == []
+    assert store.get_cursors() == {}
+
+
+def test_also_sees_only_created_rows(store):
+    store.enqueue("call_request", [(1, {"text": "a"})], "last_call_request_id", 1)
+    seen = []
+    store.enqueue("call_request", [(1, {"text": "a"}), (2, {"text": "b"})], "last_call_request_id", 2,
+                  also=lambda conn, created: seen.extend(item.source_id for item in created))
+    assert seen == [2]
+
+
+def test_cursors_never_move_back(store):
+    store.set_cursors({"last_call_request_id": 10, "last_print_order_id": 5})
+    store.set_cursors({"last_call_request_id": 7})
+    store.enqueue("print_order", [], "last_print_order_id", 3)
+    assert store.get_cursors() == {"last_call_request_id": 10, "last_print_order_id": 5}
+    store.set_cursors({"last_call_request_id": 11})
+    assert store.get_cursors()["last_call_request_id"] == 11
+
+
+def test_failed_rows_stay_pending(store):
+    store.enqueue("call_request", [(1, {"text": "a"})], "last_call_request_id", 1)
+    (item,) = store.pending()
+    store.mark_failed([(item.id, "timeout")])
+    (item,) = store.pending()
+    assert item.attempts == 1
+    store.update_payload(item.id, {"text": "a", "files_sent": True})
+    assert store.pending()[0].payload == {"text": "a", "files_sent": True}
+
+
+def test_pending_pages_in_order(store):
+    store.enqueue("call_request", [(n, {"text": str(n)}) for n in range(1, 6)], "last_call_request_id", 5)
+    first = store.pending(limit=2)
+    rest = store.pending(limit=10, after_id=first[-1].id)
+    assert [item.source_id for item in first + rest] == [1, 2, 3, 4, 5]
+
+
+def test_purge_delivered_keeps_pending(store):
+    store.enqueue("call_request", [(1, {"text": "a"}), (2, {"text": "b"})], "last_call_request_id", 2)
+    first, _second = store.pending()
+    store.mark_delivered([first.id])
+    store.purge_delivered(older_than=-1)
+    assert [item.source_id for item in store.pending()] == [2]
+    assert store.query("SELECT COUNT(*) FROM outbox")[0][0] == 1
+
+
+def test_migrate_json_state(store, tmp_path):
+    json_path = tmp_path / "bot_state.json"
+    json_path.write_text(json.dumps({"last_call_request_id": 12, "last_print_order_id": None}))
+    assert store.migrate_json_state(str(json_path))
+    assert store.get_cursors() == {"last_call_request_id": 12, "last_print_order_id": 0}
+    assert not json_path.exists()
+    assert (tmp_path / "bot_state.json.migrated").exists()
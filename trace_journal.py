@@ -0,0 +1,141 @@
+"""Журнал этапов доставки каждой заявки (трассировка) и отчёт по перцентилям.
+
+Этапы (stage) одной заявки:
+
+- ``detect`` — от created_at в БД Django до чтения строки ботом (интервал
+  проверки, ожидание отслеживания БД);
+- ``format`` — от чтения до записи в outbox (форматирование, очередь стадии);
+- ``queue`` — от записи в outbox (или возврата на повтор) до начала отправки;
+- ``upload`` — загрузка одного альбома файлов (``bytes`` — загружено байт);
+- ``send`` — от начала отправки до ответа Telegram (включая загрузки и сводку);
+- ``ack`` — от ответа Telegram до отметки о доставке в outbox.
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trace (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS trace_started_at ON trace (started_at);
+"""
+
+STAGES = ("detect", "format", "queue", "upload", "send", "ack")
+
+# Заявка, которую отправляет текущая задача asyncio: (kind, source_id)
+current_lead: contextvars.ContextVar[tuple[str, int] | None] = contextvars.ContextVar("current_lead", default=None)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга (values отсортированы)."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+class TraceJournal:
+    """Этапы копятся в памяти и записываются в базу состояния пачкой (``flush``).
+
+    Ротация — при записи не чаще раза в ``rotate_interval`` секунд: удаляются
+    этапы старше ``retention`` секунд и самые старые сверх ``max_rows``.
+    """
+
+    def __init__(self, store, retention: float = 7 * 24 * 3600, max_rows: int = 200_000,
+                 rotate_interval: float = 3600):
+        self.store = store
+        self.retention = retention
+        self.max_rows = max_rows
+        self.rotate_interval = rotate_interval
+        self._spans: list[tuple] = []
+        self._lock = threading.Lock()
+        self._rotated_at = 0.0
+        # Момент, с которого заявка ждёт отправки: (kind, source_id) -> time.time()
+        self._queued: dict[tuple[str, int], float] = {}
+        store.ensure_schema(SCHEMA)
+
+    def record(self, kind: str, source_id: int, stage: str, started_at: float, ended_at: float,
+               size: int | None = None):
+        if started_at is None:
+            return
+        with self._lock:
+            self._spans.append((kind, source_id, stage, started_at, max(0.0, ended_at - started_at), size))
+
+    def record_current(self, stage: str, started_at: float, ended_at: float, size: int | None = None):
+        """Этап заявки, которую отправляет текущая задача (см. current_lead)."""
+        lead = current_lead.get()
+        if lead is not None:
+            self.record(*lead, stage, started_at, ended_at, size)
+
+    def queued(self, kind: str, source_id: int, at: float | None = None):
+        self._queued[(kind, source_id)] = time.time() if at is None else at
+
+    def dequeued(self, kind: str, source_id: int, at: float | None = None):
+        """Заявка взята на отправку: записать этап queue (если известно, когда она встала в очередь)."""
+        at = time.time() if at is None else at
+        queued_at = self._queued.pop((kind, source_id), None)
+        if queued_at is not None:
+            self.record(kind, source_id, "queue", queued_at, at)
+
+    def flush(self):
+        """Записать накопленные этапы (вызывается в потоке)."""
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans:
+            return
+        now = time.time()
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO trace (kind, source_id, stage, started_at, duration, bytes) VALUES (?, ?, ?, ?, ?, ?)",
+                spans,
+            )
+            if now - self._rotated_at >= self.rotate_interval:
+                self._rotated_at = now
+                self._rotate(conn, now)
+
+    def _rotate(self, conn, now: float):
+        removed = conn.execute("DELETE FROM trace WHERE started_at < ?", (now - self.retention,)).rowcount
+        # id растут монотонно, поэтому лишние самые старые строки — ниже порога
+        removed += conn.execute(
+            "DELETE FROM trace WHERE id <= (SELECT MAX(id) FROM trace) - ?", (self.max_rows,)
+        ).rowcount
+        if removed:
+            logger.info(f"Журнал трассировки: удалено старых записей: {removed}")
+
+    def report(self, since: float, kind: str | None = None) -> list[tuple]:
+        """[(stage, count, p50, p95, p99, max), ...] по этапам с момента since."""
+        sql = "SELECT stage, duration FROM trace WHERE started_at >= ?"
+        params = [since]
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        durations: dict[str, list[float]] = {}
+        for stage, duration in self.store.query(sql, params):
+            durations.setdefault(stage, []).append(duration)
+        rows = []
+        for stage in sorted(durations, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            values = sorted(durations[stage])
+            rows.append((stage, len(values), percentile(values, 50), percentile(values, 95),
+                         percentile(values, 99), values[-1]))
+        return rows
+
+
+def format_report(rows) -> str:
+    if not rows:
+        return "Нет данных трассировки за этот период"
+    lines = [f"{'этап':<8} {'записей':>8} {'p50, с':>9} {'p95, с':>9} {'p99, с':>9} {'max, с':>9}"]
+    for stage, count, p50, p95, p99, maximum in rows:
+        lines.append(f"{stage:<8} {count:>8} {p50:>9.3f} {p95:>9.3f} {p99:>9.3f} {maximum:>9.3f}")
+    return "\n".join(lines)